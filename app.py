@@ -2,6 +2,7 @@ from presentation.middlewares import initialize_middlewares
 from presentation.routes.content import initialize_routes
 from infrastructure.database import initialize_database
 from infrastructure.bus import start_consuming
+from application.services import recommendation_service
 from flask import Flask
 
 app = Flask(__name__)
@@ -13,6 +14,7 @@ initialize_database()
 import presentation.handlers
 
 start_consuming()
+recommendation_service.start_flusher()
 
 if __name__ == "__main__":
     app.run(debug=True)
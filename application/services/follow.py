@@ -1,16 +1,35 @@
-from infrastructure.database.repositories import follower_repository
+from infrastructure.database.repositories import follower_repository, follow_counts_repository
+from infrastructure.graph import loaded_follow_graph
 from infrastructure.bus import bus_client
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 class FollowService:
     def __init__(self):
         self.repo = follower_repository
+        self.counts_repo = follow_counts_repository
         self.bus = bus_client
 
-    def following(self, user_id, page=1, size=10):
-        following = self.repo.find_by({
-            'follower_id': user_id,
-        }, page, size)
-
+    def _notify(self, payload, follower_id):
+        messages = [
+            ('war_queue', 'FOLLOW_COUNT', payload),
+            ('fury_queue', 'UPDATE_FEED', { **payload, 'following_id': follower_id }),
+        ]
+        if os.getenv('RECOMMENDATION_ENGINE') == 'incremental':
+            messages.append((self.bus.event_queue(os.getenv('BUS_QUEUE'), 'UPDATE_RECOMMENDATIONS'), 'UPDATE_RECOMMENDATIONS', {
+                'follower_id': payload['user_id'],
+                'following_id': follower_id,
+                'operation': 'follow' if payload['operation'] == 'increment' else 'unfollow',
+            }))
+
+        try:
+            self.bus.emit_many(messages)
+        except Exception as e:
+            logger.error(f"Failed to emit follow notifications: {str(e)}")
+
+    def _following_profiles(self, following):
         if not following:
             return []
 
@@ -25,19 +44,54 @@ class FollowService:
             user['isFollowing'] = True
 
         return data
+
+    # List reads tolerate a few seconds of staleness and are served as follower reads;
+    # the checks inside follow/unfollow stay on fresh reads
+
+    def following(self, user_id, page=1, size=10):
+        following = self.repo.find_by({
+            'follower_id': user_id,
+        }, page, size, stale=True)
+
+        return self._following_profiles(following)
+
+    def following_page(self, user_id, size=10, cursor=None):
+        following, next_cursor = self.repo.find_page({
+            'follower_id': user_id,
+        }, size, cursor, stale=True)
+
+        return self._following_profiles(following), next_cursor
     
-    def followers(self, user_id):
+    def followers(self, user_id, page=1, size=10):
+        # Bounded by design: complete sets go through followers_stream or followers_page
         return self.repo.find_by({
             'following_id': user_id
-        })
+        }, page, size, stale=True)
+
+    def followers_stream(self, user_id, chunk_size=1000):
+        return self.repo.iter_chunks({
+            'following_id': user_id
+        }, chunk_size, stale=True)
+
+    def following_stream(self, user_id, chunk_size=1000):
+        for chunk in self.repo.iter_chunks({ 'follower_id': user_id }, chunk_size, stale=True):
+            yield self._following_profiles(chunk)
+
+    def followers_page(self, user_id, size=10, cursor=None):
+        return self.repo.find_page({
+            'following_id': user_id
+        }, size, cursor, stale=True)
     
+    def counts(self, user_ids):
+        return self.counts_repo.counts(user_ids, stale=True)
+
     def search(self, display_name, user_id):
         profiles = self.bus.publish_event('war_queue', 'SEARCH_PROFILE', {
             'display_name': display_name
-        })
+        }, coalesce=True)
+        followed = self.repo.following_among(user_id, [profile['userId'] for profile in profiles])
         for profile in profiles:
-            data = self.repo.find_by({ 'following_id': profile['userId'], 'follower_id': user_id })
-            profile['isFollowing'] = bool(data)
+            profile['isFollowing'] = str(profile['userId']) in followed
 
         return profiles
 
@@ -55,43 +109,26 @@ class FollowService:
         if 'message' in follower_info:
             return follower_info['message']
 
-        already_following = self.repo.find_by({
-            'following_id': follower_id,
-            'follower_id': user_id
-        })
-
-        if already_following:
+        # Insert-if-absent and the counters in one transaction: no check-then-insert race
+        if not self.repo.follow(user_id, follower_id):
             return "Already following"
 
-        self.repo.insert({
-            'follower_id': user_id,
-            'following_id': follower_id,
-        })
+        graph = loaded_follow_graph()
+        if graph is not None:
+            graph.add_edge(user_id, follower_id)
 
-        payload = { 'operation': 'increment', 'user_id': user_id }
-
-        self.bus.publish_event('war_queue', 'FOLLOW_COUNT', payload)
-        self.bus.publish_event('fury_queue', 'UPDATE_FEED', { **payload, 'following_id': follower_id })
+        self._notify({ 'operation': 'increment', 'user_id': user_id }, follower_id)
 
         return "Now following"
 
     def unfollow(self, user_id, follower_id):
-        existing = self.repo.find_by({
-            'following_id': follower_id,
-            'follower_id': user_id
-        })
-
-        if not existing:
+        if not self.repo.unfollow(user_id, follower_id):
             return "Not following"
 
-        self.repo.delete_by({
-            'following_id': follower_id,
-            'follower_id': user_id,
-        })
-
-        payload = { 'operation': 'decrement', 'user_id': user_id }
+        graph = loaded_follow_graph()
+        if graph is not None:
+            graph.remove_edge(user_id, follower_id)
 
-        self.bus.publish_event('war_queue', 'FOLLOW_COUNT', payload)
-        self.bus.publish_event('fury_queue', 'UPDATE_FEED', { **payload, 'following_id': follower_id })
+        self._notify({ 'operation': 'decrement', 'user_id': user_id }, follower_id)
 
         return "Unfollowed"
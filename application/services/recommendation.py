@@ -1,15 +1,29 @@
 from infrastructure.database.repositories import follower_repository
 from infrastructure.cache import cache_client
+from infrastructure.graph import recommend_shard, get_graph_executor, discard_graph_executor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from infrastructure.bus import bus_client
+from .recommendation_scheduler import RecommendationScheduler
 from datetime import datetime
+import threading
+import logging
+import time
 import uuid
 import os
 
+logger = logging.getLogger(__name__)
+
 class RecommendationService:
     def __init__(self):
         self.follower_repo = follower_repository
         self.cache = cache_client
         self.bus = bus_client
+        self.scheduler = RecommendationScheduler(self.cache)
+        self._flusher = None
+        self._threads = None
+        self._warned_snapshot = False
 
     def _create_user_key(self, user_id):
         return f"users:recommendations:counting:{user_id}"
@@ -17,70 +31,309 @@ class RecommendationService:
     def _create_group_key(self):
         return f"users:recommendations:groups:{uuid.uuid4().hex}_{int(datetime.now().timestamp())}"
 
-    def _increment_user_follow_count(self, key):
-        return self.cache.incr(key)
-    
-    def _reset_user_follow_count(self, key):
-        self.cache.delete(key)
-    
-    def _add_user_to_group(self, group_id, user_id):
-        ts = int(datetime.now().timestamp())
-        self.cache.zadd(group_id, { user_id: ts })
-
-    def _check_user_requirements(self, value):
-        value == os.getenv('FOLLOWERS_PER_USER')
-
-    def _get_last_group(self):
-        pattern = "users:recommendations:groups:*"
-
-        keys = self.cache.keys(pattern)
-        
-        if not keys:
-            return None
-        
-        decoded_keys = [key.decode('utf-8') if isinstance(key, bytes) else key for key in keys]
-
-        last_key = max(
-            decoded_keys,
-            key=lambda x: int(x.split('_')[-1])
-        )
+    def _create_result_key(self, user_id):
+        # Sorted set of candidate -> mutual count; the pre-ranking JSON lists lived under :results:
+        return f"users:recommendations:ranked:{user_id}"
 
-        return last_key
+    def _create_score_key(self, user_id):
+        return f"users:recommendations:scores:{user_id}"
 
-    def _check_group_requirements(self, value):
-        self.cache.zcard(f"users:recommendations:groups:{value}")
-        value == os.getenv('USERS_PER_GROUP')
+    def _create_seeded_key(self, user_id):
+        return f"users:recommendations:seeded:{user_id}"
 
-    def get_recommendations(self, user_id):
-        return self.cache.get(f"users:recommendations:results:{user_id}") or self._hottest(user_id)
-    
-    def _hottest(self, user_id):
-        ids = self.bus.publish_event('war_queue', 'MOST_FOLLOWED', {})
+    def _incremental(self):
+        return os.getenv('RECOMMENDATION_ENGINE') == 'incremental'
+
+    def _limit(self):
+        return int(os.getenv('RECOMMENDATIONS_PER_USER') or 50)
+
+    def get_recommendations(self, user_id, page=1, size=10):
+        # One page per call: ZREVRANGE for the ids, one SEARCH_PROFILE and one following_among for
+        # the profiles, whatever the length of the stored ranking
+        if self._incremental():
+            key = self._create_score_key(user_id)
+            if not self.cache.exists(self._create_seeded_key(user_id)):
+                self._seed_scores(user_id)
+        else:
+            key = self._create_result_key(user_id)
+        start = (page - 1) * size
+        ids = self.cache.zrevrange(key, start, start + size - 1)
 
         if not ids:
-            return []
+            return self._hottest(user_id, size) if page == 1 else []
+
+        return self._hydrate(user_id, ids)
 
+    def _hydrate(self, user_id, ids):
+        ids = [str(id) for id in ids]
         profiles = self.bus.publish_event('war_queue', 'SEARCH_PROFILE', {
-            'user_ids': [str(id) for id in ids]
-        })
+            'user_ids': ids
+        }, coalesce=True)
+
+        if not profiles:
+            return []
 
+        # Keep the ranking order whatever order the profile service answers in
+        position = { id: index for index, id in enumerate(ids) }
+        profiles = sorted(
+            (profile for profile in profiles if str(profile['userId']) in position),
+            key=lambda profile: position[str(profile['userId'])]
+        )
+
+        followed = self.follower_repo.following_among(user_id, [profile['userId'] for profile in profiles], stale=True)
         for profile in profiles:
-            data = self.follower_repo.find_by({ 'following_id': profile['userId'], 'follower_id': user_id })
-            profile['isFollowing'] = bool(data)
+            profile['isFollowing'] = str(profile['userId']) in followed
 
         return profiles
 
+    def _run_shards(self, users, cpu_bound, task):
+        # RECOMMENDATION_WORKERS > 1 splits the group across a pool. CPU-bound graph shards go to
+        # worker processes by default (RECOMMENDATION_EXECUTOR=thread keeps them in-process); SQL
+        # shards are I/O-bound and run on threads, each holding its own pooled connection.
+        # Results come back here so the caller still writes them in one Redis pipeline.
+        # A dead worker breaks the whole process pool: it is dropped and rebuilt on the next
+        # batch, and this one is computed in-process. A timed-out batch drops its pool too, so
+        # the shards still running cannot starve the next batch of workers.
+        workers = min(self._optional_int('RECOMMENDATION_WORKERS') or 1, len(users))
+        if workers <= 1:
+            return [task(users)()]
+
+        size = -(-len(users) // workers)
+        shards = [users[start:start + size] for start in range(0, len(users), size)]
+
+        if not cpu_bound or not self._use_processes():
+            threads = self._thread_executor(workers)
+            try:
+                return self._collect(threads, shards, task)
+            except FutureTimeoutError:
+                threads.shutdown(wait=False, cancel_futures=True)
+                self._threads = None
+                raise
+
+        executor = get_graph_executor(workers)
+        try:
+            return self._collect(executor, shards, task)
+        except BrokenProcessPool as e:
+            logger.error(f"Recommendation worker pool broke, running batch in-process: {str(e)}")
+            discard_graph_executor(executor)
+            return [task(shard)() for shard in shards]
+        except FutureTimeoutError:
+            # The stuck shards keep their workers busy: later batches get a fresh pool
+            discard_graph_executor(executor)
+            raise
+
+    def _collect(self, executor, shards, task):
+        # Bounded like the batch itself: past RECOMMENDATION_BATCH_TIMEOUT the scheduler hands the
+        # group out again, so waiting longer only holds this consumer
+        deadline = time.monotonic() + int(os.getenv('RECOMMENDATION_BATCH_TIMEOUT') or 300)
+        futures = [executor.submit(task(shard)) for shard in shards]
+        try:
+            return [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _use_processes(self):
+        if os.getenv('RECOMMENDATION_EXECUTOR') == 'thread':
+            return False
+        if not os.getenv('GRAPH_SNAPSHOT_PATH'):
+            # Without a snapshot every worker would scan the edge table on start and keep a private copy
+            if not self._warned_snapshot:
+                logger.warning("GRAPH_SNAPSHOT_PATH is not set: recommendation shards run on threads")
+                self._warned_snapshot = True
+            return False
+        return True
+
+    def _thread_executor(self, workers):
+        if self._threads is None or self._threads._max_workers != workers:
+            self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="RecommendationWorker")
+        return self._threads
+
+    def _friends_of_friends(self, users, limit, max_friends, max_fanout):
+        stats = {}
+        result = self.follower_repo.friends_of_friends(
+            users, limit, stale=True, max_friends=max_friends, max_fanout=max_fanout, stats=stats
+        )
+        return result, stats
+
+    def _optional_int(self, name):
+        value = os.getenv(name)
+        return int(value) if value else None
+
+    def _log_work(self, group_key, work):
+        if not work:
+            return
+
+        walked = sum(counters['edges_walked'] for counters in work.values())
+        total = sum(counters['edges'] for counters in work.values())
+        heaviest = max(work, key=lambda user_id: work[user_id]['edges_walked'])
+        logger.info(
+            f"Recommendation batch {group_key}: {len(work)} users, walked {walked} of {total} second-degree edges, "
+            f"{sum(counters['candidates'] for counters in work.values())} candidates, "
+            f"heaviest user {heaviest} ({work[heaviest]['edges_walked']} edges)"
+        )
+
+    def _dispatch(self, group_keys):
+        # One-way: the follow request and the finishing batch must not wait on the next batch
+        if group_keys:
+            queue_name = self.bus.event_queue(os.getenv('BUS_QUEUE'), 'PROCESS_RECOMMENDATIONS')
+            self.bus.emit_many([(queue_name, 'PROCESS_RECOMMENDATIONS', group_key) for group_key in group_keys])
+
+    def process_group(self, group_key):
+        try:
+            return self._process_group(group_key)
+        finally:
+            # Frees the in-flight slot (and the queued users) even when the batch failed
+            self._dispatch(self.scheduler.complete(group_key))
+
+    def _process_group(self, group_key):
+        # Whole group in one friend-of-friend query and one Redis round trip for the results
+        users = self.cache.zrange(group_key, 0, -1)
+        if not users:
+            return {}
+
+        limit = self._limit()
+        # Cost model: caps on how many followees of the user / of each followee are walked
+        max_friends = self._optional_int('RECOMMENDATION_MAX_FRIENDS')
+        max_fanout = self._optional_int('RECOMMENDATION_MAX_FANOUT')
+
+        if os.getenv('RECOMMENDATION_ENGINE') == 'graph':
+            # In-memory CSR graph: no per-batch SQL beyond syncing the newest edges
+            options = {
+                'max_friends': max_friends,
+                'max_fanout': max_fanout,
+                'sketch_width': self._optional_int('RECOMMENDATION_SKETCH_WIDTH'),
+                'sketch_depth': self._optional_int('RECOMMENDATION_SKETCH_DEPTH') or 4,
+            }
+            recommendations, work = {}, {}
+            for result, stats in self._run_shards(users, True, lambda shard: partial(recommend_shard, shard, limit, options)):
+                recommendations.update(result)
+                work.update(stats)
+            self._log_work(group_key, work)
+        else:
+            recommendations, work = {}, {}
+            for result, stats in self._run_shards(users, False, lambda shard: partial(
+                self._friends_of_friends, shard, limit, max_friends, max_fanout
+            )):
+                recommendations.update(result)
+                work.update(stats)
+            self._log_work(group_key, work)
+
+        ttl = int(os.getenv('RECOMMENDATION_RESULT_TTL') or 86400)
+        pipeline = self.cache.pipeline(transaction=False)
+        for user_id, candidates in recommendations.items():
+            key = self._create_result_key(user_id)
+            pipeline.delete(key)
+            if candidates:
+                pipeline.zadd(key, { candidate_id: mutual for candidate_id, mutual in candidates })
+                pipeline.expire(key, ttl)
+        pipeline.execute()
+
+        return recommendations
+    
+    def _seed_scores(self, user_id):
+        # A user's incremental set starts as a full friend-of-friend computation, so edges older than
+        # the incremental engine count and their unfollows have something to decrement. The marker
+        # expires after RECOMMENDATION_RESULT_TTL: a delta that raced the seed (skipped, or counted
+        # twice) is recomputed away on the next read after that.
+        max_candidates = int(os.getenv('RECOMMENDATION_MAX_CANDIDATES') or 1000)
+        ttl = int(os.getenv('RECOMMENDATION_RESULT_TTL') or 86400)
+        candidates = self.follower_repo.friends_of_friends([user_id], max_candidates, stale=False)[str(user_id)]
+
+        key = self._create_score_key(user_id)
+        pipeline = self.cache.pipeline(transaction=True)
+        pipeline.delete(key)
+        if candidates:
+            pipeline.zadd(key, { candidate_id: mutual for candidate_id, mutual in candidates })
+        pipeline.set(self._create_seeded_key(user_id), 1, ex=ttl)
+        pipeline.execute()
+
+    def _seeded(self, user_ids, chunk):
+        seeded = set()
+        for start in range(0, len(user_ids), chunk):
+            batch = user_ids[start:start + chunk]
+            markers = self.cache.mget([self._create_seeded_key(user_id) for user_id in batch])
+            seeded.update(user_id for user_id, marker in zip(batch, markers) if marker is not None)
+        return seeded
+
+    def apply_edge(self, follower_id, following_id, operation):
+        # Incremental friend-of-friend scores: one sorted set per user, adjusted by the O(degree) pairs
+        # the edge contributes to instead of recomputing whole groups. Only seeded sets take deltas;
+        # the others are computed in full on their first read (_seed_scores).
+        delta = 1 if operation == 'follow' else -1
+        candidates, owners = self.follower_repo.edge_neighbourhood(follower_id, following_id)
+        chunk = int(os.getenv('RECOMMENDATION_PIPELINE_SIZE') or 1000)
+        max_candidates = int(os.getenv('RECOMMENDATION_MAX_CANDIDATES') or 1000)
+
+        seeded = self._seeded([str(follower_id)] + owners, chunk)
+        follower_seeded = str(follower_id) in seeded
+        follower_key = self._create_score_key(follower_id)
+        owner_keys = [self._create_score_key(owner_id) for owner_id in owners if owner_id in seeded]
+
+        commands = [(follower_key, candidate_id) for candidate_id in candidates] if follower_seeded else []
+        commands += [(key, str(following_id)) for key in owner_keys]
+        touched = ([follower_key] if follower_seeded else []) + owner_keys
+
+        for start in range(0, max(len(commands), len(touched)), chunk):
+            pipeline = self.cache.pipeline(transaction=False)
+            for key, member in commands[start:start + chunk]:
+                pipeline.zincrby(key, delta, member)
+            for key in touched[start:start + chunk]:
+                # Drop pairs a decrement took to zero (or below, when the member had been trimmed)
+                # and keep each set bounded
+                pipeline.zremrangebyscore(key, '-inf', 0)
+                pipeline.zremrangebyrank(key, 0, -(max_candidates + 1))
+            pipeline.execute()
+
+        if not follower_seeded:
+            return
+
+        if operation == 'follow':
+            self.cache.zrem(follower_key, str(following_id))
+            return
+
+        # The unfollowed account is a candidate again, scored by the follower's remaining followees
+        mutual = self.follower_repo.mutual_count(follower_id, following_id)
+        if mutual:
+            self.cache.zadd(follower_key, { str(following_id): mutual })
+
+    def _hottest(self, user_id, size=10):
+        ids = self.bus.publish_event('war_queue', 'MOST_FOLLOWED', {}, coalesce=True)
+
+        if not ids:
+            return []
+
+        return self._hydrate(user_id, ids[:size])
+
     def run(self, user_id):
-        user_key = self._create_user_key(user_id)
-        total = self._increment_user_follow_count(user_key)
-        
-        if self._check_user_requirements(total):
-            group_key = self._get_last_group()
-            self._reset_user_follow_count(user_key)
-            
-            if self._check_group_requirements(group_key):
-                new_group_key = self._create_group_key(user_id)
-                self.bus.publish_event(os.getenv('BUS_QUEUE'), 'PROCESS_RECOMMENDATIONS', new_group_key)
-                return self._add_user_to_group(new_group_key, user_id)
-            
-            self._add_user_to_group(group_key, user_id)
+        if self._incremental():
+            # Scores are maintained per follow event (apply_edge); there are no groups to batch
+            return
+
+        # One round trip: counter, dedupe, debounce, group assignment and dispatch happen atomically
+        self._dispatch(self.scheduler.enqueue(self._create_user_key(user_id), user_id, self._create_group_key()))
+
+    def flush_due(self):
+        # Groups that reached their max age without filling up, plus any ready group waiting on a slot
+        self._dispatch(self.scheduler.flush_due())
+
+    def start_flusher(self, interval=None):
+        interval = interval or int(os.getenv('RECOMMENDATION_FLUSH_INTERVAL') or 5)
+        if self._flusher is not None or self._incremental():
+            return
+
+        self._flusher = threading.Thread(
+            target=self._flush_loop,
+            args=(interval,),
+            daemon=True,
+            name="RecommendationFlusher"
+        )
+        self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush_due()
+            except Exception as e:
+                logger.error(f"Recommendation flush failed: {str(e)}")
@@ -0,0 +1,178 @@
+from datetime import datetime
+import os
+
+GROUP_REGISTRY_KEY = "users:recommendations:groups:registry"
+OPEN_GROUP_KEY = "users:recommendations:groups:open"
+READY_GROUPS_KEY = "users:recommendations:groups:ready"
+IN_FLIGHT_KEY = "users:recommendations:groups:inflight"
+QUEUED_USERS_KEY = "users:recommendations:queued"
+
+GROUP_ATTEMPTS_KEY = "users:recommendations:groups:attempts"
+
+# Moves ready groups into the in-flight set while there is room. Slots held longer than the batch
+# timeout belong to a worker that died or stalled: they are reclaimed first, so the scheduler cannot
+# wedge, and the group goes back to the ready list until it has timed out max_attempts times. Then it
+# is released like a completed group, so its users can be queued again.
+_DISPATCH = """
+local function release(group, queued, registry, attempts)
+    local users = redis.call('ZRANGE', group, 0, -1)
+    for start = 1, #users, 1000 do
+        redis.call('ZREM', queued, unpack(users, start, math.min(start + 999, #users)))
+    end
+    redis.call('DEL', group)
+    redis.call('ZREM', registry, group)
+    redis.call('HDEL', attempts, group)
+end
+
+local function dispatch(inflight, ready, queued, registry, attempts, now, cap, timeout, max_attempts)
+    if timeout > 0 then
+        for _, group in ipairs(redis.call('ZRANGEBYSCORE', inflight, '-inf', now - timeout)) do
+            redis.call('ZREM', inflight, group)
+            if redis.call('HINCRBY', attempts, group, 1) < max_attempts then
+                redis.call('RPUSH', ready, group)
+            else
+                release(group, queued, registry, attempts)
+            end
+        end
+    end
+    local dispatched = {}
+    while cap <= 0 or redis.call('ZCARD', inflight) < cap do
+        local group = redis.call('LPOP', ready)
+        if not group then
+            break
+        end
+        redis.call('ZADD', inflight, now, group)
+        table.insert(dispatched, group)
+    end
+    return dispatched
+end
+
+local function due(registry, group, now, max_age)
+    local created = tonumber(redis.call('ZSCORE', registry, group) or now)
+    return max_age > 0 and now - created >= max_age
+end
+"""
+
+# KEYS: user counter, debounce marker, queued users, open group pointer, registry, ready list,
+#       in-flight set, key for a new group, attempts
+# ARGV: follows per user, users per group, user id, now, debounce seconds, max age, max in flight,
+#       batch timeout, max attempts
+ENQUEUE_SCRIPT = _DISPATCH + """
+local now = tonumber(ARGV[4])
+local max_age, cap, timeout = tonumber(ARGV[6]), tonumber(ARGV[7]), tonumber(ARGV[8])
+
+if redis.call('INCR', KEYS[1]) < tonumber(ARGV[1]) then
+    return {}
+end
+redis.call('DEL', KEYS[1])
+
+local queued_at = redis.call('ZSCORE', KEYS[3], ARGV[3])
+if queued_at and now - tonumber(queued_at) < max_age + timeout then
+    return {}
+end
+
+local debounce = tonumber(ARGV[5])
+if debounce > 0 and not redis.call('SET', KEYS[2], now, 'NX', 'EX', debounce) then
+    return {}
+end
+
+local group = redis.call('GET', KEYS[4])
+if not group then
+    group = KEYS[8]
+    redis.call('SET', KEYS[4], group)
+    redis.call('ZADD', KEYS[5], now, group)
+end
+
+redis.call('ZADD', group, now, ARGV[3])
+redis.call('ZADD', KEYS[3], now, ARGV[3])
+if redis.call('ZCARD', group) >= tonumber(ARGV[2]) or due(KEYS[5], group, now, max_age) then
+    redis.call('DEL', KEYS[4])
+    redis.call('RPUSH', KEYS[6], group)
+end
+
+return dispatch(KEYS[7], KEYS[6], KEYS[3], KEYS[5], KEYS[9], now, cap, timeout, tonumber(ARGV[9]))
+"""
+
+# KEYS: open group pointer, registry, ready list, in-flight set, queued users, attempts
+# ARGV: now, max age, max in flight, batch timeout, max attempts
+FLUSH_SCRIPT = _DISPATCH + """
+local now = tonumber(ARGV[1])
+local max_age, cap, timeout = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+
+local group = redis.call('GET', KEYS[1])
+if group and due(KEYS[2], group, now, max_age) then
+    redis.call('DEL', KEYS[1])
+    redis.call('RPUSH', KEYS[3], group)
+end
+
+if max_age + timeout > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[5], '-inf', now - max_age - timeout)
+end
+
+return dispatch(KEYS[4], KEYS[3], KEYS[5], KEYS[2], KEYS[6], now, cap, timeout, tonumber(ARGV[5]))
+"""
+
+# KEYS: group, in-flight set, ready list, queued users, registry, attempts
+# ARGV: now, max in flight, batch timeout, max attempts
+COMPLETE_SCRIPT = _DISPATCH + """
+local now = tonumber(ARGV[1])
+
+redis.call('ZREM', KEYS[2], KEYS[1])
+release(KEYS[1], KEYS[4], KEYS[5], KEYS[6])
+
+return dispatch(KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6], now, tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]))
+"""
+
+class RecommendationScheduler:
+    # Size/age batching for recommendation groups, kept entirely in Redis so every worker shares one
+    # view: a group is closed when it reaches USERS_PER_GROUP or RECOMMENDATION_BATCH_MAX_AGE seconds,
+    # whichever comes first, and at most RECOMMENDATION_MAX_IN_FLIGHT groups are processed at once.
+    # Every method returns the groups that just got a slot and must be published.
+    def __init__(self, cache):
+        self.cache = cache
+        self._enqueue = cache.register_script(ENQUEUE_SCRIPT)
+        self._flush = cache.register_script(FLUSH_SCRIPT)
+        self._complete = cache.register_script(COMPLETE_SCRIPT)
+
+    def _create_debounce_key(self, user_id):
+        return f"users:recommendations:debounce:{user_id}"
+
+    def _now(self):
+        return int(datetime.now().timestamp())
+
+    def _max_age(self):
+        return int(os.getenv('RECOMMENDATION_BATCH_MAX_AGE') or 30)
+
+    def _max_in_flight(self):
+        return int(os.getenv('RECOMMENDATION_MAX_IN_FLIGHT') or 4)
+
+    def _batch_timeout(self):
+        return int(os.getenv('RECOMMENDATION_BATCH_TIMEOUT') or 300)
+
+    def _max_attempts(self):
+        return int(os.getenv('RECOMMENDATION_BATCH_ATTEMPTS') or 3)
+
+    def enqueue(self, user_key, user_id, new_group_key):
+        return self._enqueue(
+            keys=[
+                user_key, self._create_debounce_key(user_id), QUEUED_USERS_KEY, OPEN_GROUP_KEY,
+                GROUP_REGISTRY_KEY, READY_GROUPS_KEY, IN_FLIGHT_KEY, new_group_key, GROUP_ATTEMPTS_KEY,
+            ],
+            args=[
+                os.getenv('FOLLOWERS_PER_USER'), os.getenv('USERS_PER_GROUP'), user_id, self._now(),
+                int(os.getenv('RECOMMENDATION_DEBOUNCE_SECONDS') or 60), self._max_age(),
+                self._max_in_flight(), self._batch_timeout(), self._max_attempts(),
+            ],
+        ) or []
+
+    def flush_due(self):
+        return self._flush(
+            keys=[OPEN_GROUP_KEY, GROUP_REGISTRY_KEY, READY_GROUPS_KEY, IN_FLIGHT_KEY, QUEUED_USERS_KEY, GROUP_ATTEMPTS_KEY],
+            args=[self._now(), self._max_age(), self._max_in_flight(), self._batch_timeout(), self._max_attempts()],
+        ) or []
+
+    def complete(self, group_key):
+        return self._complete(
+            keys=[group_key, IN_FLIGHT_KEY, READY_GROUPS_KEY, QUEUED_USERS_KEY, GROUP_REGISTRY_KEY, GROUP_ATTEMPTS_KEY],
+            args=[self._now(), self._max_in_flight(), self._batch_timeout(), self._max_attempts()],
+        ) or []
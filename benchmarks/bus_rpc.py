@@ -0,0 +1,83 @@
+import os
+
+# Must be set before infrastructure.bus builds its singleton client
+os.environ.setdefault('BUS_TRANSPORT', 'loopback')
+os.environ.setdefault('BUS_QUEUE', 'death_queue')
+
+from infrastructure.bus import bus_client
+import statistics
+import threading
+import argparse
+import logging
+import time
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Request -> RPC -> handler benchmark over the bus client")
+    parser.add_argument('--mode', choices=['rpc', 'gather', 'emit'], default='rpc')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--handler-ms', type=float, default=0)
+    parser.add_argument('--fanout', type=int, default=3, help="RPCs per request in gather mode")
+    parser.add_argument('--ids', type=int, default=50, help="user ids per payload")
+    parser.add_argument('--content-type', default='application/json')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    queue_name = os.getenv('BUS_QUEUE')
+
+    @bus_client.register_handler('BENCH')
+    def handler(payload, ch):
+        if args.handler_ms:
+            time.sleep(args.handler_ms / 1000)
+        return [{'userId': user_id, 'isFollowing': False} for user_id in payload['user_ids']]
+
+    bus_client.start_consuming(queue_name, workers=args.workers)
+
+    payload = {'user_ids': [317608755095207938 + i for i in range(args.ids)]}
+    per_thread = args.requests // args.threads
+    latencies = []
+    lock = threading.Lock()
+
+    def request():
+        if args.mode == 'rpc':
+            bus_client.publish_event(queue_name, 'BENCH', payload, content_type=args.content_type)
+        elif args.mode == 'gather':
+            bus_client.publish_many([(queue_name, 'BENCH', payload)] * args.fanout, content_type=args.content_type)
+        else:
+            bus_client.emit(queue_name, 'BENCH', payload, content_type=args.content_type)
+
+    def run():
+        samples = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            request()
+            samples.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"transport={os.getenv('BUS_TRANSPORT')} mode={args.mode} content_type={args.content_type}")
+    print(f"requests={len(latencies)} elapsed={elapsed:.3f}s throughput={len(latencies) / elapsed:.0f} req/s")
+    print(
+        f"latency ms: mean={statistics.mean(latencies) * 1000:.3f} "
+        f"p50={percentile(latencies, 50) * 1000:.3f} "
+        f"p95={percentile(latencies, 95) * 1000:.3f} "
+        f"p99={percentile(latencies, 99) * 1000:.3f}"
+    )
+
+    bus_client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+from infrastructure.database.repositories import follower_repository
+from infrastructure.database import get_db_pool
+import statistics
+import argparse
+import random
+import time
+import os
+
+# Existence check (find_by on follower_id + following_id), the most frequent query shape,
+# sent as plain SQL and as a server-side prepared statement. Needs the DB_* environment.
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def measure(iterations, users):
+    samples = []
+    for _ in range(iterations):
+        conditions = {
+            'following_id': random.randint(1, users),
+            'follower_id': random.randint(1, users),
+        }
+        start = time.perf_counter()
+        follower_repository.find_by(conditions)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepared vs unprepared repository statements")
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2000, help="id range the lookups draw from")
+    parser.add_argument('--rounds', type=int, default=3, help="alternating rounds per mode, evens out drift")
+    args = parser.parse_args()
+
+    results = {'false': [], 'true': []}
+    for _ in range(args.rounds):
+        for mode in results:
+            os.environ['DB_PREPARED_STATEMENTS'] = mode
+            measure(200, args.users)  # warm up the pool and the statement cache
+            results[mode].extend(measure(args.iterations, args.users))
+
+    for mode, samples in results.items():
+        print(
+            f"prepared={mode} iterations={len(samples)} "
+            f"mean={statistics.mean(samples) * 1e6:.0f}us "
+            f"p50={percentile(samples, 50) * 1e6:.0f}us "
+            f"p99={percentile(samples, 99) * 1e6:.0f}us"
+        )
+
+    get_db_pool().close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from infrastructure.graph import FollowGraph, recommend_shard, get_graph_executor
+import numpy as np
+import argparse
+import tempfile
+import time
+import os
+
+# Wall-clock time of one recommendation batch on a synthetic heavy-tailed graph, computed in a
+# single process and split across 2..N worker processes. Workers load the graph from a snapshot,
+# so no database is needed.
+
+def batch(users, k, workers):
+    if workers == 1:
+        return recommend_shard(users, k, {})
+
+    size = -(-len(users) // workers)
+    shards = [users[start:start + size] for start in range(0, len(users), size)]
+    executor = get_graph_executor(workers)
+    return [future.result() for future in [executor.submit(recommend_shard, shard, k, {}) for shard in shards]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation batch time by worker count")
+    parser.add_argument('--users', type=int, default=500_000, help="accounts in the synthetic graph")
+    parser.add_argument('--edges', type=int, default=10_000_000)
+    parser.add_argument('--batch', type=int, default=2000, help="users per recommendation batch")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    graph = FollowGraph.from_edges(
+        (rng.pareto(1.1, args.edges) * 20).astype(np.int64) % args.users,
+        (rng.pareto(1.2, args.edges) * 50).astype(np.int64) % args.users,
+    )
+    users = [str(user_id) for user_id in rng.choice(graph.ids, args.batch, replace=False)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        graph.save(directory)
+        os.environ['GRAPH_SNAPSHOT_PATH'] = directory
+        os.environ['GRAPH_REFRESH_SECONDS'] = '3600'
+
+        for workers in sorted({1, *range(2, args.workers + 1)}):
+            batch(users, 50, workers)  # start the pool and load the snapshot in every worker
+            samples = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                batch(users, 50, workers)
+                samples.append(time.perf_counter() - start)
+            print(f"workers={workers} batch={len(users)} best={min(samples) * 1000:.0f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from .connection import RabbitMQManager, logger
+from .rpc import RpcError
 import os
 
 bus_client = RabbitMQManager()
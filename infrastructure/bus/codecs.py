@@ -0,0 +1,49 @@
+import msgpack
+import json
+
+DEFAULT_CONTENT_TYPE = 'application/json'
+
+class JsonCodec:
+    content_types = ('application/json',)
+
+    def encode(self, data):
+        return json.dumps(data, default=str).encode('utf-8')
+
+    def decode(self, body):
+        return json.loads(body)
+
+class MsgpackCodec:
+    # Native 64-bit ints: BIGINT user ids round-trip without the string detour JSON clients need
+    content_types = ('application/msgpack', 'application/x-msgpack')
+
+    def encode(self, data):
+        return msgpack.packb(data, default=str, use_bin_type=True)
+
+    def decode(self, body):
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+_codecs = {}
+
+def register_codec(codec):
+    for content_type in codec.content_types:
+        _codecs[content_type] = codec
+
+def get_codec(content_type):
+    # Peers that send no (or an unknown) content type are treated as JSON
+    return _codecs.get(content_type) or _codecs[DEFAULT_CONTENT_TYPE]
+
+def is_supported(content_type):
+    return content_type in _codecs
+
+def negotiate(properties):
+    # Reply with the first type the caller accepts, otherwise mirror the request
+    accept = (properties.headers or {}).get('accept')
+    for content_type in (accept or '').split(','):
+        content_type = content_type.strip()
+        if is_supported(content_type):
+            return content_type
+
+    return properties.content_type if is_supported(properties.content_type) else DEFAULT_CONTENT_TYPE
+
+register_codec(JsonCodec())
+register_codec(MsgpackCodec())
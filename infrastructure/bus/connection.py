@@ -1,15 +1,21 @@
 import threading
 import logging
-import json
 import pika
-import uuid
 import os
 import time
 from functools import wraps
+from .codecs import DEFAULT_CONTENT_TYPE
+from .dispatcher import Dispatcher
+from .singleflight import SingleFlight
+from .transport import create_transport
+from .rpc import RpcClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def lane_queue(queue_name, event_name):
+    return f"{queue_name}.{event_name.lower()}"
+
 class RabbitMQManager:
     _instance = None
     _lock = threading.Lock()
@@ -23,29 +29,24 @@ class RabbitMQManager:
         return cls._instance
     
     def _initialize(self):
-        self._connection_params = pika.ConnectionParameters(
-            host=os.getenv('BUS_HOST'),
-            port=int(os.getenv('BUS_PORT')),
-            credentials=pika.PlainCredentials(
-                username=os.getenv('BUS_USER'),
-                password=os.getenv('BUS_PASS')),
-            virtual_host=os.getenv('BUS_VHOST'),
-            heartbeat=30,  # Heartbeat reduzido para 30 segundos
-            blocked_connection_timeout=300,
-            connection_attempts=5,
-            retry_delay=5,
-            socket_timeout=10
-        )
+        self._transport = create_transport()
+        self._local = threading.local()
+        self._single_flight = SingleFlight()
+        self._content_type = os.getenv('BUS_CONTENT_TYPE', DEFAULT_CONTENT_TYPE)
         self._connect()
         self._event_handlers = {}
+        self._event_limits = {}
+        self._dispatcher = None
+        self._prefetch_count = 1
         self._consuming = False
         self._consumer_tags = {}
+        self._lane_channels = {}
 
     def _connect(self):
         max_retries = 5
         for attempt in range(max_retries):
             try:
-                self.connection = pika.BlockingConnection(self._connection_params)
+                self.connection = self._transport.connect()
                 self.channel = self.connection.channel()
                 self.channel.queue_declare(
                     queue=os.getenv('BUS_QUEUE'),
@@ -64,10 +65,12 @@ class RabbitMQManager:
             if hasattr(self, 'connection') and self.connection.is_open:
                 self.connection.close()
             self._connect()
+            self._lane_channels = {}
             # Re-register consumers after reconnection
+            if self._dispatcher:
+                self._dispatcher.reset(self.connection)
             if self._consuming:
-                for queue_name, callback in self._consumer_tags.items():
-                    self._start_consumer(queue_name, callback)
+                self._restart_consumers()
         except Exception as e:
             logger.error(f"Reconnection failed: {str(e)}")
             raise
@@ -76,128 +79,118 @@ class RabbitMQManager:
         if not hasattr(self, 'connection') or not self.connection.is_open:
             self._reconnect()
 
-    def publish_event(self, queue_name, event_name, payload, timeout=10):
-        connection = pika.BlockingConnection(self._connection_params)
-        channel = connection.channel()
-        try:
-            corr_id = str(uuid.uuid4())
-            response = None
-            response_lock = threading.Event()
-
-            result = channel.queue_declare(queue='', exclusive=True, durable=False, auto_delete=True)
-            callback_queue = result.method.queue
-
-            def on_response(ch, method, properties, body):
-                nonlocal response
-                if properties.correlation_id == corr_id:
-                    try:
-                        response = json.loads(body)['data']
-                    except Exception:
-                        response = body.decode()
-                    finally:
-                        response_lock.set()
-
-            channel.basic_consume(
-                queue=callback_queue,
-                on_message_callback=on_response,
-                auto_ack=True
-            )
+    def _rpc_client(self):
+        # BlockingConnection is not thread-safe: one long-lived client per thread, rebuilt after fork
+        client = getattr(self._local, 'rpc_client', None)
+        if client is None or self._local.pid != os.getpid():
+            client = RpcClient(self._transport, self._content_type)
+            self._local.rpc_client = client
+            self._local.pid = os.getpid()
+        return client
+
+    def publish_event(self, queue_name, event_name, payload, timeout=10, content_type=None, coalesce=False):
+        if not coalesce:
+            return self._rpc_client().call(queue_name, event_name, payload, timeout, content_type)
+
+        # Identical concurrent requests in this process share one in-flight RPC
+        key = self._single_flight.key(queue_name, event_name, content_type, payload)
+        return self._single_flight.do(
+            key,
+            lambda: self._rpc_client().call(queue_name, event_name, payload, timeout, content_type)
+        )
 
-            message = {'event': event_name, 'data': payload}
-
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue_name,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    reply_to=callback_queue,
-                    correlation_id=corr_id,
-                    delivery_mode=2,
-                    content_type='application/json',
-                    expiration=str(timeout * 1000)
-                )
-            )
+    def stream_event(self, queue_name, event_name, payload, timeout=60, content_type=None):
+        # Generator over the chunks of a streamed reply; consume it on the calling thread
+        return self._rpc_client().stream(queue_name, event_name, payload, timeout, content_type)
 
-            # Inicia a espera ativa pelo response
-            start_time = time.time()
-            while not response_lock.is_set():
-                connection.process_data_events(time_limit=1)
-                if time.time() - start_time > timeout:
-                    raise TimeoutError("No response received in time")
+    def publish_many(self, requests, timeout=10, content_type=None):
+        # requests: [(queue_name, event_name, payload)]; all share one deadline
+        return self._rpc_client().call_many(requests, timeout, content_type)
 
-            return response
+    def emit(self, queue_name, event_name, payload, content_type=None):
+        self.emit_many([(queue_name, event_name, payload)], content_type)
 
-        finally:
-            try:
-                channel.queue_delete(queue=callback_queue)
-                channel.close()
-            except Exception:
-                pass
-            try:
-                connection.close()
-            except Exception:
-                pass
+    def emit_many(self, messages, content_type=None):
+        # One-way events: no reply queue, returns once the broker has confirmed every message
+        self._rpc_client().emit_many(messages, content_type)
+
+    def event_queue(self, queue_name, event_name):
+        # Where to send an event handled by this service: its lane queue once the consumer has
+        # declared one, the shared queue otherwise (the dispatcher moves it over when needed)
+        name = lane_queue(queue_name, event_name)
+        return name if name in self._lane_channels else queue_name
 
-    def register_handler(self, event_name):
+    def register_handler(self, event_name, max_concurrency=None):
         def decorator(callback):
             if not callable(callback):
                 raise ValueError("Callback must be callable")
             self._event_handlers[event_name] = callback
+            if max_concurrency is not None:
+                self._event_limits[event_name] = max_concurrency
             logger.info(f"Handler registered for event: {event_name}")
             return callback
         return decorator
 
-    def start_consuming(self, queue_name):
+    def _channel_for(self, queue_name, dedicated):
+        if not dedicated:
+            return self.channel
+
+        # Lane queues get a channel of their own so their prefetch does not share the main budget
+        channel = self._lane_channels.get(queue_name)
+        if channel is None or not channel.is_open:
+            channel = self.connection.channel()
+            channel.queue_declare(queue=queue_name, durable=True)
+            self._lane_channels[queue_name] = channel
+        return channel
+
+    def _start_consumer(self, queue_name, callback, prefetch_count=None, dedicated=False):
+        channel = self._channel_for(queue_name, dedicated)
+        channel.basic_qos(prefetch_count=prefetch_count or self._prefetch_count)
+        channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=callback,
+            auto_ack=False
+        )
+
+    def _restart_consumers(self):
+        for channel in self._lane_channels.values():
+            try:
+                if channel.is_open:
+                    channel.close()
+            except Exception:
+                pass
+        self._lane_channels = {}
+
+        for queue_name, (callback, prefetch_count, dedicated) in self._consumer_tags.items():
+            self._start_consumer(queue_name, callback, prefetch_count, dedicated)
+
+    def start_consuming(self, queue_name, workers=None, prefetch_count=None):
         if self._consuming:
             logger.warning("Already consuming messages")
             return
-            
-        def callback(ch, method, properties, body):
-            try:
-                message = json.loads(body)
-                event_name = message.get('event')
-                payload = message.get('data')
-                
-                logger.debug(f"Received event: {event_name}")
-                
-                if event_name in self._event_handlers:
-                    try:
-                        res = self._event_handlers[event_name](payload, ch)
-
-                        if properties.reply_to:
-                            ch.basic_publish(
-                            exchange='',
-                            routing_key=properties.reply_to,
-                            body=json.dumps({ 'data': res }, default=str),
-                            properties=pika.BasicProperties(
-                                correlation_id=properties.correlation_id,
-                                content_type='application/json',
-                                delivery_mode=2,
-                            )
-                        )
-
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                    except Exception as e:
-                        logger.error(f"Handler failed for {event_name}: {str(e)}")
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                else:
-                    logger.warning(f"No handler for event: {event_name}")
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                
-            except json.JSONDecodeError:
-                logger.error("Invalid message format")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-            except Exception as e:
-                logger.error(f"Unexpected error: {str(e)}")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+        workers = workers or int(os.getenv('BUS_CONSUMER_WORKERS', 1))
+        self._prefetch_count = prefetch_count or int(os.getenv('BUS_PREFETCH_COUNT', workers))
+
+        lane_queues = { event_name: lane_queue(queue_name, event_name) for event_name in self._event_limits }
+        self._dispatcher = Dispatcher(
+            self.connection,
+            self._event_handlers,
+            self._event_limits,
+            workers,
+            max_backlog=int(os.getenv('BUS_MAX_BACKLOG', 0)),
+            max_queue_latency=int(os.getenv('BUS_MAX_QUEUE_LATENCY_MS', 0)) / 1000,
+            lane_queues=lane_queues
+        )
 
         try:
-            self.channel.basic_qos(prefetch_count=1)
-            self.channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=callback,
-                auto_ack=False
-            )
+            self._consumer_tags[queue_name] = (self._dispatcher.on_message, self._prefetch_count, False)
+            # Limited events also arrive on their own queue, prefetched only as far as the lane can run
+            for event_name, name in lane_queues.items():
+                self._consumer_tags[name] = (self._dispatcher.on_message, self._event_limits[event_name], True)
+
+            for name, (callback, prefetch_count, dedicated) in self._consumer_tags.items():
+                self._start_consumer(name, callback, prefetch_count, dedicated)
             
             self._consuming = True
 
@@ -207,7 +200,7 @@ class RabbitMQManager:
                 name=f"RabbitMQConsumer-{queue_name}"
             )
             thread.start()
-            logger.info(f"Started consuming from queue: {queue_name}")
+            logger.info(f"Started consuming from queue: {queue_name} (workers={workers}, prefetch={self._prefetch_count})")
             
         except Exception as e:
             logger.error(f"Failed to start consuming: {str(e)}")
@@ -224,6 +217,8 @@ class RabbitMQManager:
             except pika.exceptions.AMQPChannelError as err:
                 logger.error(f"Channel error: {str(err)}, recreating channel")
                 self.channel = self.connection.channel()
+                self._dispatcher.reset(self.connection)
+                self._restart_consumers()
                 continue
             except pika.exceptions.AMQPConnectionError:
                 logger.warning("Connection lost, reconnecting...")
@@ -236,6 +231,12 @@ class RabbitMQManager:
     def close(self):
         try:
             self._consuming = False
+            if self._dispatcher:
+                self._dispatcher.shutdown()
+            client = getattr(self._local, 'rpc_client', None)
+            if client is not None:
+                client.close()
+                self._local.rpc_client = None
             if hasattr(self, 'connection') and self.connection.is_open:
                 self.connection.close()
                 logger.info("RabbitMQ connection closed")
@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor
+from .codecs import get_codec, negotiate
+from .rpc import DEADLINE_HEADER, STREAM_SEQ_HEADER, STREAM_END_HEADER
+from collections import deque
+from functools import partial
+import threading
+import inspect
+import logging
+import pika
+import time
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+FAILED = 'failed'
+EXPIRED = 'expired'
+SHED = 'shed'
+STREAMED = 'streamed'
+
+# Upper bound on waiting for the connection thread to publish a chunk when the caller sent no deadline
+STREAM_CHUNK_TIMEOUT = 30
+
+def deadline_expired(properties):
+    # Absolute deadline in epoch milliseconds, set by the caller from its RPC timeout
+    deadline = (properties.headers or {}).get(DEADLINE_HEADER)
+    return deadline is not None and time.time() * 1000 >= int(deadline)
+
+def _deadline_remaining(properties):
+    deadline = (properties.headers or {}).get(DEADLINE_HEADER)
+    return None if deadline is None else int(deadline) / 1000 - time.time()
+
+def _sheddable(properties):
+    # Only RPCs can be shed: their caller gets an error reply or gives up at its deadline
+    return bool(properties.reply_to) or DEADLINE_HEADER in (properties.headers or {})
+
+class _EventLane:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.backlog = deque()
+
+    def has_capacity(self):
+        return self.limit is None or self.active < self.limit
+
+class Dispatcher:
+    # Lane bookkeeping, acks and replies only ever run on the connection thread;
+    # worker threads hand results back through add_callback_threadsafe.
+    def __init__(self, connection, handlers, limits, workers, max_backlog=0, max_queue_latency=0, lane_queues=None):
+        self.connection = connection
+        self.handlers = handlers
+        self.limits = limits
+        # event -> dedicated queue consumed with a prefetch equal to the lane limit
+        self.lane_queues = lane_queues or {}
+        self.max_backlog = max_backlog
+        self.max_queue_latency = max_queue_latency
+        self.lanes = self._create_lanes()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="RabbitMQWorker")
+
+    def _create_lanes(self):
+        return {event_name: _EventLane(self.limits.get(event_name)) for event_name in self.handlers}
+
+    def on_message(self, ch, method, properties, body):
+        try:
+            message = get_codec(properties.content_type).decode(body)
+            event_name = message.get('event')
+            payload = message.get('data')
+        except Exception:
+            logger.error(f"Invalid message format ({properties.content_type})")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        logger.debug(f"Received event: {event_name}")
+
+        if event_name not in self.handlers:
+            logger.warning(f"No handler for event: {event_name}")
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        job = (ch, method, properties, event_name, payload, time.monotonic())
+
+        if deadline_expired(properties):
+            self._settle(job, (EXPIRED, None))
+            return
+
+        lane = self.lanes.setdefault(event_name, _EventLane(self.limits.get(event_name)))
+
+        lane_queue = self.lane_queues.get(event_name)
+        if lane.has_capacity():
+            self._submit(lane, job)
+        elif lane_queue and method.routing_key != lane_queue:
+            # Waiting here would hold a prefetch slot of the shared queue and starve light events:
+            # park it on the lane's own queue, whose prefetch only admits what the lane can run
+            self._forward(ch, method, properties, body, lane_queue)
+        elif self.max_backlog and len(lane.backlog) >= self.max_backlog:
+            self._settle(job, (SHED, None))
+        else:
+            lane.backlog.append(job)
+
+    def _forward(self, ch, method, properties, body, queue_name):
+        try:
+            ch.basic_publish(exchange='', routing_key=queue_name, body=body, properties=properties)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            logger.error(f"Could not move delivery to {queue_name}: {str(e)}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+    def _submit(self, lane, job):
+        lane.active += 1
+        try:
+            self.executor.submit(self._run, lane, job)
+        except Exception:
+            lane.active -= 1
+            raise
+
+    def _run(self, lane, job):
+        ch, method, properties, event_name, payload, received_at = job
+
+        # Re-checked here: the job may have waited in the lane backlog or the pool queue
+        if deadline_expired(properties):
+            outcome = (EXPIRED, None)
+        elif self.max_queue_latency and time.monotonic() - received_at > self.max_queue_latency:
+            outcome = (SHED, None)
+        else:
+            try:
+                outcome = (OK, self.handlers[event_name](payload, ch))
+                if inspect.isgenerator(outcome[1]):
+                    outcome = self._stream(ch, properties, event_name, outcome[1])
+            except Exception as e:
+                outcome = (FAILED, e)
+
+        try:
+            self.connection.add_callback_threadsafe(partial(self._complete, lane, job, outcome))
+        except Exception as e:
+            # Connection is gone: the unacked delivery will be redelivered by the broker
+            logger.error(f"Could not hand back result for {event_name}: {str(e)}")
+
+    def _stream(self, ch, properties, event_name, chunks):
+        # Handlers that return a generator answer with one reply per chunk. Chunks are produced on the
+        # worker thread and published one at a time on the connection thread, so a slow caller holds
+        # back the database cursor instead of piling up replies in memory.
+        if not properties.reply_to:
+            for _ in chunks:
+                pass
+            return (OK, None)
+
+        seq = 0
+        try:
+            for chunk in chunks:
+                if not self._publish_chunk(ch, properties, { 'data': chunk }, { STREAM_SEQ_HEADER: seq }):
+                    logger.info(f"Abandoning {event_name} stream after {seq} chunks")
+                    chunks.close()
+                    return (STREAMED, None)
+                seq += 1
+            end = { 'data': None }
+        except Exception as e:
+            logger.error(f"Stream failed for {event_name}: {str(e)}")
+            end = { 'data': None, 'error': str(e) }
+
+        self._publish_chunk(ch, properties, end, { STREAM_SEQ_HEADER: seq, STREAM_END_HEADER: True })
+        return (STREAMED, None)
+
+    def _publish_chunk(self, ch, properties, message, headers):
+        remaining = _deadline_remaining(properties)
+        if remaining is not None and remaining <= 0:
+            return False
+
+        published = threading.Event()
+        delivered = []
+
+        def publish():
+            try:
+                if ch.is_open:
+                    self._reply(ch, properties, message, headers)
+                    delivered.append(True)
+            except Exception as e:
+                logger.error(f"Could not publish stream chunk: {str(e)}")
+            finally:
+                published.set()
+
+        self.connection.add_callback_threadsafe(publish)
+        published.wait(remaining if remaining is not None else STREAM_CHUNK_TIMEOUT)
+        return bool(delivered)
+
+    def _complete(self, lane, job, outcome):
+        lane.active -= 1
+        if lane.backlog and lane.has_capacity():
+            self._submit(lane, lane.backlog.popleft())
+
+        self._settle(job, outcome)
+
+    def _reply(self, ch, properties, message, headers=None):
+        content_type = negotiate(properties)
+        ch.basic_publish(
+            exchange='',
+            routing_key=properties.reply_to,
+            body=get_codec(content_type).encode(message),
+            properties=pika.BasicProperties(
+                correlation_id=properties.correlation_id,
+                content_type=content_type,
+                delivery_mode=2,
+                headers=headers,
+            )
+        )
+
+    def _settle(self, job, outcome):
+        ch, method, properties, event_name, _, _ = job
+        status, result = outcome
+
+        if not ch.is_open:
+            logger.warning(f"Channel closed before {event_name} completed, delivery will be retried")
+            return
+
+        try:
+            if status == FAILED:
+                logger.error(f"Handler failed for {event_name}: {str(result)}")
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
+
+            if status == EXPIRED:
+                # Caller already gave up and its reply queue may be gone: drop without replying
+                logger.info(f"Dropping expired {event_name}")
+            elif status == SHED:
+                if not _sheddable(properties):
+                    # One-way events have no caller to fail fast to: put them back instead of losing them
+                    logger.warning(f"Requeueing {event_name}: consumer overloaded")
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                    return
+                logger.warning(f"Shedding {event_name}: consumer overloaded")
+                if properties.reply_to:
+                    self._reply(ch, properties, { 'data': None, 'error': 'overloaded' })
+            elif status == OK and properties.reply_to:
+                self._reply(ch, properties, { 'data': result })
+
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    def reset(self, connection):
+        # Deliveries from the old channel are redelivered by the broker: start from fresh lanes and
+        # let in-flight jobs settle against the lanes they were submitted to
+        self.connection = connection
+        self.lanes = self._create_lanes()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,316 @@
+from pika.exceptions import ChannelWrongStateError, ConnectionWrongStateError, UnroutableError
+from collections import deque
+from pika import spec
+import itertools
+import threading
+import queue
+import time
+import copy
+
+# In-process stand-in for the subset of pika's BlockingConnection/BlockingChannel API the bus uses:
+# default-exchange routing, manual acks with prefetch, per-message expiration, publisher confirms
+# and direct reply-to. Callbacks always run on the thread that owns the connection, like pika.
+
+REPLY_QUEUE = 'amq.rabbitmq.reply-to'
+
+class _Message:
+    def __init__(self, routing_key, body, properties):
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.redelivered = False
+        self.expires_at = None
+        if properties.expiration is not None:
+            self.expires_at = time.monotonic() + int(properties.expiration) / 1000
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+class _Consumer:
+    def __init__(self, tag, channel, queue_name, callback, auto_ack):
+        self.tag = tag
+        self.channel = channel
+        self.queue_name = queue_name
+        self.callback = callback
+        self.auto_ack = auto_ack
+
+    def has_capacity(self):
+        prefetch = self.channel.prefetch_count
+        return self.auto_ack or not prefetch or len(self.channel.unacked) < prefetch
+
+class _Frame:
+    def __init__(self, method):
+        self.method = method
+
+class LoopbackBroker:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._queues = {}
+        self._consumers = {}
+        self._reply_channels = {}
+        self._ids = itertools.count(1)
+
+    def connect(self):
+        return LoopbackConnection(self)
+
+    def queue_declare(self, queue_name):
+        with self._lock:
+            if not queue_name:
+                queue_name = f"amq.gen-{next(self._ids)}"
+            self._queues.setdefault(queue_name, deque())
+            self._consumers.setdefault(queue_name, [])
+            return queue_name, len(self._queues[queue_name]), len(self._consumers[queue_name])
+
+    def queue_delete(self, queue_name):
+        with self._lock:
+            self._queues.pop(queue_name, None)
+            for consumer in self._consumers.pop(queue_name, []):
+                consumer.channel.consumers.pop(consumer.tag, None)
+
+    def message_count(self, queue_name):
+        with self._lock:
+            return len(self._queues.get(queue_name, ()))
+
+    def publish(self, channel, routing_key, body, properties, mandatory):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        properties = copy.copy(properties) if properties else spec.BasicProperties()
+
+        with self._lock:
+            if routing_key.startswith(f"{REPLY_QUEUE}."):
+                reply_channel = self._reply_channels.get(routing_key)
+                if reply_channel is not None:
+                    reply_channel.deliver_reply(routing_key, body, properties)
+                return True
+
+            if properties.reply_to == REPLY_QUEUE:
+                if channel.reply_key is None:
+                    raise ChannelWrongStateError("Direct reply-to requires consuming from amq.rabbitmq.reply-to first")
+                properties.reply_to = channel.reply_key
+
+            if routing_key not in self._queues:
+                return not mandatory
+
+            self._queues[routing_key].append(_Message(routing_key, body, properties))
+            self._dispatch(routing_key)
+            return True
+
+    def consume(self, channel, queue_name, callback, auto_ack):
+        with self._lock:
+            tag = f"ctag-{next(self._ids)}"
+
+            if queue_name == REPLY_QUEUE:
+                channel.reply_key = f"{REPLY_QUEUE}.{next(self._ids)}"
+                self._reply_channels[channel.reply_key] = channel
+                channel.reply_callback = callback
+                return tag
+
+            if queue_name not in self._queues:
+                raise ChannelWrongStateError(f"NOT_FOUND - no queue '{queue_name}'")
+
+            consumer = _Consumer(tag, channel, queue_name, callback, auto_ack)
+            channel.consumers[tag] = consumer
+            self._consumers[queue_name].append(consumer)
+            self._dispatch(queue_name)
+            return tag
+
+    def settle(self, channel, delivery_tag, requeue=False):
+        with self._lock:
+            entry = channel.unacked.pop(delivery_tag, None)
+            if entry is None:
+                return
+
+            message, queue_name = entry
+            if requeue and queue_name in self._queues:
+                message.redelivered = True
+                self._queues[queue_name].appendleft(message)
+
+            self._dispatch(queue_name)
+
+    def release(self, channel):
+        # Closing a channel requeues its unacked deliveries, like the real broker
+        with self._lock:
+            self._reply_channels.pop(channel.reply_key, None)
+            for consumer in channel.consumers.values():
+                consumers = self._consumers.get(consumer.queue_name, [])
+                if consumer in consumers:
+                    consumers.remove(consumer)
+
+            for delivery_tag in sorted(channel.unacked, reverse=True):
+                self.settle(channel, delivery_tag, requeue=True)
+
+    def _dispatch(self, queue_name):
+        messages = self._queues.get(queue_name)
+        consumers = self._consumers.get(queue_name)
+
+        while messages and consumers:
+            ready = [consumer for consumer in consumers if consumer.has_capacity()]
+            if not ready:
+                return
+
+            message = messages.popleft()
+            if message.expired():
+                continue
+
+            consumer = ready[0]
+            # Round-robin between consumers of the same queue
+            consumers.remove(consumer)
+            consumers.append(consumer)
+            consumer.channel.deliver(consumer, message)
+
+class LoopbackConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self._inbox = queue.Queue()
+        self._channels = []
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self):
+        self._check_open()
+        channel = LoopbackChannel(self)
+        self._channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        self._check_open()
+        self._inbox.put(callback)
+
+    def schedule(self, callback):
+        self._inbox.put(callback)
+
+    def process_data_events(self, time_limit=0):
+        self._check_open()
+        deadline = time.monotonic() + (time_limit or 0)
+
+        remaining = deadline - time.monotonic()
+        try:
+            callback = self._inbox.get(timeout=remaining) if remaining > 0 else self._inbox.get_nowait()
+        except queue.Empty:
+            return
+
+        callback()
+        # Drain what is already queued, then hand control back like pika does
+        while self.is_open:
+            try:
+                callback = self._inbox.get_nowait()
+            except queue.Empty:
+                return
+            callback()
+
+    def sleep(self, duration):
+        self.process_data_events(time_limit=duration)
+
+    def close(self):
+        if not self.is_open:
+            return
+        for channel in list(self._channels):
+            channel.close()
+        self.is_open = False
+        self._inbox.put(lambda: None)
+
+    def _check_open(self):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Connection is closed")
+
+class LoopbackChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self.prefetch_count = 0
+        self.consumers = {}
+        self.unacked = {}
+        self.reply_key = None
+        self.reply_callback = None
+        self._confirming = False
+        self._consuming = False
+        self._delivery_tags = itertools.count(1)
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def queue_declare(self, queue='', durable=False, exclusive=False, auto_delete=False, arguments=None, passive=False):
+        self._check_open()
+        queue_name, message_count, consumer_count = self.broker.queue_declare(queue)
+        return _Frame(spec.Queue.DeclareOk(queue_name, message_count, consumer_count))
+
+    def queue_delete(self, queue=''):
+        self._check_open()
+        self.broker.queue_delete(queue)
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, global_qos=False):
+        self._check_open()
+        self.prefetch_count = prefetch_count
+
+    def confirm_delivery(self):
+        self._check_open()
+        self._confirming = True
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, exclusive=False, consumer_tag=None, arguments=None):
+        self._check_open()
+        return self.broker.consume(self, queue, on_message_callback, auto_ack)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._check_open()
+        if exchange:
+            raise ChannelWrongStateError("Loopback broker only routes through the default exchange")
+
+        routed = self.broker.publish(self, routing_key, body, properties, mandatory)
+        if self._confirming and not routed:
+            raise UnroutableError([])
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._check_open()
+        self.broker.settle(self, delivery_tag)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._check_open()
+        self.broker.settle(self, delivery_tag, requeue=requeue)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def deliver(self, consumer, message):
+        # Called under the broker lock from whichever thread published or acked
+        delivery_tag = next(self._delivery_tags)
+        if not consumer.auto_ack:
+            self.unacked[delivery_tag] = (message, consumer.queue_name)
+
+        method = spec.Basic.Deliver(consumer.tag, delivery_tag, message.redelivered, '', message.routing_key)
+        self.connection.schedule(lambda: self._invoke(consumer.callback, method, message.properties, message.body))
+
+    def deliver_reply(self, routing_key, body, properties):
+        method = spec.Basic.Deliver(routing_key, next(self._delivery_tags), False, '', routing_key)
+        self.connection.schedule(lambda: self._invoke(self.reply_callback, method, properties, body))
+
+    def _invoke(self, callback, method, properties, body):
+        if self.is_open:
+            callback(self, method, properties, body)
+
+    def start_consuming(self):
+        self._check_open()
+        self.connection._check_open()
+        self._consuming = True
+        while self._consuming and self.is_open and self.connection.is_open:
+            self.connection.process_data_events(time_limit=1)
+
+    def stop_consuming(self, consumer_tag=None):
+        self._consuming = False
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self._consuming = False
+        self.broker.release(self)
+
+    def _check_open(self):
+        if not self.is_open:
+            raise ChannelWrongStateError("Channel is closed")
+
+default_broker = LoopbackBroker()
@@ -0,0 +1,288 @@
+from .codecs import get_codec
+from collections import deque
+import logging
+import pika
+import uuid
+import time
+
+logger = logging.getLogger(__name__)
+
+# RabbitMQ direct reply-to pseudo queue: no declare/delete per call
+REPLY_QUEUE = 'amq.rabbitmq.reply-to'
+
+DEADLINE_HEADER = 'x-deadline'
+STREAM_SEQ_HEADER = 'x-stream-seq'
+STREAM_END_HEADER = 'x-stream-end'
+
+_PENDING = object()
+
+class RpcError(Exception):
+    pass
+
+class _Stream:
+    # Chunked reply: several messages share one correlation id, the last one carries STREAM_END_HEADER
+    def __init__(self):
+        self.chunks = deque()
+        self.ended = False
+        self.error = None
+
+class RpcClient:
+    def __init__(self, transport, content_type):
+        self._transport = transport
+        self.content_type = content_type
+        self.connection = None
+        self.channel = None
+        self.confirm_channel = None
+        self._responses = {}
+
+    def _ensure_connection(self):
+        if self.connection and self.connection.is_open and self.channel and self.channel.is_open:
+            try:
+                # Services heartbeats and surfaces a connection the broker dropped while idle
+                self.connection.process_data_events(time_limit=0)
+                return
+            except pika.exceptions.AMQPError as e:
+                logger.warning(f"RPC connection lost, reconnecting: {str(e)}")
+
+        self.close()
+        self.connection = self._transport.connect()
+        self.channel = self.connection.channel()
+        self.channel.basic_consume(
+            queue=REPLY_QUEUE,
+            on_message_callback=self._on_response,
+            auto_ack=True
+        )
+        self.confirm_channel = None
+        self._responses = {}
+        logger.info("RPC client connection established")
+
+    def _ensure_confirm_channel(self):
+        self._ensure_connection()
+
+        if self.confirm_channel is None or not self.confirm_channel.is_open:
+            self.confirm_channel = self.connection.channel()
+            self.confirm_channel.confirm_delivery()
+
+        return self.confirm_channel
+
+    def _on_response(self, ch, method, properties, body):
+        corr_id = properties.correlation_id
+        response = self._responses.get(corr_id, None)
+
+        if response is not _PENDING and not isinstance(response, _Stream):
+            logger.debug(f"Discarding late or unknown reply: {corr_id}")
+            return
+
+        headers = properties.headers or {}
+        if STREAM_SEQ_HEADER in headers:
+            if response is _PENDING:
+                response = self._responses[corr_id] = _Stream()
+            self._on_stream_chunk(response, headers, properties, body)
+            return
+
+        if isinstance(response, _Stream):
+            return
+
+        try:
+            message = get_codec(properties.content_type).decode(body)
+            if message.get('error'):
+                self._responses[corr_id] = RpcError(message['error'])
+            else:
+                self._responses[corr_id] = message['data']
+        except Exception:
+            self._responses[corr_id] = body.decode(errors='replace')
+
+    def _on_stream_chunk(self, stream, headers, properties, body):
+        try:
+            message = get_codec(properties.content_type).decode(body)
+            if message.get('error'):
+                stream.error = RpcError(message['error'])
+            elif message.get('data'):
+                stream.chunks.append(message['data'])
+        except Exception:
+            stream.error = RpcError("Invalid stream chunk")
+
+        stream.ended = stream.error is not None or bool(headers.get(STREAM_END_HEADER))
+
+    def _is_pending(self, corr_id):
+        response = self._responses.get(corr_id, None)
+        return response is _PENDING or (isinstance(response, _Stream) and not response.ended)
+
+    def _take(self, corr_id):
+        if corr_id not in self._responses:
+            # A reconnect dropped the reply consumer this call was waiting on
+            raise ConnectionError("Connection lost before a response was received")
+
+        response = self._responses.pop(corr_id)
+        if isinstance(response, _Stream):
+            if response.error is not None:
+                raise response.error
+            return [item for chunk in response.chunks for item in chunk]
+        if isinstance(response, RpcError):
+            raise response
+        return response
+
+    def send(self, queue_name, event_name, payload, timeout=10, content_type=None):
+        self._ensure_connection()
+
+        content_type = content_type or self.content_type
+        corr_id = str(uuid.uuid4())
+        message = {'event': event_name, 'data': payload}
+
+        self._responses[corr_id] = _PENDING
+        try:
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=queue_name,
+                body=get_codec(content_type).encode(message),
+                properties=pika.BasicProperties(
+                    reply_to=REPLY_QUEUE,
+                    correlation_id=corr_id,
+                    delivery_mode=2,
+                    content_type=content_type,
+                    headers={
+                        'accept': content_type,
+                        DEADLINE_HEADER: int((time.time() + timeout) * 1000)
+                    },
+                    expiration=str(int(timeout * 1000))
+                )
+            )
+        except Exception:
+            self._responses.pop(corr_id, None)
+            raise
+
+        return corr_id
+
+    def wait(self, corr_id, timeout=10):
+        deadline = time.time() + timeout
+        try:
+            while self._is_pending(corr_id):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("No response received in time")
+                self.connection.process_data_events(time_limit=min(remaining, 1))
+
+            return self._take(corr_id)
+        finally:
+            self._responses.pop(corr_id, None)
+
+    def call(self, queue_name, event_name, payload, timeout=10, content_type=None):
+        try:
+            corr_id = self.send(queue_name, event_name, payload, timeout, content_type)
+        except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+            logger.warning(f"RPC publish failed, reconnecting: {str(e)}")
+            self.close()
+            corr_id = self.send(queue_name, event_name, payload, timeout, content_type)
+
+        return self.wait(corr_id, timeout)
+
+    def stream(self, queue_name, event_name, payload, timeout=60, content_type=None):
+        # Yields chunks as they arrive instead of buffering the whole reply
+        corr_id = self.send(queue_name, event_name, payload, timeout, content_type)
+        deadline = time.time() + timeout
+
+        try:
+            while True:
+                response = self._responses.get(corr_id, None)
+
+                if isinstance(response, _Stream) and response.chunks:
+                    yield response.chunks.popleft()
+                    continue
+
+                if not self._is_pending(corr_id):
+                    result = self._take(corr_id)
+                    if not isinstance(response, _Stream):
+                        # Peer answered with a plain reply
+                        yield result
+                    return
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError("No response received in time")
+                self.connection.process_data_events(time_limit=min(remaining, 1))
+        finally:
+            self._responses.pop(corr_id, None)
+
+    def call_many(self, requests, timeout=10, content_type=None):
+        deadline = time.time() + timeout
+        results = [None] * len(requests)
+        errors = {}
+        pending = {}
+
+        for index, (queue_name, event_name, payload) in enumerate(requests):
+            try:
+                pending[self.send(queue_name, event_name, payload, timeout, content_type)] = index
+            except Exception as e:
+                logger.error(f"Failed to publish {event_name}: {str(e)}")
+                errors[index] = e
+
+        try:
+            while pending:
+                for corr_id in [c for c in pending if not self._is_pending(c)]:
+                    index = pending.pop(corr_id)
+                    try:
+                        results[index] = self._take(corr_id)
+                    except Exception as e:
+                        errors[index] = e
+
+                if not pending:
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    for index in pending.values():
+                        errors[index] = TimeoutError("No response received in time")
+                    break
+
+                self.connection.process_data_events(time_limit=min(remaining, 1))
+        except Exception as e:
+            for index in pending.values():
+                errors[index] = e
+        finally:
+            for corr_id in pending:
+                self._responses.pop(corr_id, None)
+
+        return results, errors
+
+    def _publish_confirmed(self, queue_name, event_name, payload, content_type):
+        # Blocks until the broker confirms; raises NackError/UnroutableError otherwise
+        self._ensure_confirm_channel().basic_publish(
+            exchange='',
+            routing_key=queue_name,
+            body=get_codec(content_type).encode({'event': event_name, 'data': payload}),
+            properties=pika.BasicProperties(
+                delivery_mode=2,
+                content_type=content_type
+            ),
+            mandatory=True
+        )
+
+    def emit_many(self, messages, content_type=None):
+        content_type = content_type or self.content_type
+        confirmed = 0
+        retried = False
+
+        while confirmed < len(messages):
+            try:
+                self._publish_confirmed(*messages[confirmed], content_type)
+                confirmed += 1
+            except (pika.exceptions.NackError, pika.exceptions.UnroutableError):
+                raise
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                if retried:
+                    raise
+                logger.warning(f"Emit failed, reconnecting: {str(e)}")
+                self.close()
+                retried = True
+
+    def close(self):
+        try:
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+        finally:
+            self.connection = None
+            self.channel = None
+            self.confirm_channel = None
+            self._responses = {}
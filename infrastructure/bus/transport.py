@@ -0,0 +1,36 @@
+from .loopback import default_broker
+import pika
+import os
+
+class AmqpTransport:
+    def __init__(self, connection_params):
+        self.connection_params = connection_params
+
+    def connect(self):
+        return pika.BlockingConnection(self.connection_params)
+
+class LoopbackTransport:
+    def __init__(self, broker=None):
+        self.broker = broker or default_broker
+
+    def connect(self):
+        return self.broker.connect()
+
+def create_transport():
+    # BUS_TRANSPORT=loopback keeps every queue in-process (benchmarks, tests); default is RabbitMQ
+    if os.getenv('BUS_TRANSPORT', 'amqp') == 'loopback':
+        return LoopbackTransport()
+
+    return AmqpTransport(pika.ConnectionParameters(
+        host=os.getenv('BUS_HOST'),
+        port=int(os.getenv('BUS_PORT')),
+        credentials=pika.PlainCredentials(
+            username=os.getenv('BUS_USER'),
+            password=os.getenv('BUS_PASS')),
+        virtual_host=os.getenv('BUS_VHOST'),
+        heartbeat=30,  # Heartbeat reduzido para 30 segundos
+        blocked_connection_timeout=300,
+        connection_attempts=5,
+        retry_delay=5,
+        socket_timeout=10
+    ))
@@ -1,5 +1,5 @@
 from .migrations.migrations import run_migrations, create_database, database_exists
-from .utils.connection import get_db_connection
+from .utils.connection import get_db_connection, get_db_pool, get_db_read_pool
 import os
 
 def initialize_database():
@@ -12,13 +12,14 @@ def initialize_database():
         if not database_exists(admin_conn, target_db_name):
             print(f"Database {target_db_name} does not exist. Creating...")
             create_database(admin_conn)
-            admin_conn.close()
-
-            migration_conn = get_db_connection()
-            run_migrations(migration_conn)
-            migration_conn.close()
         else:
             print(f"Database {target_db_name} already exists. Skipping creation.")
+        admin_conn.close()
+
+        # Every start: existing deployments pick up migrations added since they were created
+        migration_conn = get_db_connection()
+        run_migrations(migration_conn)
+        migration_conn.close()
 
     except Exception as e:
         print(f"Error during database initialization: {e}")
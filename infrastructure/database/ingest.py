@@ -0,0 +1,84 @@
+from infrastructure.database.repositories import follower_repository
+import itertools
+import argparse
+import json
+import time
+import csv
+import sys
+
+# Streams follow-graph edge files into the followers table:
+#   python -m infrastructure.database.ingest edges.csv other.ndjson --batch-size 50000
+# CSV needs follower_id,following_id columns (header optional), NDJSON one object per line.
+
+def _detect_format(path):
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+def read_edges(lines, fmt='csv'):
+    if fmt == 'ndjson':
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield record['follower_id'], record['following_id']
+        return
+
+    reader = csv.reader(lines)
+    columns = (0, 1)
+    for row in reader:
+        if not row:
+            continue
+        if not row[0].strip().isdigit():
+            # Header row: pick the columns by name, in any order
+            columns = (row.index('follower_id'), row.index('following_id'))
+            continue
+        yield row[columns[0]], row[columns[1]]
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+def ingest(edges, batch_size=10000, skip_conflicts=True, method='copy', report=print):
+    received = inserted = 0
+    started = time.perf_counter()
+
+    for batch in batched(edges, batch_size):
+        if method == 'copy':
+            batch_received, batch_inserted = follower_repository.copy_edges(batch, skip_conflicts)
+        else:
+            rows = [
+                { 'follower_id': int(follower_id), 'following_id': int(following_id) }
+                for follower_id, following_id in batch if int(follower_id) != int(following_id)
+            ]
+            conflict_columns = ('follower_id', 'following_id') if skip_conflicts else None
+            batch_received, batch_inserted = len(batch), follower_repository.insert_many(rows, conflict_columns)
+
+        received += batch_received
+        inserted += batch_inserted
+        elapsed = time.perf_counter() - started
+        report(f"{received} rows read, {inserted} inserted, {received / elapsed:.0f} rows/sec")
+
+    return received, inserted, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk load follower edges from CSV/NDJSON files")
+    parser.add_argument('files', nargs='+', help="edge files, '-' reads stdin")
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help="default: from the file extension")
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows per transaction")
+    parser.add_argument('--method', choices=['copy', 'values'], default='copy')
+    parser.add_argument('--fail-on-conflict', action='store_true', help="abort a batch on an existing edge instead of skipping it")
+    args = parser.parse_args(argv)
+
+    def edges():
+        for path in args.files:
+            fmt = args.format or _detect_format(path)
+            if path == '-':
+                yield from read_edges(sys.stdin, fmt)
+                continue
+            with open(path, newline='') as file:
+                yield from read_edges(file, fmt)
+
+    received, inserted, elapsed = ingest(edges(), args.batch_size, not args.fail_on_conflict, args.method)
+    print(f"Done: {received} rows read, {inserted} inserted in {elapsed:.1f}s ({received / max(elapsed, 1e-9):.0f} rows/sec)")
+
+if __name__ == '__main__':
+    main()
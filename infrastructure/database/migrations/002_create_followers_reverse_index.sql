@@ -0,0 +1,4 @@
+-- Reverse direction (who follows following_id): index-only scans for followers lists,
+-- counts and recommendation lookups
+CREATE INDEX IF NOT EXISTS followers_following_id_idx
+    ON followers (following_id, follower_id) INCLUDE (created_at);
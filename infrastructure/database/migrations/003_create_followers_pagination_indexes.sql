@@ -0,0 +1,6 @@
+-- Keyset pagination (GenericRepository.find_page): ORDER BY created_at DESC, id DESC per user
+CREATE INDEX IF NOT EXISTS followers_follower_id_created_at_idx
+    ON followers (follower_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS followers_following_id_created_at_idx
+    ON followers (following_id, created_at DESC, id DESC);
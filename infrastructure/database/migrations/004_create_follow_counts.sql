@@ -0,0 +1,19 @@
+-- Denormalized degrees, kept in step with followers by FollowersRepository.follow/unfollow
+CREATE TABLE IF NOT EXISTS follow_counts (
+    user_id BIGINT PRIMARY KEY,
+    followers_count BIGINT NOT NULL DEFAULT 0,
+    following_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Backfill from the edges already present
+INSERT INTO follow_counts (user_id, followers_count, following_count)
+SELECT user_id, SUM(followers_count), SUM(following_count) FROM (
+    SELECT following_id AS user_id, COUNT(*) AS followers_count, 0 AS following_count FROM followers GROUP BY following_id
+    UNION ALL
+    SELECT follower_id AS user_id, 0 AS followers_count, COUNT(*) AS following_count FROM followers GROUP BY follower_id
+) AS degrees
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET
+    followers_count = excluded.followers_count,
+    following_count = excluded.following_count;
@@ -0,0 +1,2 @@
+-- Incremental graph sync (infrastructure.graph) reads the edges created since its last pass
+CREATE INDEX IF NOT EXISTS followers_created_at_idx ON followers (created_at);
@@ -0,0 +1,2 @@
+-- Incremental graph sync (infrastructure.graph) re-reads the users whose follows changed since its last pass
+CREATE INDEX IF NOT EXISTS follow_counts_updated_at_idx ON follow_counts (updated_at);
@@ -1,13 +1,18 @@
 import os
 
-def _execute_sql_scripts(db_connection, directory, suffix_filter=None):
-    scripts = [
+MIGRATIONS_TABLE = 'schema_migrations'
+
+def _list_scripts(directory, suffix_filter=None):
+    return [
         f for f in sorted(os.listdir(directory))
         if f.endswith('.sql') and 
            (suffix_filter is not None and f.endswith(suffix_filter) or
            suffix_filter is None and not f.endswith('database.sql'))
     ]
 
+def _execute_sql_scripts(db_connection, directory, suffix_filter=None):
+    scripts = _list_scripts(directory, suffix_filter)
+
     with db_connection as conn:
         with conn.cursor() as cur:
             for filename in scripts:
@@ -20,13 +25,59 @@ def _execute_sql_scripts(db_connection, directory, suffix_filter=None):
 
         conn.commit()
 
+def _applied_versions(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT version FROM {table}")
+        versions = {row['version'] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
 def create_database(db_connection):
     directory = os.path.dirname(__file__)
     _execute_sql_scripts(db_connection, directory, suffix_filter='database.sql')
 
-def run_migrations(db_connection):
-    directory = os.path.dirname(__file__)
-    _execute_sql_scripts(db_connection, directory)
+def run_migrations(db_connection, directory=None, table=MIGRATIONS_TABLE):
+    # Applies every script not yet recorded in the migrations table, one transaction each, so it is
+    # safe to run on every start. Workers racing on the same script collide on the version primary
+    # key (or on the DDL itself): the loser rolls back and skips it once the winner has committed.
+    directory = directory or os.path.dirname(__file__)
+    conn = db_connection
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+    applied = _applied_versions(conn, table)
+    executed = []
+
+    for filename in _list_scripts(directory):
+        version = filename[:-len('.sql')]
+        if version in applied:
+            continue
+
+        with open(os.path.join(directory, filename), 'r') as file:
+            raw_sql = file.read()
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(raw_sql)
+                cur.execute(f"INSERT INTO {table} (version) VALUES (%s)", (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if version not in _applied_versions(conn, table):
+                raise
+            continue
+
+        executed.append(version)
+        print(f"Executed {filename}")
+
+    return executed
 
 def database_exists(db_connection, db_name):
     with db_connection.cursor() as cur:
@@ -1,3 +1,5 @@
+from .follow_counts import FollowCountsRepository
 from .followers import FollowersRepository
 
-follower_repository = FollowersRepository()
+follow_counts_repository = FollowCountsRepository()
+follower_repository = FollowersRepository(follow_counts_repository)
@@ -0,0 +1,64 @@
+from infrastructure.database.utils import statements
+from psycopg2.extras import execute_values
+from .generic import GenericRepository
+from collections import Counter
+
+class FollowCountsRepository(GenericRepository):
+    def __init__(self):
+        super().__init__("follow_counts", ('user_id', 'followers_count', 'following_count', 'updated_at'))
+
+    def adjust(self, conn, cur, follower_id, following_id, delta):
+        # Runs inside the caller's edge insert/delete transaction. Rows are written in user_id order
+        # so concurrent follows touching the same two users cannot deadlock.
+        rows = sorted([(int(following_id), delta, 0), (int(follower_id), 0, delta)])
+        statement = self._statement(('adjust',), lambda: f"""
+            INSERT INTO {self.table_name} (user_id, followers_count, following_count)
+            VALUES (%s, %s, %s), (%s, %s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET
+                followers_count = {self.table_name}.followers_count + excluded.followers_count,
+                following_count = {self.table_name}.following_count + excluded.following_count,
+                updated_at = CURRENT_TIMESTAMP
+        """)
+        statements.execute(conn, cur, statement, [value for row in rows for value in row])
+
+    def adjust_many(self, conn, cur, edges, delta):
+        # Bulk variant for COPY/multi-row writes: degrees are aggregated first, one upsert row per user
+        followers, following = Counter(), Counter()
+        for follower_id, following_id in edges:
+            followers[int(following_id)] += delta
+            following[int(follower_id)] += delta
+
+        rows = [(user_id, followers[user_id], following[user_id]) for user_id in sorted(followers.keys() | following.keys())]
+        if not rows:
+            return
+
+        execute_values(cur, f"""
+            INSERT INTO {self.table_name} (user_id, followers_count, following_count) VALUES %s
+            ON CONFLICT (user_id) DO UPDATE SET
+                followers_count = {self.table_name}.followers_count + excluded.followers_count,
+                following_count = {self.table_name}.following_count + excluded.following_count,
+                updated_at = CURRENT_TIMESTAMP
+        """, rows, page_size=len(rows))
+
+    def counts(self, user_ids, stale=None):
+        # { user_id: { 'followers': n, 'following': m } } in one query; unknown users count as zero
+        user_ids = [str(user_id) for user_id in user_ids]
+        result = { user_id: { 'followers': 0, 'following': 0 } for user_id in user_ids }
+        if not user_ids:
+            return result
+
+        statement = self._statement(('counts',), lambda: (
+            f"SELECT user_id, followers_count, following_count FROM {self.table_name} "
+            f"WHERE user_id = ANY(%s::TEXT[]::BIGINT[])"
+        ))
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, (user_ids,))
+                for row in cur.fetchall():
+                    result[str(row['user_id'])] = {
+                        'followers': row['followers_count'],
+                        'following': row['following_count'],
+                    }
+
+        return result
@@ -1,5 +1,295 @@
+from infrastructure.database.utils.connection import get_db_pool
+from infrastructure.database.utils import statements
 from .generic import GenericRepository
+import uuid
+import io
 
 class FollowersRepository(GenericRepository):
-    def __init__(self):
-        super().__init__("followers")
+    _write_many_returning = ('follower_id', 'following_id')
+
+    def __init__(self, counts_repository):
+        super().__init__("followers", ('id', 'follower_id', 'following_id', 'created_at'))
+        self.counts_repository = counts_repository
+
+    def _after_write_many(self, conn, cur, operation, written):
+        edges = [(row['follower_id'], row['following_id']) for row in written]
+        self.counts_repository.adjust_many(conn, cur, edges, 1 if operation == 'insert' else -1)
+
+    def follow(self, follower_id, following_id):
+        # Edge and both counters commit together; False when the edge already existed
+        statement = self._statement(('follow',), lambda: (
+            f"INSERT INTO {self.table_name} (follower_id, following_id) VALUES (%s, %s) "
+            f"ON CONFLICT (follower_id, following_id) DO NOTHING RETURNING id"
+        ))
+
+        with get_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, (follower_id, following_id))
+                created = cur.fetchone() is not None
+                if created:
+                    self.counts_repository.adjust(conn, cur, follower_id, following_id, 1)
+                conn.commit()
+
+        return created
+
+    def unfollow(self, follower_id, following_id):
+        statement = self._statement(('unfollow',), lambda: (
+            f"DELETE FROM {self.table_name} WHERE follower_id = %s AND following_id = %s RETURNING id"
+        ))
+
+        with get_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, (follower_id, following_id))
+                deleted = cur.fetchone() is not None
+                if deleted:
+                    self.counts_repository.adjust(conn, cur, follower_id, following_id, -1)
+                conn.commit()
+
+        return deleted
+
+    def following_among(self, follower_id, candidate_ids, stale=None):
+        # Which of candidate_ids does follower_id follow, in one round trip instead of one query each
+        candidate_ids = [str(candidate_id) for candidate_id in candidate_ids]
+        if not candidate_ids:
+            return set()
+
+        statement = self._statement(('following_among',), lambda: (
+            f"SELECT following_id FROM {self.table_name} WHERE follower_id = %s AND following_id = ANY(%s::TEXT[]::BIGINT[])"
+        ))
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, (follower_id, candidate_ids))
+                return {str(row['following_id']) for row in cur.fetchall()}
+
+    def _walk(self, alias, follower, capped):
+        if not capped:
+            return f"JOIN {self.table_name} AS {alias} ON {alias}.follower_id = {follower}"
+        return (
+            f"JOIN LATERAL (SELECT following_id FROM {self.table_name} WHERE follower_id = {follower} "
+            f"ORDER BY created_at DESC LIMIT %s) AS {alias} ON TRUE"
+        )
+
+    def friends_of_friends(self, user_ids, limit=50, stale=None, max_friends=None, max_fanout=None, stats=None):
+        # Top-k accounts followed by the people each user follows, for the whole batch in one query:
+        # ranked by how many of the user's followees follow them, excluding the user and anyone already
+        # followed. Returns { user_id: [(candidate_id, mutual_count), ...] } best first.
+        # max_friends / max_fanout only walk the most recent followees of the user and of each
+        # followee (None walks all of them), bounding the work for high-degree accounts. When a dict
+        # is given as `stats`, the same query also fills in per-user work counters, keyed like the
+        # graph engine's: followees and second-degree edges in total and walked, and distinct candidates.
+        user_ids = [str(user_id) for user_id in user_ids]
+        result = { user_id: [] for user_id in user_ids }
+        if not user_ids:
+            return result
+
+        # Uncapped batches keep plain joins: the ordered LATERAL walk costs more than it saves there
+        capped = max_friends is not None or max_fanout is not None
+        counted = stats is not None
+        statement = self._statement(('friends_of_friends', capped, counted), lambda: f"""
+            WITH users AS (
+                SELECT DISTINCT unnest(%s::TEXT[]::BIGINT[]) AS user_id
+            ), friends AS (
+                SELECT users.user_id, first.following_id AS friend_id
+                FROM users
+                {self._walk('first', 'users.user_id', capped)}
+            ), walked AS (
+                SELECT friends.user_id, second.following_id AS candidate_id
+                FROM friends
+                {self._walk('second', 'friends.friend_id', capped)}
+            ), candidates AS (
+                SELECT user_id, candidate_id, COUNT(*) AS mutual
+                FROM walked
+                WHERE candidate_id <> user_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM {self.table_name} AS existing
+                      WHERE existing.follower_id = walked.user_id AND existing.following_id = walked.candidate_id
+                  )
+                GROUP BY user_id, candidate_id
+            ), ranked AS (
+                SELECT user_id, candidate_id, mutual,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY mutual DESC, candidate_id) AS position,
+                       COUNT(*) OVER (PARTITION BY user_id) AS candidates
+                FROM candidates
+            ){self._ranked_rows(counted)}
+        """)
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor() as cur:
+                values = (user_ids, max_friends, max_fanout, limit) if capped else (user_ids, limit)
+                statements.execute(conn, cur, statement, values)
+                for row in cur.fetchall():
+                    user_id = str(row['user_id'])
+                    if counted:
+                        stats[user_id] = {
+                            'friends': int(row['friends']),
+                            'friends_walked': int(row['friends_walked']),
+                            'edges': int(row['edges']),
+                            'edges_walked': int(row['edges_walked']),
+                            'candidates': int(row['candidates'] or 0),
+                        }
+                    if row['candidate_id'] is not None:
+                        result[user_id].append((str(row['candidate_id']), row['mutual']))
+
+        return result
+
+    def _ranked_rows(self, counted):
+        if not counted:
+            return """
+            SELECT user_id, candidate_id, mutual FROM ranked
+            WHERE position <= %s
+            ORDER BY user_id, position"""
+
+        # Every user gets a row, even with nothing to recommend. Totals come from the degree counters,
+        # so the uncapped follow lists are not walked just to report how much a cap saved.
+        counts = self.counts_repository.table_name
+        return f""", work AS (
+                SELECT users.user_id,
+                       COALESCE(own.following_count, 0) AS friends,
+                       COALESCE(friends_walked.count, 0) AS friends_walked,
+                       COALESCE(edges.count, 0) AS edges,
+                       COALESCE(edges_walked.count, 0) AS edges_walked
+                FROM users
+                LEFT JOIN {counts} AS own ON own.user_id = users.user_id
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS count FROM friends GROUP BY user_id
+                ) AS friends_walked ON friends_walked.user_id = users.user_id
+                LEFT JOIN (
+                    SELECT everyone.follower_id AS user_id, SUM(degree.following_count) AS count
+                    FROM users
+                    JOIN {self.table_name} AS everyone ON everyone.follower_id = users.user_id
+                    JOIN {counts} AS degree ON degree.user_id = everyone.following_id
+                    GROUP BY everyone.follower_id
+                ) AS edges ON edges.user_id = users.user_id
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS count FROM walked GROUP BY user_id
+                ) AS edges_walked ON edges_walked.user_id = users.user_id
+            )
+            SELECT work.*, ranked.candidate_id, ranked.mutual, ranked.candidates
+            FROM work
+            LEFT JOIN ranked ON ranked.user_id = work.user_id AND ranked.position <= %s
+            ORDER BY work.user_id, ranked.position"""
+
+    def edge_neighbourhood(self, follower_id, following_id):
+        # Friend-of-friend pairs a single edge follower -> following contributes to: every account the
+        # followed user follows becomes a candidate for the follower, and the followed user becomes a
+        # candidate for everyone who follows the follower. Pairs that are already follows, or the user
+        # themselves, are left out. Fresh read: runs right after the edge was written.
+        statement = self._statement(('edge_neighbourhood',), lambda: f"""
+            SELECT 'candidate' AS kind, second.following_id AS user_id
+            FROM {self.table_name} AS second
+            WHERE second.follower_id = %s AND second.following_id <> %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM {self.table_name} AS existing
+                  WHERE existing.follower_id = %s AND existing.following_id = second.following_id
+              )
+            UNION ALL
+            SELECT 'owner' AS kind, first.follower_id AS user_id
+            FROM {self.table_name} AS first
+            WHERE first.following_id = %s AND first.follower_id <> %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM {self.table_name} AS existing
+                  WHERE existing.follower_id = first.follower_id AND existing.following_id = %s
+              )
+        """)
+
+        candidates, owners = [], []
+        with get_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, (
+                    following_id, follower_id, follower_id,
+                    follower_id, following_id, following_id,
+                ))
+                for row in cur.fetchall():
+                    (candidates if row['kind'] == 'candidate' else owners).append(str(row['user_id']))
+
+        return candidates, owners
+
+    def mutual_count(self, user_id, candidate_id):
+        # How many of user_id's followees follow candidate_id
+        statement = self._statement(('mutual_count',), lambda: (
+            f"SELECT COUNT(*) AS mutual FROM {self.table_name} AS first "
+            f"JOIN {self.table_name} AS second ON second.follower_id = first.following_id "
+            f"WHERE first.follower_id = %s AND second.following_id = %s"
+        ))
+
+        with get_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, (user_id, candidate_id))
+                return cur.fetchone()['mutual']
+
+    def iter_edge_chunks(self, since=None, chunk_size=50000, stale=True):
+        # Whole edge list (or the edges created since a timestamp) through a server-side cursor
+        query = f"SELECT follower_id, following_id, created_at FROM {self.table_name}"
+        values = ()
+        if since is not None:
+            query += " WHERE created_at >= %s"
+            values = (since,)
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor(name=f"{self.table_name}_edges_{uuid.uuid4().hex}") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query, values)
+                while rows := cur.fetchmany(chunk_size):
+                    yield rows
+
+    def iter_changed_following(self, since, chunk_size=50000, stale=False):
+        # Complete current followee lists of every user whose follow counts moved since a timestamp:
+        # follow and unfollow both touch follow_counts.updated_at, so this also surfaces removals. A
+        # user left with no followees comes back as one row with a NULL following_id. Fresh by
+        # default: a lagging replica would hand back edges that were already unfollowed.
+        query = (
+            f"SELECT c.user_id, f.following_id, c.updated_at FROM {self.counts_repository.table_name} AS c "
+            f"LEFT JOIN {self.table_name} AS f ON f.follower_id = c.user_id WHERE c.updated_at >= %s"
+        )
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor(name=f"{self.table_name}_changed_{uuid.uuid4().hex}") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query, (since,))
+                while rows := cur.fetchmany(chunk_size):
+                    yield rows
+
+    def copy_edges(self, edges, skip_conflicts=True):
+        # Bulk load (follower_id, following_id) pairs with COPY in one transaction. COPY itself has no
+        # conflict handling, so with skip_conflicts the batch lands in a staging table first and is moved
+        # over with ON CONFLICT DO NOTHING (duplicates inside the batch and self-follows are dropped too).
+        # Returns (rows received, rows inserted).
+        buffer = io.StringIO()
+        received = []
+        for follower_id, following_id in edges:
+            buffer.write(f"{int(follower_id)},{int(following_id)}\n")
+            received.append((int(follower_id), int(following_id)))
+
+        if not received:
+            return 0, 0
+        buffer.seek(0)
+
+        with get_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                if not skip_conflicts:
+                    cur.copy_expert(f"COPY {self.table_name} (follower_id, following_id) FROM STDIN WITH (FORMAT csv)", buffer)
+                    self.counts_repository.adjust_many(conn, cur, received, 1)
+                    conn.commit()
+                    return len(received), len(received)
+
+                if conn.get_parameter_status('crdb_version'):
+                    cur.execute("SET experimental_enable_temp_tables = 'on'")
+
+                # Session-scoped and reused by later batches on this pooled connection (CockroachDB has no ON COMMIT DROP)
+                cur.execute("CREATE TEMP TABLE IF NOT EXISTS followers_staging (follower_id BIGINT, following_id BIGINT)")
+                cur.copy_expert("COPY followers_staging (follower_id, following_id) FROM STDIN WITH (FORMAT csv)", buffer)
+                cur.execute(f"""
+                    INSERT INTO {self.table_name} (follower_id, following_id)
+                    SELECT DISTINCT follower_id, following_id FROM followers_staging
+                    WHERE follower_id <> following_id
+                    ON CONFLICT (follower_id, following_id) DO NOTHING
+                    RETURNING follower_id, following_id
+                """)
+                inserted_edges = [(row['follower_id'], row['following_id']) for row in cur.fetchall()]
+                self.counts_repository.adjust_many(conn, cur, inserted_edges, 1)
+                inserted = len(inserted_edges)
+                cur.execute("DELETE FROM followers_staging")
+                conn.commit()
+
+        return len(received), inserted
@@ -1,72 +1,224 @@
-from infrastructure.database.utils.connection import get_db_connection
+from infrastructure.database.utils.cursor import encode_cursor, decode_cursor
+from infrastructure.database.utils.connection import get_db_pool, get_db_read_pool
+from infrastructure.database.utils.statements import Statement, validate_identifier
+from infrastructure.database.utils import statements
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+import uuid
 
 class GenericRepository:
-    def __init__(self, table_name):
-        self.table_name = table_name
+    def __init__(self, table_name, columns=None, stale_reads=False):
+        self.table_name = validate_identifier(table_name)
+        # Known columns: every name that reaches SQL text is checked against them
+        self.columns = frozenset(columns) if columns else None
+        # Default for read methods; each one also takes stale=True/False per call
+        self.stale_reads = stale_reads
+        self._statements = {}
+
+    @contextmanager
+    def _read_connection(self, stale=None):
+        # Stale reads may lag a few seconds behind writes. They go to the read-only DSN when configured;
+        # on CockroachDB they also pin the transaction to follower_read_timestamp(), so the closest
+        # replica serves them instead of the leaseholder.
+        stale = self.stale_reads if stale is None else stale
+
+        with (get_db_read_pool() if stale else get_db_pool()).connection() as conn:
+            if stale and conn.get_parameter_status('crdb_version'):
+                with conn.cursor() as cur:
+                    cur.execute("SET TRANSACTION AS OF SYSTEM TIME follower_read_timestamp()")
+            yield conn
+
+    def _columns(self, names):
+        return [validate_identifier(name, self.columns) for name in names]
+
+    def _where(self, columns):
+        return " AND ".join([f"{column} = %s" for column in self._columns(columns)])
+
+    def _statement(self, key, build):
+        # Compiled once per (operation, columns) shape, then prepared once per pooled connection
+        statement = self._statements.get(key)
+        if statement is None:
+            statement = self._statements[key] = Statement(build())
+        return statement
 
     def insert(self, data: dict):
-        keys = data.keys()
-        values = data.values()
-        columns = ','.join(keys)
-        placeholders = ','.join(['%s'] * len(values))
+        columns = tuple(data.keys())
+        statement = self._statement(('insert', columns), lambda: (
+            f"INSERT INTO {self.table_name} ({','.join(self._columns(columns))}) "
+            f"VALUES ({','.join(['%s'] * len(columns))}) RETURNING *"
+        ))
         
-        query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders}) RETURNING *"
-        
-        with get_db_connection() as conn:
+        with get_db_pool().connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(query, tuple(values))
+                statements.execute(conn, cur, statement, data.values())
                 inserted_record = cur.fetchone()
                 conn.commit()
                 return inserted_record
 
+    def insert_many(self, rows: list, conflict_columns: tuple = None, page_size: int = 1000):
+        # Multi-row VALUES, one statement per page and one transaction overall. With conflict_columns,
+        # rows that hit that unique constraint are skipped. Returns the number of rows actually inserted.
+        if not rows:
+            return 0
+
+        columns = self._columns(rows[0].keys())
+        query = f"INSERT INTO {self.table_name} ({','.join(columns)}) VALUES %s"
+        if conflict_columns:
+            query += f" ON CONFLICT ({','.join(self._columns(conflict_columns))}) DO NOTHING"
+
+        return self._write_many('insert', query, columns, rows, page_size)
 
-    def find_by(self, conditions: dict, page: int = 1, size: int = 10):
+    def find_by(self, conditions: dict, page: int = 1, size: int = 10, stale: bool = None):
         if not conditions:
             raise ValueError("Conditions dictionary cannot be empty")
 
-        clause_parts = [f"{key} = %s" for key in conditions]
-        where_clause = " AND ".join(clause_parts)
-        values = list(conditions.values())
-
+        columns = tuple(conditions.keys())
         offset = (page - 1) * size
-        query = f"SELECT * FROM {self.table_name} WHERE {where_clause} LIMIT %s OFFSET %s"
+        values = [*conditions.values(), size]
 
-        values.extend([size, offset])
+        # First pages get their own shape: with an OFFSET parameter Postgres keeps re-planning
+        # (custom plans) and the prepared statement would only save the parse
+        statement = self._statement(('find_by', columns, bool(offset)), lambda: (
+            f"SELECT * FROM {self.table_name} WHERE {self._where(columns)} LIMIT %s" + (" OFFSET %s" if offset else "")
+        ))
+        if offset:
+            values.append(offset)
 
-        with get_db_connection() as conn:
+        with self._read_connection(stale) as conn:
             with conn.cursor() as cur:
-                cur.execute(query, tuple(values))
+                statements.execute(conn, cur, statement, values)
                 return cur.fetchall()
             
+    def iter_by(self, conditions: dict, fetch_size: int = 1000, stale: bool = None):
+        # Named (server-side) cursor: rows arrive fetch_size at a time, memory stays bounded.
+        # DECLARE cannot wrap EXECUTE, so this one is not prepared.
+        if not conditions:
+            raise ValueError("Conditions dictionary cannot be empty")
+
+        query = f"SELECT * FROM {self.table_name} WHERE {self._where(conditions)} ORDER BY id"
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor(name=f"{self.table_name}_{uuid.uuid4().hex}") as cur:
+                cur.itersize = fetch_size
+                cur.execute(query, tuple(conditions.values()))
+                for row in cur:
+                    yield row
+
+    def iter_chunks(self, conditions: dict, chunk_size: int = 1000, stale: bool = None):
+        chunk = []
+        for row in self.iter_by(conditions, fetch_size=chunk_size, stale=stale):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def find_page(self, conditions: dict, size: int = 10, cursor: str = None, order_by: tuple = ('created_at', 'id'), stale: bool = None):
+        # Keyset pagination, newest first: every page is the same index range scan however deep it is
+        if not conditions:
+            raise ValueError("Conditions dictionary cannot be empty")
+
+        columns = tuple(conditions.keys())
+        order_by = tuple(order_by)
+
+        def build():
+            clause_parts = [self._where(columns)]
+            if cursor:
+                clause_parts.append(f"({', '.join(self._columns(order_by))}) < ({', '.join(['%s'] * len(order_by))})")
+            order_clause = ", ".join(f"{column} DESC" for column in self._columns(order_by))
+            return f"SELECT * FROM {self.table_name} WHERE {' AND '.join(clause_parts)} ORDER BY {order_clause} LIMIT %s"
+
+        statement = self._statement(('find_page', columns, order_by, bool(cursor)), build)
+
+        values = list(conditions.values())
+        if cursor:
+            values.extend(decode_cursor(cursor, len(order_by)))
+
+        # One extra row tells whether another page exists without a COUNT
+        values.append(size + 1)
+
+        with self._read_connection(stale) as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, values)
+                rows = cur.fetchall()
+
+        if len(rows) <= size:
+            return rows, None
+
+        rows = rows[:size]
+        return rows, encode_cursor([rows[-1][column] for column in order_by])
+
     def update_by(self, conditions: dict, updates: dict):
         if not conditions:
             raise ValueError("Conditions dictionary cannot be empty")
         if not updates:
             raise ValueError("Updates dictionary cannot be empty")
 
-        set_clause = ", ".join([f"{key} = %s" for key in updates])
-        where_clause = " AND ".join([f"{key} = %s" for key in conditions])
-
-        query = f"UPDATE {self.table_name} SET {set_clause} WHERE {where_clause}"
+        columns = tuple(conditions.keys())
+        update_columns = tuple(updates.keys())
+        statement = self._statement(('update_by', columns, update_columns), lambda: (
+            f"UPDATE {self.table_name} SET {', '.join([f'{column} = %s' for column in self._columns(update_columns)])} "
+            f"WHERE {self._where(columns)}"
+        ))
 
         values = tuple(updates.values()) + tuple(conditions.values())
 
-        with get_db_connection() as conn:
+        with get_db_pool().connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(query, values)
+                statements.execute(conn, cur, statement, values)
                 conn.commit()
 
     def delete_by(self, conditions: dict):
         if not conditions:
             raise ValueError("Conditions dictionary cannot be empty")
 
-        clause_parts = [f"{key} = %s" for key in conditions]
-        where_clause = " AND ".join(clause_parts)
-        values = tuple(conditions.values())
+        columns = tuple(conditions.keys())
+        statement = self._statement(('delete_by', columns), lambda: (
+            f"DELETE FROM {self.table_name} WHERE {self._where(columns)}"
+        ))
 
-        query = f"DELETE FROM {self.table_name} WHERE {where_clause}"
+        with get_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                statements.execute(conn, cur, statement, conditions.values())
+                conn.commit()
+
+    def delete_many(self, rows: list, page_size: int = 1000):
+        # Deletes every row matching one of the given key dicts (all with the same keys); values must
+        # already carry the column types, VALUES lists are not coerced like bound parameters are
+        if not rows:
+            return 0
+
+        columns = self._columns(rows[0].keys())
+        match_clause = " AND ".join([f"{self.table_name}.{column} = v.{column}" for column in columns])
+        query = f"DELETE FROM {self.table_name} USING (VALUES %s) AS v ({','.join(columns)}) WHERE {match_clause}"
+
+        return self._write_many('delete', query, columns, rows, page_size)
 
-        with get_db_connection() as conn:
+    # Subclasses that keep derived data (counters) in step with bulk writes set the columns to return
+    # and get every written page back inside the same transaction
+    _write_many_returning = None
+
+    def _after_write_many(self, conn, cur, operation, written):
+        pass
+
+    def _write_many(self, operation, query, columns, rows, page_size):
+        if self._write_many_returning:
+            query += f" RETURNING {', '.join(f'{self.table_name}.{column}' for column in self._write_many_returning)}"
+
+        affected = 0
+        with get_db_pool().connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(query, values)
+                for start in range(0, len(rows), page_size):
+                    page = [tuple(row[column] for column in columns) for row in rows[start:start + page_size]]
+                    if self._write_many_returning:
+                        written = execute_values(cur, query, page, page_size=len(page), fetch=True)
+                        self._after_write_many(conn, cur, operation, written)
+                        affected += len(written)
+                    else:
+                        execute_values(cur, query, page, page_size=len(page))
+                        affected += cur.rowcount
                 conn.commit()
+
+        return affected
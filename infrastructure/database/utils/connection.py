@@ -1,9 +1,10 @@
 from psycopg2.extras import RealDictCursor
+from .pool import ConnectionPool
+import threading
 import psycopg2
 import os
 
 def get_db_connection(name = os.getenv('DB_NAME')):
-    print("Connecting to the database...")
     conn = psycopg2.connect(
         dbname = name,
         host = os.getenv('DB_HOST'),
@@ -16,3 +17,42 @@ def get_db_connection(name = os.getenv('DB_NAME')):
         cursor_factory=RealDictCursor
     )
     return conn
+
+def get_db_read_connection():
+    # Read-only endpoint (replica, regional load balancer) as a libpq DSN, certificates included
+    return psycopg2.connect(os.getenv('DB_READ_DSN'), cursor_factory=RealDictCursor)
+
+_pools = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _get_pool(name, connect):
+    # One pool per process: gunicorn forks workers, connections must never cross a fork
+    global _pool_pid
+
+    if name not in _pools or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pools.clear()
+                _pool_pid = os.getpid()
+            if name not in _pools:
+                _pools[name] = ConnectionPool(
+                    connect,
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    max_lifetime=int(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+                    max_idle=int(os.getenv('DB_POOL_MAX_IDLE', 300)),
+                    health_check_after=int(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30)),
+                    acquire_timeout=int(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 10)),
+                )
+
+    return _pools[name]
+
+def get_db_pool():
+    return _get_pool('primary', get_db_connection)
+
+def get_db_read_pool():
+    # Falls back to the primary pool when no read-only DSN is configured
+    if not os.getenv('DB_READ_DSN'):
+        return get_db_pool()
+    return _get_pool('read', get_db_read_connection)
@@ -0,0 +1,235 @@
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from contextlib import contextmanager
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class PoolTimeoutError(Exception):
+    pass
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect,
+        min_size=1,
+        max_size=10,
+        max_lifetime=1800,
+        max_idle=300,
+        health_check_after=30,
+        acquire_timeout=10,
+        reap_interval=60
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = {}
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'discarded': 0,
+            'failed_health_checks': 0,
+            'acquired': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+        if reap_interval:
+            self._reaper = threading.Thread(
+                target=self._reap_loop,
+                args=(reap_interval,),
+                daemon=True,
+                name="DatabasePoolReaper"
+            )
+            self._reaper.start()
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self):
+        entry = _PooledConnection(self._connect())
+        with self._cond:
+            self._stats['created'] += 1
+        return entry
+
+    def _discard(self, entry):
+        with self._cond:
+            self._stats['discarded'] += 1
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, entry, now):
+        return bool(self.max_lifetime) and now - entry.created_at > self.max_lifetime
+
+    def _healthy(self, entry, now):
+        if entry.conn.closed:
+            return False
+        if not self.health_check_after or now - entry.last_used < self.health_check_after:
+            return True
+
+        try:
+            with entry.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            entry.conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding unhealthy database connection: {str(e)}")
+            with self._cond:
+                self._stats['failed_health_checks'] += 1
+            return False
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Connection pool is closed")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self.size < self.max_size:
+                        self._opening += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(f"No database connection available within {timeout}s")
+                    self._cond.wait(remaining)
+
+            if entry is None:
+                # Connect outside the lock, TLS handshakes must not serialize other borrowers
+                try:
+                    entry = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+            else:
+                now = time.monotonic()
+                if self._expired(entry, now) or not self._healthy(entry, now):
+                    self._discard(entry)
+                    with self._cond:
+                        self._cond.notify()
+                    continue
+
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+                self._stats['acquired'] += 1
+                self._stats['wait_time_total'] += time.monotonic() - started
+
+            return entry.conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+
+        if entry is None:
+            return
+
+        now = time.monotonic()
+        entry.last_used = now
+
+        if not discard and not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            # Never hand out a connection with a transaction left open by the previous borrower
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard or conn.closed or self._closed or self._expired(entry, now):
+            self._discard(entry)
+        else:
+            with self._cond:
+                self._idle.append(entry)
+
+        with self._cond:
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            # Also reached on GeneratorExit when a streaming caller abandons iter_by early
+            self.release(conn)
+
+    def reap(self):
+        now = time.monotonic()
+        stale = []
+
+        with self._cond:
+            keep = []
+            # Oldest-used first so the survivors are the warmest connections
+            for entry in sorted(self._idle, key=lambda e: e.last_used):
+                removable = self.size - len(stale) > self.min_size
+                if self._expired(entry, now) or (removable and self.max_idle and now - entry.last_used > self.max_idle):
+                    stale.append(entry)
+                else:
+                    keep.append(entry)
+            self._idle = keep
+
+        for entry in stale:
+            self._discard(entry)
+
+        return len(stale)
+
+    def _reap_loop(self, interval):
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Database pool reaping failed: {str(e)}")
+
+    def stats(self):
+        with self._cond:
+            acquired = self._stats['acquired']
+            return {
+                **self._stats,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'wait_time_avg': self._stats['wait_time_total'] / acquired if acquired else 0.0,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+
+        for entry in idle:
+            self._discard(entry)
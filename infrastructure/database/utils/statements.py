@@ -0,0 +1,62 @@
+from psycopg2 import errors, extensions
+import threading
+import hashlib
+import weakref
+import re
+import os
+
+_IDENTIFIER = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+# Connection -> names of the statements already PREPAREd in its session. Weak keys: entries go away
+# with the connections the pool discards.
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+def prepare_enabled():
+    # Off behind a transaction-mode pooler, where consecutive statements may land on different sessions
+    return os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() not in ('0', 'false', 'no')
+
+def validate_identifier(name, allowed=None):
+    if not isinstance(name, str) or not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    if allowed is not None and name not in allowed:
+        raise ValueError(f"Unknown column: {name}")
+    return name
+
+class Statement:
+    # sql uses psycopg2 %s placeholders; the server-side form numbers them $1..$n
+    def __init__(self, sql):
+        self.sql = sql
+        self.params = sql.count('%s')
+        self.name = f"stmt_{hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]}"
+
+        counter = iter(range(1, self.params + 1))
+        self.prepared_sql = re.sub(r'%s', lambda _: f"${next(counter)}", sql)
+        self.execute_sql = f"EXECUTE {self.name} ({', '.join(['%s'] * self.params)})" if self.params else f"EXECUTE {self.name}"
+
+def execute(conn, cur, statement, values=()):
+    if not prepare_enabled():
+        cur.execute(statement.sql, tuple(values))
+        return
+
+    with _prepared_lock:
+        prepared = _prepared.setdefault(conn, set())
+    first_in_transaction = conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+
+    if statement.name not in prepared:
+        cur.execute(f"PREPARE {statement.name} AS {statement.prepared_sql}")
+        prepared.add(statement.name)
+
+    try:
+        cur.execute(statement.execute_sql, tuple(values))
+    except errors.InvalidSqlStatementName:
+        # Session was reset under us (DISCARD ALL, failover): everything must be prepared again.
+        # Retrying in place is only safe when the rollback discards nothing but this statement;
+        # otherwise the caller has to retry its whole transaction.
+        prepared.clear()
+        if not first_in_transaction:
+            raise
+        conn.rollback()
+        cur.execute(f"PREPARE {statement.name} AS {statement.prepared_sql}")
+        prepared.add(statement.name)
+        cur.execute(statement.execute_sql, tuple(values))
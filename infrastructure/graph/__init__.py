@@ -0,0 +1,3 @@
+from .loader import get_follow_graph, loaded_follow_graph
+from .csr import FollowGraph
+from .parallel import recommend_shard, get_graph_executor, discard_graph_executor
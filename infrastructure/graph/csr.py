@@ -0,0 +1,489 @@
+import numpy as np
+import threading
+import json
+import time
+import os
+
+def _ranges(starts, counts):
+    # Concatenation of arange(start, start + count) for every pair, without a Python loop
+    total = int(counts.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + (np.arange(total, dtype=np.int64) - offsets)
+
+def _sample(starts, counts, cap, rng):
+    # Systematic sample of at most `cap` positions from every range [start, start + count): evenly
+    # spaced from a random offset. Returns the range each position came from and the positions.
+    if not cap or not len(counts) or counts.max() <= cap:
+        return np.repeat(np.arange(len(counts)), counts), _ranges(starts, counts)
+
+    taken = np.minimum(counts, cap)
+    slot = np.repeat(np.arange(len(counts)), taken)
+    step = np.arange(len(slot), dtype=np.int64) - np.repeat(np.cumsum(taken) - taken, taken)
+    count = counts[slot]
+    offset = rng.integers(0, np.maximum(counts, 1))[slot]
+    positions = starts[slot] + (offset + step * count // taken[slot]) % count
+    return slot, positions
+
+def _top_k(candidates, scores, k, user_ids):
+    # Best k by score desc, then user id asc (user_ids maps candidate rows to ids); only the entries
+    # tied with or above the k-th score are sorted, the rest is discarded by one partition
+    if len(scores) > k:
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        selected = scores >= threshold
+        candidates, scores = candidates[selected], scores[selected]
+
+    order = np.lexsort((user_ids(candidates), -scores))[:k]
+    return candidates[order], scores[order]
+
+def _work():
+    return { 'friends': 0, 'friends_walked': 0, 'edges': 0, 'edges_walked': 0, 'candidates': 0 }
+
+def _compact_threshold():
+    # Deltas are laid over the arrays at read time until there are this many; only then are they
+    # folded in, which copies the (possibly memory-mapped) arrays into private memory
+    return int(os.getenv('GRAPH_COMPACT_THRESHOLD') or 50000)
+
+def _lookup(ids, user_ids):
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    if not len(ids):
+        return np.zeros(len(user_ids), dtype=bool), np.zeros(len(user_ids), dtype=np.int64)
+
+    positions = np.minimum(np.searchsorted(ids, user_ids), len(ids) - 1)
+    return ids[positions] == user_ids, positions
+
+def _gather(base, extra, positions):
+    # base[positions], continuing into extra past the end of base
+    if not len(extra):
+        return base[positions]
+    result = np.empty(len(positions), dtype=np.int64)
+    inside = positions < len(base)
+    result[inside] = base[positions[inside]]
+    result[~inside] = extra[positions[~inside] - len(base)]
+    return result
+
+class _View:
+    # The arrays with pending deltas laid over them. Rows touched by a delta are rebuilt into a small
+    # patch CSR whose positions continue after the base `indices`, and users only known from the
+    # deltas get row numbers after the base `ids`.
+    def __init__(self, csr, added, removed):
+        self.ids, self.indptr, self.indices = csr
+        self.extra = np.empty(0, dtype=np.int64)
+        self.patched = np.empty(0, dtype=np.int64)
+        self.patch_indptr = np.zeros(1, dtype=np.int64)
+        self.patch_indices = np.empty(0, dtype=np.int64)
+        if added or removed:
+            self._patch(
+                np.array(sorted(added), dtype=np.int64).reshape(-1, 2),
+                np.array(sorted(removed), dtype=np.int64).reshape(-1, 2),
+            )
+
+    @property
+    def size(self):
+        return len(self.ids) + len(self.extra)
+
+    def _patch(self, added, removed):
+        known, _ = _lookup(self.ids, added.ravel())
+        self.extra = np.unique(added.ravel()[~known])
+        size = self.size
+
+        added_keys = self.rows(added[:, 0])[1] * size + self.rows(added[:, 1])[1]
+        removed_keys = self.rows(removed[:, 0])[1] * size + self.rows(removed[:, 1])[1]
+        self.patched = np.unique(np.concatenate([added_keys, removed_keys]) // size)
+
+        # Current neighbours of every touched row as sorted row * size + column keys
+        rows = self.patched[self.patched < len(self.ids)]
+        counts = self.indptr[rows + 1] - self.indptr[rows]
+        keys = np.repeat(rows, counts) * size + self.indices[_ranges(self.indptr[rows], counts)]
+        keys = np.union1d(keys[~np.isin(keys, removed_keys)], added_keys)
+
+        slots = np.searchsorted(self.patched, keys // size)
+        self.patch_indptr = np.zeros(len(self.patched) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(slots, minlength=len(self.patched)), out=self.patch_indptr[1:])
+        self.patch_indices = keys % size
+
+    def rows(self, user_ids):
+        known, rows = _lookup(self.ids, user_ids)
+        if len(self.extra):
+            extra, extra_rows = _lookup(self.extra, user_ids)
+            rows = np.where(known, rows, len(self.ids) + extra_rows)
+            known = known | extra
+        return known, rows
+
+    def ranges(self, rows):
+        # (start, count) of every row's neighbours in the combined position space
+        if not len(self.patched):
+            return self.indptr[rows], self.indptr[rows + 1] - self.indptr[rows]
+
+        base = np.minimum(rows, len(self.ids) - 1)
+        starts = self.indptr[base]
+        counts = np.where(rows < len(self.ids), self.indptr[base + 1] - starts, 0)
+
+        slots = np.minimum(np.searchsorted(self.patched, rows), len(self.patched) - 1)
+        hit = self.patched[slots] == rows
+        starts = np.where(hit, len(self.indices) + self.patch_indptr[slots], starts)
+        counts = np.where(hit, self.patch_indptr[slots + 1] - self.patch_indptr[slots], counts)
+        return starts, counts
+
+    def take(self, positions):
+        return _gather(self.indices, self.patch_indices, positions)
+
+    def user_ids(self, rows):
+        return _gather(self.ids, self.extra, rows)
+
+class FollowGraph:
+    # Follow edges in compressed sparse row form: user ids are interned to dense indices through the
+    # sorted `ids` array, row i of (indptr, indices) lists who ids[i] follows, in column order. The
+    # arrays are never mutated (they may be memory-mapped snapshots); follow/unfollow land in deltas
+    # that readers lay over them, folded in by compact() once GRAPH_COMPACT_THRESHOLD are pending.
+    # Deltas only hold real changes: adding an edge the arrays already have records nothing.
+    def __init__(self, ids, indptr, indices, synced_at=None):
+        # Swapped as one tuple: readers take a consistent (ids, indptr, indices) triple
+        self._csr = (ids, indptr, indices)
+        self.synced_at = synced_at
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._added = set()
+        self._removed = set()
+        # Deltas being folded in by compact(), still visible to readers and writers meanwhile
+        self._merging = (set(), set())
+        self._version = 0
+        self._view_cache = (None, None)
+
+    @property
+    def ids(self):
+        return self._csr[0]
+
+    @property
+    def indptr(self):
+        return self._csr[1]
+
+    @property
+    def indices(self):
+        return self._csr[2]
+
+    @classmethod
+    def from_edges(cls, followers, following, synced_at=None):
+        followers = np.asarray(followers, dtype=np.int64)
+        following = np.asarray(following, dtype=np.int64)
+
+        ids = np.unique(np.concatenate([followers, following]))
+        rows = np.searchsorted(ids, followers)
+        columns = np.searchsorted(ids, following)
+
+        # Sort by (row, column) and drop duplicate edges
+        keys = np.unique(rows * len(ids) + columns)
+        rows, columns = keys // max(len(ids), 1), keys % max(len(ids), 1)
+
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(ids)), out=indptr[1:])
+        return cls(ids, indptr, columns.astype(np.int64), synced_at)
+
+    @property
+    def edge_count(self):
+        return int(self.indptr[-1])
+
+    @property
+    def pending(self):
+        return len(self._added) + len(self._removed)
+
+    def _in_arrays(self, follower_id, following_id):
+        # Whether the edge exists once the deltas being merged are folded in
+        merged_added, merged_removed = self._merging
+        if (follower_id, following_id) in merged_added:
+            return True
+        if (follower_id, following_id) in merged_removed:
+            return False
+
+        ids, indptr, indices = self._csr
+        known, rows = _lookup(ids, [follower_id, following_id])
+        if not known.all():
+            return False
+        row = indices[indptr[rows[0]]:indptr[rows[0] + 1]]
+        position = np.searchsorted(row, rows[1])
+        return bool(position < len(row) and row[position] == rows[1])
+
+    def add_edge(self, follower_id, following_id):
+        edge = (int(follower_id), int(following_id))
+        with self._lock:
+            if edge in self._removed:
+                self._removed.discard(edge)
+            elif edge not in self._added and not self._in_arrays(*edge):
+                self._added.add(edge)
+            else:
+                return
+            self._version += 1
+
+    def remove_edge(self, follower_id, following_id):
+        edge = (int(follower_id), int(following_id))
+        with self._lock:
+            if edge in self._added:
+                self._added.discard(edge)
+            elif edge not in self._removed and self._in_arrays(*edge):
+                self._removed.add(edge)
+            else:
+                return
+            self._version += 1
+
+    def sync_following(self, following):
+        # Makes the followees of every given user match `following` ({ follower_id: followee ids },
+        # e.g. a fresh database read); only the differences become deltas
+        view = self._view()
+        for follower_id, expected in following.items():
+            current = set(self._following(view, follower_id).tolist())
+            expected = { int(following_id) for following_id in expected }
+            for following_id in expected - current:
+                self.add_edge(follower_id, following_id)
+            for following_id in current - expected:
+                self.remove_edge(follower_id, following_id)
+
+    def compact(self):
+        with self._compact_lock:
+            with self._lock:
+                if not self._added and not self._removed:
+                    return self
+                added, removed = self._added, self._removed
+                self._added, self._removed = set(), set()
+                self._merging = (added, removed)
+
+            csr = self._merge(added, removed)
+            with self._lock:
+                self._csr = csr
+                self._merging = (set(), set())
+                self._version += 1
+        return self
+
+    def _merge(self, added, removed):
+        # One O(E) gather through the overlay instead of a sort of every edge: rows keep their column
+        # order, and users new to the arrays are slotted into the sorted ids
+        view = _View(self._csr, added, removed)
+        ids = np.concatenate([view.ids, view.extra])
+        order = np.argsort(ids, kind='stable')
+
+        starts, counts = view.ranges(order)
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        indices = view.take(_ranges(starts, counts))
+        if len(view.extra):
+            remap = np.empty(len(ids), dtype=np.int64)
+            remap[order] = np.arange(len(ids))
+            indices = remap[indices]
+
+            # Patched rows were in overlay row order, which puts new users last: sort them by column again
+            rows = np.sort(remap[view.patched])
+            counts = indptr[rows + 1] - indptr[rows]
+            positions = _ranges(indptr[rows], counts)
+            indices[positions] = indices[positions][np.lexsort((indices[positions], np.repeat(rows, counts)))]
+
+        return ids[order], indptr, indices
+
+    def _overlay(self):
+        # Deltas relative to the current arrays: those being merged composed with the newer ones
+        merged_added, merged_removed = self._merging
+        if not merged_added and not merged_removed:
+            return set(self._added), set(self._removed)
+        return (
+            (merged_added - self._removed) | (self._added - merged_removed),
+            (merged_removed - self._added) | (self._removed - merged_added),
+        )
+
+    def _view(self):
+        if self.pending >= _compact_threshold():
+            self.compact()
+
+        with self._lock:
+            version, view = self._view_cache
+            if version == self._version:
+                return view
+            version, csr = self._version, self._csr
+            added, removed = self._overlay()
+
+        view = _View(csr, added, removed)
+        with self._lock:
+            if version == self._version:
+                self._view_cache = (version, view)
+        return view
+
+    @staticmethod
+    def _following(view, user_id):
+        known, rows = view.rows([int(user_id)])
+        if not known[0]:
+            return np.empty(0, dtype=np.int64)
+        starts, counts = view.ranges(rows)
+        return view.user_ids(view.take(_ranges(starts, counts)))
+
+    def following(self, user_id):
+        return self._following(self._view(), user_id)
+
+    def recommend(self, user_ids, k=50, max_friends=None, max_fanout=None, sketch_width=None, sketch_depth=4, stats=None, seed=0):
+        # Friend-of-friend scores for the whole batch at once: gather every (user, followee) pair, then
+        # every (user, followee's followee) pair, sum duplicates with one unique() over
+        # user * n + candidate keys and keep the k best per user. Same ranking as the SQL version:
+        # score desc, then candidate id asc; the user and accounts already followed are excluded.
+        #
+        # Cost model: max_friends / max_fanout cap how many followees of the user, and of each
+        # followee, are walked (a systematic sample where the SQL version takes the most recent). Every
+        # walked path counts once, as in SQL, so capped scores are mutual counts over the walked edges
+        # and never exceed the exact ones. sketch_width switches counting to a count-min sketch per
+        # user, so only the candidates that can still reach the top k are deduplicated. Per-user work
+        # counters are written into `stats` when a dict is given.
+        view = self._view()
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        result = { user_id: [] for user_id in user_ids }
+
+        known, rows = view.rows([int(user_id) for user_id in user_ids])
+        owners = np.flatnonzero(known)
+        rows = rows[known]
+        if stats is not None:
+            stats.update({ user_id: _work() for user_id in user_ids })
+        if not len(rows):
+            return result
+
+        rng = np.random.default_rng(seed)
+        n = view.size
+
+        friend_starts, friend_counts = view.ranges(rows)
+        all_owner = np.repeat(np.arange(len(rows)), friend_counts)
+        all_friends = view.take(_ranges(friend_starts, friend_counts))
+        followed = all_owner * n + all_friends
+
+        friend_owner, friend_positions = _sample(friend_starts, friend_counts, max_friends, rng)
+        friends = view.take(friend_positions)
+
+        fof_starts, fof_counts = view.ranges(friends)
+        fof_slot, fof_positions = _sample(fof_starts, fof_counts, max_fanout, rng)
+        owner = friend_owner[fof_slot]
+        candidates = view.take(fof_positions)
+
+        keys = owner * n + candidates
+        keep = (candidates != rows[owner]) & ~np.isin(keys, followed)
+        keys = keys[keep]
+
+        if sketch_width:
+            ranked = self._rank_sketched(keys, len(rows), n, k, sketch_width, sketch_depth, rng, view.user_ids)
+        else:
+            ranked = self._rank_exact(keys, len(rows), n, k, view.user_ids)
+
+        if stats is not None:
+            friends_walked = np.bincount(friend_owner, minlength=len(rows))
+            edges = np.bincount(all_owner, weights=view.ranges(all_friends)[1], minlength=len(rows))
+            edges_walked = np.bincount(owner, minlength=len(rows))
+
+        for owner_index, (candidate_rows, scores, distinct) in enumerate(ranked):
+            user_id = user_ids[owners[owner_index]]
+            result[user_id] = [
+                (str(candidate_id), int(score))
+                for candidate_id, score in zip(view.user_ids(candidate_rows), scores)
+            ]
+            if stats is not None:
+                stats[user_id].update({
+                    'friends': int(friend_counts[owner_index]),
+                    'friends_walked': int(friends_walked[owner_index]),
+                    'edges': int(edges[owner_index]),
+                    'edges_walked': int(edges_walked[owner_index]),
+                    'candidates': int(distinct),
+                })
+
+        return result
+
+    @staticmethod
+    def _rank_exact(keys, owners, n, k, user_ids):
+        keys, scores = np.unique(keys, return_counts=True)
+        key_owner, key_candidate = keys // n, keys % n
+
+        # keys are sorted, so every owner's candidates are one contiguous run
+        bounds = np.searchsorted(key_owner, np.arange(owners + 1))
+        return [
+            (*_top_k(key_candidate[start:end], scores[start:end], k, user_ids), end - start)
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+
+    @staticmethod
+    def _rank_sketched(keys, owners, n, k, width, depth, rng, user_ids):
+        # Count-min sketch per user: depth rows of `width` counters indexed by multiply-shift hashes.
+        # Estimates only overcount (by collisions); the exact distinct set is built just for the
+        # occurrences whose estimate can still reach the top k.
+        bits = max(int(width - 1).bit_length(), 1)
+        multipliers = rng.integers(1, 2 ** 63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+        # Group by owner with a counting sort: owners are small dense integers
+        key_owner = (keys // n).astype(np.min_scalar_type(owners))
+        order = np.argsort(key_owner, kind='stable')
+        bounds = np.searchsorted(key_owner[order], np.arange(owners + 1))
+
+        ranked = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            candidates = (keys[order[start:end]] % n).astype(np.uint64)
+            if not len(candidates):
+                ranked.append((np.empty(0, dtype=np.int64), np.empty(0), 0))
+                continue
+
+            estimates = None
+            for multiplier in multipliers:
+                buckets = ((candidates * multiplier) >> np.uint64(64 - bits)).astype(np.int64)
+                row = np.bincount(buckets, minlength=2 ** bits)[buckets]
+                estimates = row if estimates is None else np.minimum(estimates, row)
+
+            # Widen the cut until it holds k distinct candidates (heavy candidates repeat)
+            cut = min(k, len(candidates))
+            while True:
+                threshold = np.partition(estimates, len(estimates) - cut)[len(estimates) - cut]
+                selected = estimates >= threshold
+                distinct, first = np.unique(candidates[selected], return_index=True)
+                if len(distinct) >= k or cut == len(candidates):
+                    break
+                cut = min(cut * 2, len(candidates))
+
+            top_candidates, top_scores = _top_k(distinct.astype(np.int64), estimates[selected][first], k, user_ids)
+            ranked.append((top_candidates, top_scores, len(distinct)))
+
+        return ranked
+
+    def save(self, directory):
+        # Versioned snapshot directory plus an atomically replaced CURRENT pointer, so readers never
+        # see a half-written snapshot
+        ids, indptr, indices = self.compact()._csr
+        version = f"{time.time_ns()}-{os.getpid()}"
+        target = os.path.join(directory, version)
+        os.makedirs(target)
+
+        np.save(os.path.join(target, 'ids.npy'), ids)
+        np.save(os.path.join(target, 'indptr.npy'), indptr)
+        np.save(os.path.join(target, 'indices.npy'), indices)
+        with open(os.path.join(target, 'meta.json'), 'w') as file:
+            json.dump({ 'synced_at': self.synced_at, 'users': len(ids), 'edges': int(indptr[-1]) }, file)
+
+        pointer = os.path.join(directory, f"CURRENT.{os.getpid()}")
+        with open(pointer, 'w') as file:
+            file.write(version)
+        os.replace(pointer, os.path.join(directory, 'CURRENT'))
+
+        self._prune(directory, keep=version)
+        return target
+
+    @staticmethod
+    def _prune(directory, keep, retain=2):
+        versions = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+        for name in versions[:-retain]:
+            if name == keep:
+                continue
+            path = os.path.join(directory, name)
+            for filename in os.listdir(path):
+                os.remove(os.path.join(path, filename))
+            os.rmdir(path)
+
+    @classmethod
+    def load(cls, directory):
+        # Memory-mapped: pages are shared between workers through the page cache and read lazily
+        with open(os.path.join(directory, 'CURRENT')) as file:
+            target = os.path.join(directory, file.read().strip())
+        with open(os.path.join(target, 'meta.json')) as file:
+            meta = json.load(file)
+
+        return cls(
+            np.load(os.path.join(target, 'ids.npy'), mmap_mode='r'),
+            np.load(os.path.join(target, 'indptr.npy'), mmap_mode='r'),
+            np.load(os.path.join(target, 'indices.npy'), mmap_mode='r'),
+            meta['synced_at'],
+        )
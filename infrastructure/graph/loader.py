@@ -0,0 +1,128 @@
+from infrastructure.database.repositories import follower_repository
+from datetime import datetime, timedelta
+from .csr import FollowGraph
+import numpy as np
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+_graph = None
+_graph_pid = None
+_refreshed_at = 0
+_lock = threading.Lock()
+
+def _refresh_seconds():
+    return int(os.getenv('GRAPH_REFRESH_SECONDS', 600))
+
+def _catch_up_overlap():
+    # Re-reads this much history on each sync: covers follower-read staleness and commits that land
+    # with a created_at slightly older than the previous pass
+    return timedelta(seconds=int(os.getenv('GRAPH_CATCHUP_OVERLAP_SECONDS', 30)))
+
+def _latest(synced_at, rows, column='created_at'):
+    latest = max((row[column] for row in rows if row[column] is not None), default=None)
+    if latest is None:
+        return synced_at
+    latest = latest.isoformat()
+    return latest if synced_at is None or latest > synced_at else synced_at
+
+def load_from_database():
+    followers, following, synced_at = [], [], None
+
+    for rows in follower_repository.iter_edge_chunks():
+        followers.append(np.fromiter((row['follower_id'] for row in rows), dtype=np.int64, count=len(rows)))
+        following.append(np.fromiter((row['following_id'] for row in rows), dtype=np.int64, count=len(rows)))
+        synced_at = _latest(synced_at, rows)
+
+    empty = np.empty(0, dtype=np.int64)
+    return FollowGraph.from_edges(
+        np.concatenate(followers) if followers else empty,
+        np.concatenate(following) if following else empty,
+        synced_at
+    )
+
+def catch_up(graph):
+    # Re-reads the whole followee list of every user whose follows changed since the last sync and
+    # applies the differences, unfollows included. Edges the graph already has add nothing, so the
+    # overlap does not pile up deltas.
+    if graph.synced_at is None:
+        return graph
+
+    since = datetime.fromisoformat(graph.synced_at) - _catch_up_overlap()
+    following, synced_at = {}, graph.synced_at
+    for rows in follower_repository.iter_changed_following(since):
+        for row in rows:
+            followees = following.setdefault(row['user_id'], [])
+            if row['following_id'] is not None:
+                followees.append(row['following_id'])
+        synced_at = _latest(synced_at, rows, 'updated_at')
+
+    graph.sync_following(following)
+    graph.synced_at = synced_at
+    return graph
+
+def _snapshot_path():
+    return os.getenv('GRAPH_SNAPSHOT_PATH')
+
+def _load_snapshot():
+    path = _snapshot_path()
+    pointer = path and os.path.join(path, 'CURRENT')
+    if not pointer or not os.path.exists(pointer):
+        return None
+
+    age = time.time() - os.path.getmtime(pointer)
+    if age > _refresh_seconds():
+        return None
+
+    try:
+        graph = FollowGraph.load(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable graph snapshot: {str(e)}")
+        return None
+
+    logger.info(f"Loaded follow graph snapshot ({graph.edge_count} edges, {int(age)}s old)")
+    return catch_up(graph)
+
+def _load_full():
+    started = time.perf_counter()
+    graph = load_from_database()
+    logger.info(f"Loaded follow graph from database ({graph.edge_count} edges) in {time.perf_counter() - started:.1f}s")
+
+    path = _snapshot_path()
+    if path:
+        try:
+            os.makedirs(path, exist_ok=True)
+            graph.save(path)
+        except Exception as e:
+            logger.error(f"Could not write graph snapshot: {str(e)}")
+
+    return graph
+
+def get_follow_graph():
+    # One graph per process. First use starts from the newest snapshot when it is recent enough
+    # (memory-mapped, no table scan), every later call syncs new edges, and a full reload replaces
+    # the graph every GRAPH_REFRESH_SECONDS.
+    global _graph, _graph_pid, _refreshed_at
+
+    with _lock:
+        if _graph_pid != os.getpid():
+            _graph, _graph_pid = None, os.getpid()
+
+        now = time.monotonic()
+        if _graph is None:
+            _graph = _load_snapshot() or _load_full()
+            _refreshed_at = now
+        elif now - _refreshed_at > _refresh_seconds():
+            _graph = _load_full()
+            _refreshed_at = now
+        else:
+            catch_up(_graph)
+
+        return _graph
+
+def loaded_follow_graph():
+    # The graph if this process already holds one, without loading it
+    return _graph if _graph_pid == os.getpid() else None
@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor
+from .loader import get_follow_graph
+import multiprocessing
+import threading
+import os
+
+_executor = None
+_executor_key = None
+_lock = threading.Lock()
+
+def recommend_shard(user_ids, k, options):
+    # Runs inside a pool worker: the worker's own graph (memory-mapped snapshot when
+    # GRAPH_SNAPSHOT_PATH is set, so workers share its pages) and its own database pool
+    stats = {}
+    result = get_follow_graph().recommend(user_ids, k, stats=stats, **options)
+    return result, stats
+
+def _warm_up():
+    get_follow_graph()
+
+def get_graph_executor(workers):
+    # One pool per consumer process, rebuilt if the size changes. Spawned rather than forked: the
+    # parent runs consumer and reaper threads whose locks must not be copied mid-operation.
+    global _executor, _executor_key
+
+    with _lock:
+        key = (os.getpid(), workers)
+        if _executor_key != key:
+            if _executor is not None and _executor_key[0] == os.getpid():
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_up,
+            )
+            _executor_key = key
+
+        return _executor
+
+def discard_graph_executor(executor):
+    # Drops a broken or stuck pool; the next get_graph_executor() starts a fresh one. Workers still
+    # busy exit once their current shard ends.
+    global _executor, _executor_key
+
+    with _lock:
+        if _executor is executor:
+            _executor, _executor_key = None, None
+    executor.shutdown(wait=False, cancel_futures=True)
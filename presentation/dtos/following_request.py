@@ -1,7 +1,9 @@
 from pydantic import BaseModel, Field
+from typing import Optional
 
 class QueryParams(BaseModel):
     page: int = Field(default=1, gt=0)
     size: int = Field(default=10, gt=0, le=100)
+    cursor: Optional[str] = Field(default=None, max_length=512, pattern=r'^[A-Za-z0-9_-]+$')
 
 # class FollowingQueryParams(QueryParams)
\ No newline at end of file
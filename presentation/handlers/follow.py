@@ -1,10 +1,31 @@
 from infrastructure.bus import bus_client as bus
 from application.services import follow_service
 
+# Callers opt into keyset pagination by sending a 'cursor' key (None for the first page),
+# or into a chunked streaming reply with 'stream': true (see RabbitMQManager.stream_event)
+
 @bus.register_handler("FOLLOWERS")
 def followers(payload, ch):
+    if payload.get('stream'):
+        return follow_service.followers_stream(payload['user_id'], payload.get('chunk_size', 1000))
+
+    if 'cursor' in payload:
+        items, cursor = follow_service.followers_page(payload['user_id'], payload.get('size', 10), payload['cursor'])
+        return { 'items': items, 'cursor': cursor }
+
     return follow_service.followers(payload['user_id'])
 
 @bus.register_handler("FOLLOWING")
 def following(payload, ch):
+    if payload.get('stream'):
+        return follow_service.following_stream(payload['user_id'], payload.get('chunk_size', 1000))
+
+    if 'cursor' in payload:
+        items, cursor = follow_service.following_page(payload['user_id'], payload.get('size', 10), payload['cursor'])
+        return { 'items': items, 'cursor': cursor }
+
     return follow_service.following(payload['user_id'])
+
+@bus.register_handler("FOLLOW_COUNTS")
+def follow_counts(payload, ch):
+    return follow_service.counts(payload['user_ids'])
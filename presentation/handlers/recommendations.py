@@ -1,28 +1,11 @@
-from infrastructure.cache import cache_client as cache
+from application.services import recommendation_service
 from infrastructure.bus import bus_client as bus
-from application.services import follow_service
+import os
 
-@bus.register_handler("PROCESS_RECOMMENDATIONS")
+@bus.register_handler("PROCESS_RECOMMENDATIONS", max_concurrency=int(os.getenv('RECOMMENDATION_CONCURRENCY', 1)))
 def recommendation_handler(payload, ch):
-    users = [member.decode('utf-8') for member in cache.zrange(payload, 0, -1, withscores=False)]
+    recommendation_service.process_group(payload)
 
-    for user_id in users:
-        acc = {}
-
-        direct_friends = follow_service.following(user_id)
-        direct_friend_ids = {f['following_id'] for f in direct_friends}
-
-        for friend in direct_friend_ids:
-            friends_of_friend = follow_service.following(friend)
-            for fof in friends_of_friend:
-                fof_id = fof['following_id']
-
-                if fof_id == user_id or fof_id in direct_friend_ids:
-                    continue
-
-                acc[fof_id] = acc.get(fof_id, 0) + 1
-
-        sorted_recommendations = sorted(acc.items(), key=lambda x: x[1], reverse=True)
-        recommended_user_ids = [user_id for user_id, _ in sorted_recommendations]
-
-        cache.set(f"users:recommendations:results:{user_id}", recommended_user_ids)
+@bus.register_handler("UPDATE_RECOMMENDATIONS", max_concurrency=int(os.getenv('RECOMMENDATION_CONCURRENCY', 1)))
+def update_recommendations_handler(payload, ch):
+    recommendation_service.apply_edge(payload['follower_id'], payload['following_id'], payload['operation'])
@@ -3,5 +3,5 @@ from flask import Blueprint
 bp = Blueprint('content', __name__, url_prefix='/follow')
 
 def initialize_routes(app):
-    from . import follow, recommendation
+    from . import follow, recommendation, health
     app.register_blueprint(bp)
\ No newline at end of file
@@ -19,14 +19,26 @@ def search(query: SearchQueryParams):
 @validate()
 def following(query: QueryParams):
     user_id = request.user['sub']
-    
-    res = follow_service.following(
-        user_id,
-        query.page,
-        query.size,
-    )
 
-    return jsonify({"message": "followers list", "data": res}), 201
+    if query.page > 1 and not query.cursor:
+        res = follow_service.following(
+            user_id,
+            query.page,
+            query.size,
+        )
+
+        return jsonify({"message": "followers list", "data": res, "cursor": None}), 201
+
+    try:
+        res, cursor = follow_service.following_page(
+            user_id,
+            query.size,
+            query.cursor,
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    return jsonify({"message": "followers list", "data": res, "cursor": cursor}), 201
 
 @bp.route('/<string:follower_id>', methods=['POST'])
 @cookie_required
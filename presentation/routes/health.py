@@ -0,0 +1,17 @@
+from infrastructure.database import get_db_pool, get_db_read_pool
+from ..guards import cookie_required
+from flask import jsonify
+from .content import bp
+
+@bp.route('/health', methods=['GET'])
+def health():
+    return jsonify({ "message": "ok" }), 200
+
+@bp.route('/health/pools', methods=['GET'])
+@cookie_required
+def health_pools():
+    data = { "database_pool": get_db_pool().stats() }
+    if get_db_read_pool() is not get_db_pool():
+        data["database_read_pool"] = get_db_read_pool().stats()
+
+    return jsonify({ "message": "ok", "data": data }), 200
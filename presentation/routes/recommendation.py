@@ -1,12 +1,15 @@
 from application.services import recommendation_service
 from ..guards import cookie_required
+from ..dtos import QueryParams
+from flask_pydantic import validate
 from flask import request, jsonify
 from .content import bp
 
 @bp.route('/recommendations', methods=['GET'])
 @cookie_required
-def recommendation_list():
+@validate()
+def recommendation_list(query: QueryParams):
     user_id = request.user['sub']
-    data = recommendation_service.get_recommendations(user_id)
+    data = recommendation_service.get_recommendations(user_id, query.page, query.size)
 
-    return jsonify({ "message": "Recommended Followers", "data": data }), 201
+    return jsonify({ "message": "Recommended Followers", "data": data, "page": query.page }), 201
@@ -1,4 +1,4 @@
-from infrastructure.database.repositories import follower_repository
+from infrastructure.database.repositories import follower_repository, follow_counts_repository
 from application.services import follow_service
 from infrastructure.bus import bus_client
 import pytest
@@ -11,20 +11,38 @@ class TestFollowService:
         self.mock_repo = {
             'find_by': lambda *args, **kwargs: None,
             'insert': lambda *args, **kwargs: None,
-            'delete_by': lambda *args, **kwargs: None
+            'delete_by': lambda *args, **kwargs: None,
+            'following_among': lambda *args, **kwargs: set(),
+            'find_page': lambda *args, **kwargs: ([], None),
+            'iter_by': lambda *args, **kwargs: iter(()),
+            'iter_chunks': lambda *args, **kwargs: iter(()),
+            'follow': lambda *args, **kwargs: True,
+            'unfollow': lambda *args, **kwargs: True
+        }
+
+        self.mock_counts_repo = {
+            'counts': lambda *args, **kwargs: {}
         }
 
         self.mock_bus = {
-            'publish_event': lambda *args, **kwargs: None
+            'publish_event': lambda *args, **kwargs: None,
+            'emit_many': lambda *args, **kwargs: None
         }
 
-        monkeypatch.setattr(follower_repository, 'find_by', self.mock_repo['find_by'])
-        monkeypatch.setattr(follower_repository, 'insert', self.mock_repo['insert'])
-        monkeypatch.setattr(follower_repository, 'delete_by', self.mock_repo['delete_by'])
-        monkeypatch.setattr(bus_client, 'publish_event', self.mock_bus['publish_event'])
+        # Delegate through the dicts so tests can swap a mock after the fixture has run
+        for name in self.mock_repo:
+            monkeypatch.setattr(follower_repository, name, self._delegate(self.mock_repo, name))
+        for name in self.mock_counts_repo:
+            monkeypatch.setattr(follow_counts_repository, name, self._delegate(self.mock_counts_repo, name))
+        for name in self.mock_bus:
+            monkeypatch.setattr(bus_client, name, self._delegate(self.mock_bus, name))
         
         return service
 
+    @staticmethod
+    def _delegate(mocks, name):
+        return lambda *args, **kwargs: mocks[name](*args, **kwargs)
+
     def test_following_empty(self, service):
         self.mock_repo['find_by'] = lambda *args, **kwargs: []
         
@@ -46,6 +64,22 @@ class TestFollowService:
         assert len(result) == 2
         assert all(user['isFollowing'] for user in result)
 
+    def test_following_page_returns_next_cursor(self, service):
+        self.mock_repo['find_page'] = lambda *args, **kwargs: (
+            [{'follower_id': 'user1', 'following_id': 'user2'}],
+            'next-cursor'
+        )
+        self.mock_bus['publish_event'] = lambda *args, **kwargs: [{'userId': 'user2', 'name': 'User 2'}]
+
+        result, cursor = service.following_page('user1', 1)
+        assert result == [{'userId': 'user2', 'name': 'User 2', 'isFollowing': True}]
+        assert cursor == 'next-cursor'
+
+    def test_following_page_last_page(self, service):
+        result, cursor = service.following_page('user1', 10, 'some-cursor')
+        assert result == []
+        assert cursor is None
+
     def test_followers(self, service):
         expected = [{'follower_id': 'user1', 'following_id': 'user2'}]
         self.mock_repo['find_by'] = lambda *args, **kwargs: expected
@@ -53,15 +87,35 @@ class TestFollowService:
         result = service.followers('user2')
         assert result == expected
 
+    def test_followers_is_bounded_to_one_page(self, service):
+        calls = []
+        self.mock_repo['find_by'] = lambda *args, **kwargs: calls.append(args) or []
+
+        service.followers('user2')
+        assert calls == [({'following_id': 'user2'}, 1, 10)]
+
+    def test_following_stream_hydrates_each_chunk(self, service):
+        self.mock_repo['iter_chunks'] = lambda *args, **kwargs: iter([
+            [{'follower_id': 'user1', 'following_id': 'user2'}],
+            [{'follower_id': 'user1', 'following_id': 'user3'}]
+        ])
+        self.mock_bus['publish_event'] = lambda queue, event, payload, **kwargs: [
+            {'userId': user_id} for user_id in payload['user_ids']
+        ]
+
+        result = list(service.following_stream('user1', 1))
+        assert result == [
+            [{'userId': 'user2', 'isFollowing': True}],
+            [{'userId': 'user3', 'isFollowing': True}]
+        ]
+
     def test_search(self, service):
         self.mock_bus['publish_event'] = lambda *args, **kwargs: [
             {'userId': 'user2', 'displayName': 'User Two'},
             {'userId': 'user3', 'displayName': 'User Three'}
         ]
         
-        self.mock_repo['find_by'] = lambda *args, **kwargs: [
-            {'follower_id': 'user1', 'following_id': 'user2'}
-        ]
+        self.mock_repo['following_among'] = lambda *args, **kwargs: {'user2'}
         
         result = service.search('User', 'user1')
         assert len(result) == 2
@@ -82,30 +136,33 @@ class TestFollowService:
 
     def test_follow_already_following(self, service):
         self.mock_bus['publish_event'] = lambda *args, **kwargs: {}
-        self.mock_repo['find_by'] = lambda *args, **kwargs: [
-            {'follower_id': 'user1', 'following_id': 'user2'}
-        ]
+        self.mock_repo['follow'] = lambda *args, **kwargs: False
         
         result = service.follow('user1', 'user2')
         assert result == "Already following"
 
     def test_follow_success(self, service):
+        followed = []
         self.mock_bus['publish_event'] = lambda *args, **kwargs: {}
-        self.mock_repo['find_by'] = lambda *args, **kwargs: []
+        self.mock_repo['follow'] = lambda follower_id, following_id: followed.append((follower_id, following_id)) or True
         
         result = service.follow('user1', 'user2')
         assert result == "Now following"
+        assert followed == [('user1', 'user2')]
 
     def test_unfollow_not_following(self, service):
-        self.mock_repo['find_by'] = lambda *args, **kwargs: []
+        self.mock_repo['unfollow'] = lambda *args, **kwargs: False
         
         result = service.unfollow('user1', 'user2')
         assert result == "Not following"
 
     def test_unfollow_success(self, service):
-        self.mock_repo['find_by'] = lambda *args, **kwargs: [
-            {'follower_id': 'user1', 'following_id': 'user2'}
-        ]
-        
         result = service.unfollow('user1', 'user2')
-        assert result == "Unfollowed"
\ No newline at end of file
+        assert result == "Unfollowed"
+
+    def test_counts(self, service):
+        self.mock_counts_repo['counts'] = lambda user_ids, **kwargs: {
+            user_id: {'followers': 1, 'following': 2} for user_id in user_ids
+        }
+
+        assert service.counts(['user1']) == {'user1': {'followers': 1, 'following': 2}}
\ No newline at end of file
@@ -3,17 +3,78 @@ from infrastructure.database.repositories import follower_repository
 from application.services import recommendation_service
 from infrastructure.cache import cache_client
 from infrastructure.bus import bus_client
+from application.services import recommendation
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+import threading
+import logging
 import uuid
 import os
 
+class FakePipeline:
+    def __init__(self):
+        self.commands = []
+        self.executed = False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, *args))
+
+    def execute(self):
+        self.executed = True
+
+class FakeSortedSets:
+    # Just enough of Redis for the incremental score sets; pipelines run their commands immediately
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        return []
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def zincrby(self, key, delta, member):
+        scores = self.data.setdefault(key, {})
+        scores[member] = scores.get(member, 0) + delta
+
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(member, None)
+
+    def zremrangebyscore(self, key, low, high):
+        self.data[key] = { member: score for member, score in self.data.get(key, {}).items() if score > high }
+
+    def zremrangebyrank(self, key, start, stop):
+        pass
+
+    def zrevrange(self, key, start, stop):
+        return []
+
 class TestRecommendationService:
     @pytest.fixture
     def service(self, monkeypatch):
         service = recommendation_service
 
         self.mock_repo = {
-            'find_by': lambda *args, **kwargs: None
+            'find_by': lambda *args, **kwargs: None,
+            'following_among': lambda *args, **kwargs: set(),
+            'friends_of_friends': lambda *args, **kwargs: {},
+            'edge_neighbourhood': lambda *args, **kwargs: ([], []),
+            'mutual_count': lambda *args, **kwargs: 0
         }
 
         self.mock_cache = {
@@ -22,11 +83,19 @@ class TestRecommendationService:
             'zadd': lambda *args, **kwargs: None,
             'keys': lambda *args, **kwargs: [],
             'zcard': lambda *args, **kwargs: 0,
-            'get': lambda *args, **kwargs: None
+            'get': lambda *args, **kwargs: None,
+            'zrange': lambda *args, **kwargs: [],
+            'pipeline': lambda *args, **kwargs: FakePipeline(),
+            'zrevrange': lambda *args, **kwargs: [],
+            'zrem': lambda *args, **kwargs: None,
+            'exists': lambda *args, **kwargs: 1,
+            'mget': lambda keys: ['1'] * len(keys),
+            'evalsha': lambda *args, **kwargs: None
         }
 
         self.mock_bus = {
-            'publish_event': lambda *args, **kwargs: None
+            'publish_event': lambda *args, **kwargs: None,
+            'emit_many': lambda *args, **kwargs: None
         }
 
         self.mock_env = {
@@ -35,18 +104,21 @@ class TestRecommendationService:
             'BUS_QUEUE': 'recommendations_queue'
         }
 
-        monkeypatch.setattr(follower_repository, 'find_by', self.mock_repo['find_by'])
-        monkeypatch.setattr(cache_client, 'incr', self.mock_cache['incr'])
-        monkeypatch.setattr(cache_client, 'delete', self.mock_cache['delete'])
-        monkeypatch.setattr(cache_client, 'zadd', self.mock_cache['zadd'])
-        monkeypatch.setattr(cache_client, 'keys', self.mock_cache['keys'])
-        monkeypatch.setattr(cache_client, 'zcard', self.mock_cache['zcard'])
-        monkeypatch.setattr(cache_client, 'get', self.mock_cache['get'])
-        monkeypatch.setattr(bus_client, 'publish_event', self.mock_bus['publish_event'])
+        # Delegate through the dicts so tests can swap a mock after the fixture has run
+        for name in self.mock_repo:
+            monkeypatch.setattr(follower_repository, name, self._delegate(self.mock_repo, name))
+        for name in self.mock_cache:
+            monkeypatch.setattr(cache_client, name, self._delegate(self.mock_cache, name))
+        for name in self.mock_bus:
+            monkeypatch.setattr(bus_client, name, self._delegate(self.mock_bus, name))
         monkeypatch.setattr(os, 'getenv', lambda key: self.mock_env.get(key))
         
         return service
 
+    @staticmethod
+    def _delegate(mocks, name):
+        return lambda *args, **kwargs: mocks[name](*args, **kwargs)
+
     def test_create_user_key(self, service):
         user_id = "user123"
         result = service._create_user_key(user_id)
@@ -57,78 +129,34 @@ class TestRecommendationService:
         assert "users:recommendations:groups:" in result
         assert "_" in result
 
-    def test_increment_user_follow_count(self, service):
-        key = "test_key"
-        self.mock_cache['incr'] = lambda *args, **kwargs: 2
-        result = service._increment_user_follow_count(key)
-        assert result == 2
-
-    def test_reset_user_follow_count(self, service):
-        key = "test_key"
-        called = False
-        def mock_delete(*args, **kwargs):
-            nonlocal called
-            called = True
-            return None
-        
-        self.mock_cache['delete'] = mock_delete
-        service._reset_user_follow_count(key)
-        assert called is True
+    def test_get_recommendations_from_cache(self, service):
+        requests = []
 
-    def test_add_user_to_group(self, service):
-        group_id = "group123"
-        user_id = "user123"
-        called = False
-        
-        def mock_zadd(*args, **kwargs):
-            nonlocal called
-            called = True
-            return None
-        
-        self.mock_cache['zadd'] = mock_zadd
-        service._add_user_to_group(group_id, user_id)
-        assert called is True
+        def publish_event(*args, **kwargs):
+            requests.append(args)
+            return [{'userId': '8', 'name': 'B'}, {'userId': '7', 'name': 'A'}]
 
-    def test_check_user_requirements_true(self, service):
-        self.mock_env['FOLLOWERS_PER_USER'] = '5'
-        assert service._check_user_requirements(5) is True
+        self.mock_cache['zrevrange'] = lambda *args, **kwargs: ['7', '8']
+        self.mock_bus['publish_event'] = publish_event
+        self.mock_repo['following_among'] = lambda *args, **kwargs: {'8'}
 
-    def test_check_user_requirements_false(self, service):
-        self.mock_env['FOLLOWERS_PER_USER'] = '5'
-        assert service._check_user_requirements(4) is False
+        result = service.get_recommendations("user123")
 
-    def test_get_last_group_no_groups(self, service):
-        self.mock_cache['keys'] = lambda *args, **kwargs: []
-        result = service._get_last_group()
-        assert result is None
+        assert [profile['userId'] for profile in result] == ['7', '8']
+        assert [profile['isFollowing'] for profile in result] == [False, True]
+        assert requests == [('war_queue', 'SEARCH_PROFILE', {'user_ids': ['7', '8']})]
 
-    def test_get_last_group_with_groups(self, service):
-        test_keys = [
-            "users:recommendations:groups:abc_1000",
-            "users:recommendations:groups:def_2000",
-            "users:recommendations:groups:ghi_1500"
-        ]
-        self.mock_cache['keys'] = lambda *args, **kwargs: test_keys
-        result = service._get_last_group()
-        assert result == "users:recommendations:groups:def_2000"
+    def test_get_recommendations_reads_one_page(self, service):
+        requested = []
 
-    def test_check_group_requirements_true(self, service):
-        group_id = "group123"
-        self.mock_cache['zcard'] = lambda *args, **kwargs: 10
-        self.mock_env['USERS_PER_GROUP'] = '10'
-        assert service._check_group_requirements(group_id) is True
+        def zrevrange(*args):
+            requested.append(args)
+            return []
 
-    def test_check_group_requirements_false(self, service):
-        group_id = "group123"
-        self.mock_cache['zcard'] = lambda *args, **kwargs: 9
-        self.mock_env['USERS_PER_GROUP'] = '10'
-        assert service._check_group_requirements(group_id) is False
+        self.mock_cache['zrevrange'] = zrevrange
 
-    def test_get_recommendations_from_cache(self, service):
-        expected = [{'userId': '123', 'name': 'Test User'}]
-        self.mock_cache['get'] = lambda *args, **kwargs: expected
-        result = service.get_recommendations("user123")
-        assert result == expected
+        assert service.get_recommendations("user123", page=3, size=20) == []
+        assert requested == [("users:recommendations:ranked:user123", 40, 59)]
 
     def test_get_recommendations_from_hottest(self, service):
         test_ids = ["user1", "user2"]
@@ -141,71 +169,371 @@ class TestRecommendationService:
             test_ids if args[1] == 'MOST_FOLLOWED' else test_profiles
         )
         
-        self.mock_repo['find_by'] = lambda *args, **kwargs: [
-            {'follower_id': 'current_user', 'following_id': 'user1'}
-        ]
+        self.mock_repo['following_among'] = lambda *args, **kwargs: {'user1'}
         
         result = service.get_recommendations("current_user")
         assert len(result) == 2
         assert result[0]['isFollowing'] is True
         assert result[1]['isFollowing'] is False
 
-    def test_run_first_increment(self, service):
-        user_id = "user123"
-        self.mock_cache['incr'] = lambda *args, **kwargs: 1
-        self.mock_env['FOLLOWERS_PER_USER'] = '5'
+    def test_run_below_user_limit(self, service):
+        emitted = []
+        self.mock_cache['evalsha'] = lambda *args, **kwargs: []
+        self.mock_bus['emit_many'] = lambda *args, **kwargs: emitted.append(args)
 
-        result = service.run(user_id)
+        result = service.run("user123")
         assert result is None
+        assert emitted == []
 
-    def test_run_reaches_user_limit_but_not_group(self, service):
-        user_id = "user123"
-        group_key = "existing_group_1000"
-        
-        self.mock_cache['incr'] = lambda *args, **kwargs: 5
-        self.mock_cache['keys'] = lambda *args, **kwargs: [group_key]
-        self.mock_cache['zcard'] = lambda *args, **kwargs: 8
-        self.mock_env['FOLLOWERS_PER_USER'] = '5'
-        self.mock_env['USERS_PER_GROUP'] = '10'
-        
-        zadd_called = False
-        def mock_zadd(*args, **kwargs):
-            nonlocal zadd_called
-            zadd_called = True
-            return None
-        
-        self.mock_cache['zadd'] = mock_zadd
-        
-        result = service.run(user_id)
-        assert zadd_called is True
-        assert result is None
+    def test_run_schedules_in_one_script_call(self, service):
+        calls = []
 
-    def test_run_creates_new_group(self, service):
-        user_id = "user123"
-        
-        self.mock_cache['incr'] = lambda *args, **kwargs: 5
-        self.mock_cache['keys'] = lambda *args, **kwargs: ["existing_group_1000"]
-        self.mock_cache['zcard'] = lambda *args, **kwargs: 10
+        def evalsha(sha, numkeys, *args):
+            calls.append((numkeys, args))
+            return []
+
+        self.mock_cache['evalsha'] = evalsha
         self.mock_env['FOLLOWERS_PER_USER'] = '5'
         self.mock_env['USERS_PER_GROUP'] = '10'
-        
-        bus_called = False
-        def mock_publish(*args, **kwargs):
-            nonlocal bus_called
-            bus_called = True
-            return None
-        
-        self.mock_bus['publish_event'] = mock_publish
-        
-        zadd_called = False
-        def mock_zadd(*args, **kwargs):
-            nonlocal zadd_called
-            zadd_called = True
-            return None
-        
-        self.mock_cache['zadd'] = mock_zadd
-        
-        result = service.run(user_id)
-        assert bus_called is True
-        assert zadd_called is True
-        assert result is None
\ No newline at end of file
+        self.mock_env['RECOMMENDATION_BATCH_MAX_AGE'] = '15'
+        self.mock_env['RECOMMENDATION_MAX_IN_FLIGHT'] = '2'
+
+        service.run("user123")
+
+        assert len(calls) == 1
+        numkeys, args = calls[0]
+        keys, argv = args[:numkeys], args[numkeys:]
+        assert keys[:7] == (
+            "users:recommendations:counting:user123",
+            "users:recommendations:debounce:user123",
+            "users:recommendations:queued",
+            "users:recommendations:groups:open",
+            "users:recommendations:groups:registry",
+            "users:recommendations:groups:ready",
+            "users:recommendations:groups:inflight",
+        )
+        assert keys[7].startswith("users:recommendations:groups:")
+        assert keys[8] == "users:recommendations:groups:attempts"
+        assert argv[:3] == ('5', '10', "user123")
+        assert argv[4:] == (60, 15, 2, 300, 3)
+
+    def test_run_publishes_dispatched_groups(self, service):
+        emitted = []
+        self.mock_cache['evalsha'] = lambda *args, **kwargs: ["users:recommendations:groups:abc_1000"]
+        self.mock_bus['emit_many'] = lambda messages: emitted.extend(messages)
+
+        service.run("user123")
+
+        assert emitted == [('recommendations_queue', 'PROCESS_RECOMMENDATIONS', "users:recommendations:groups:abc_1000")]
+
+    def test_flush_due_publishes_aged_groups(self, service):
+        emitted = []
+        self.mock_cache['evalsha'] = lambda *args, **kwargs: ["g1", "g2"]
+        self.mock_bus['emit_many'] = lambda messages: emitted.extend(messages)
+
+        service.flush_due()
+
+        assert [message[2] for message in emitted] == ["g1", "g2"]
+
+    def test_process_group_releases_slot_even_on_failure(self, service):
+        calls, emitted = [], []
+
+        def evalsha(sha, numkeys, *args):
+            calls.append(args[:numkeys])
+            return ["users:recommendations:groups:next_1000"]
+
+        def friends_of_friends(*args, **kwargs):
+            raise RuntimeError("database down")
+
+        self.mock_cache['evalsha'] = evalsha
+        self.mock_cache['zrange'] = lambda *args, **kwargs: ['1']
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+        self.mock_bus['emit_many'] = lambda messages: emitted.extend(messages)
+
+        with pytest.raises(RuntimeError):
+            service.process_group("users:recommendations:groups:abc_1000")
+
+        assert calls[0][:2] == ("users:recommendations:groups:abc_1000", "users:recommendations:groups:inflight")
+        assert emitted == [('recommendations_queue', 'PROCESS_RECOMMENDATIONS', "users:recommendations:groups:next_1000")]
+
+    def test_process_group_stores_ranked_results_in_one_pipeline(self, service):
+        pipeline = FakePipeline()
+        queried = []
+
+        def friends_of_friends(users, limit, **kwargs):
+            queried.append((users, limit))
+            return {'1': [('7', 3), ('8', 1)], '2': []}
+
+        self.mock_cache['zrange'] = lambda *args, **kwargs: ['1', '2']
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: pipeline
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+        self.mock_env['RECOMMENDATIONS_PER_USER'] = '20'
+        self.mock_env['RECOMMENDATION_RESULT_TTL'] = '600'
+
+        service.process_group("users:recommendations:groups:abc_1000")
+
+        assert queried == [(['1', '2'], 20)]
+        assert pipeline.executed is True
+        assert pipeline.commands == [
+            ('delete', 'users:recommendations:ranked:1'),
+            ('zadd', 'users:recommendations:ranked:1', {'7': 3, '8': 1}),
+            ('expire', 'users:recommendations:ranked:1', 600),
+            ('delete', 'users:recommendations:ranked:2'),
+        ]
+
+    def test_process_group_empty(self, service):
+        assert service.process_group("users:recommendations:groups:abc_1000") == {}
+
+    def test_apply_follow_bumps_candidates_and_owners(self, service):
+        pipeline = FakePipeline()
+        removed = []
+
+        self.mock_repo['edge_neighbourhood'] = lambda *args, **kwargs: (['7', '8'], ['3'])
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: pipeline
+        self.mock_cache['zrem'] = lambda *args: removed.append(args)
+        self.mock_env['RECOMMENDATION_MAX_CANDIDATES'] = '100'
+
+        service.apply_edge('1', '2', 'follow')
+
+        assert pipeline.executed is True
+        assert [command for command in pipeline.commands if command[0] == 'zincrby'] == [
+            ('zincrby', 'users:recommendations:scores:1', 1, '7'),
+            ('zincrby', 'users:recommendations:scores:1', 1, '8'),
+            ('zincrby', 'users:recommendations:scores:3', 1, '2'),
+        ]
+        assert ('zremrangebyrank', 'users:recommendations:scores:3', 0, -101) in pipeline.commands
+        assert removed == [('users:recommendations:scores:1', '2')]
+
+    def test_apply_unfollow_reverses_and_restores_candidate(self, service):
+        pipeline = FakePipeline()
+        added = []
+
+        self.mock_repo['edge_neighbourhood'] = lambda *args, **kwargs: (['7'], [])
+        self.mock_repo['mutual_count'] = lambda *args, **kwargs: 2
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: pipeline
+        self.mock_cache['zadd'] = lambda *args: added.append(args)
+
+        service.apply_edge('1', '2', 'unfollow')
+
+        assert ('zincrby', 'users:recommendations:scores:1', -1, '7') in pipeline.commands
+        assert ('zremrangebyscore', 'users:recommendations:scores:1', '-inf', 0) in pipeline.commands
+        assert added == [('users:recommendations:scores:1', {'2': 2})]
+
+    def test_incremental_recommendations_read_top_k(self, service):
+        requested = []
+
+        def zrevrange(*args):
+            requested.append(args)
+            return ['7', '8']
+
+        self.mock_cache['zrevrange'] = zrevrange
+        self.mock_bus['publish_event'] = lambda *args, **kwargs: [{'userId': '7'}, {'userId': '8'}]
+        self.mock_env['RECOMMENDATION_ENGINE'] = 'incremental'
+
+        result = service.get_recommendations('1', size=5)
+
+        assert [profile['userId'] for profile in result] == ['7', '8']
+        assert requested == [('users:recommendations:scores:1', 0, 4)]
+
+    def test_incremental_scores_are_seeded_on_first_read(self, service):
+        seeded = []
+        pipeline = FakePipeline()
+
+        def friends_of_friends(users, limit, **kwargs):
+            seeded.append((users, kwargs))
+            return { '1': [('7', 2)] }
+
+        self.mock_cache['exists'] = lambda *args: 0
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: pipeline
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+        self.mock_env['RECOMMENDATION_ENGINE'] = 'incremental'
+
+        service.get_recommendations('1')
+
+        assert seeded == [(['1'], {'stale': False})]
+        assert pipeline.commands == [
+            ('delete', 'users:recommendations:scores:1'),
+            ('zadd', 'users:recommendations:scores:1', {'7': 2}),
+            ('set', 'users:recommendations:seeded:1', 1),
+        ]
+
+    def test_unseeded_users_take_no_deltas(self, service):
+        pipeline = FakePipeline()
+
+        self.mock_repo['edge_neighbourhood'] = lambda *args, **kwargs: (['7'], ['3', '4'])
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: pipeline
+        self.mock_cache['mget'] = lambda keys: [None, '1', None]
+        self.mock_cache['zrem'] = lambda *args: pytest.fail("unseeded follower touched")
+
+        service.apply_edge('1', '2', 'follow')
+
+        assert [command for command in pipeline.commands if command[0] == 'zincrby'] == [
+            ('zincrby', 'users:recommendations:scores:3', 1, '2'),
+        ]
+
+    def test_deltas_on_seeded_sets_match_a_full_recompute(self, service):
+        # Edges that predate the incremental engine, then an unfollow of one of them and a new follow
+        edges = {(1, 2), (1, 3), (2, 4), (3, 4), (2, 5), (4, 6), (5, 1), (6, 2)}
+        cache = FakeSortedSets()
+
+        def following(user_id):
+            return { b for a, b in edges if a == int(user_id) }
+
+        def mutual_count(user_id, candidate_id):
+            return sum(int(candidate_id) in following(friend) for friend in following(user_id))
+
+        def friends_of_friends(users, limit, **kwargs):
+            result = {}
+            for user_id in users:
+                candidates = { c for friend in following(user_id) for c in following(friend) } - following(user_id) - {int(user_id)}
+                scores = sorted(((str(c), mutual_count(user_id, c)) for c in candidates), key=lambda item: (-item[1], item[0]))
+                result[str(user_id)] = scores[:limit]
+            return result
+
+        def edge_neighbourhood(follower_id, following_id):
+            follower_id, following_id = int(follower_id), int(following_id)
+            candidates = [str(c) for c in following(following_id) if c != follower_id and c not in following(follower_id)]
+            owners = [str(a) for a, b in edges if b == follower_id and a != following_id and following_id not in following(a)]
+            return candidates, owners
+
+        for name in ('exists', 'mget', 'pipeline', 'delete', 'zadd', 'zrem', 'zrevrange'):
+            self.mock_cache[name] = getattr(cache, name)
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+        self.mock_repo['edge_neighbourhood'] = edge_neighbourhood
+        self.mock_repo['mutual_count'] = mutual_count
+        self.mock_env['RECOMMENDATION_ENGINE'] = 'incremental'
+        users = range(1, 7)
+
+        for user_id in users:
+            service.get_recommendations(str(user_id))
+
+        edges.discard((2, 4))
+        service.apply_edge('2', '4', 'unfollow')
+        edges.add((3, 6))
+        service.apply_edge('3', '6', 'follow')
+
+        expected = friends_of_friends([str(user_id) for user_id in users], 1000)
+        for user_id in users:
+            assert cache.data[f"users:recommendations:scores:{user_id}"] == dict(expected[str(user_id)])
+
+    def test_process_group_passes_cost_caps(self, service):
+        received = []
+
+        def friends_of_friends(users, limit, **kwargs):
+            received.append(kwargs)
+            return {}
+
+        self.mock_cache['zrange'] = lambda *args, **kwargs: ['1']
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+        self.mock_env['RECOMMENDATION_MAX_FRIENDS'] = '200'
+        self.mock_env['RECOMMENDATION_MAX_FANOUT'] = '500'
+
+        service.process_group("users:recommendations:groups:abc_1000")
+
+        assert received == [{'stale': True, 'max_friends': 200, 'max_fanout': 500, 'stats': {}}]
+
+    def test_process_group_logs_sql_work(self, service, caplog):
+        def friends_of_friends(users, limit, stats=None, **kwargs):
+            stats.update({
+                '1': { 'friends': 3, 'friends_walked': 2, 'edges': 40, 'edges_walked': 12, 'candidates': 5 },
+                '2': { 'friends': 1, 'friends_walked': 1, 'edges': 8, 'edges_walked': 8, 'candidates': 4 },
+            })
+            return { '1': [('7', 2)], '2': [] }
+
+        self.mock_cache['zrange'] = lambda *args, **kwargs: ['1', '2']
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: FakePipeline()
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+
+        with caplog.at_level(logging.INFO, logger=recommendation.__name__):
+            service.process_group("users:recommendations:groups:abc_1000")
+
+        assert "2 users, walked 20 of 48 second-degree edges, 9 candidates, heaviest user 1 (12 edges)" in caplog.text
+
+    def graph_shards(self, monkeypatch):
+        computed = []
+
+        def recommend_shard(users, limit, options):
+            computed.append(users)
+            return { user_id: [('9', 1)] for user_id in users }, {}
+
+        monkeypatch.setattr(recommendation, 'recommend_shard', recommend_shard)
+        self.mock_cache['zrange'] = lambda *args, **kwargs: ['1', '2', '3']
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: FakePipeline()
+        self.mock_env['RECOMMENDATION_ENGINE'] = 'graph'
+        self.mock_env['RECOMMENDATION_WORKERS'] = '2'
+        return computed
+
+    def test_broken_process_pool_is_dropped_and_batch_runs_in_process(self, service, monkeypatch):
+        computed = self.graph_shards(monkeypatch)
+        discarded = []
+
+        class BrokenPool:
+            def submit(self, task):
+                raise BrokenProcessPool("worker died")
+
+        pool = BrokenPool()
+        monkeypatch.setattr(recommendation, 'get_graph_executor', lambda workers: pool)
+        monkeypatch.setattr(recommendation, 'discard_graph_executor', discarded.append)
+        self.mock_env['GRAPH_SNAPSHOT_PATH'] = '/var/lib/graph'
+
+        result = service.process_group("users:recommendations:groups:abc_1000")
+
+        assert discarded == [pool]
+        assert sorted(computed) == [['1', '2'], ['3']]
+        assert set(result) == {'1', '2', '3'}
+
+    def test_process_pool_requires_a_snapshot(self, service, monkeypatch):
+        computed = self.graph_shards(monkeypatch)
+        monkeypatch.setattr(recommendation, 'get_graph_executor', lambda workers: pytest.fail("process pool used"))
+
+        result = service.process_group("users:recommendations:groups:abc_1000")
+
+        assert sorted(computed) == [['1', '2'], ['3']]
+        assert set(result) == {'1', '2', '3'}
+
+    def test_shard_results_are_awaited_up_to_the_batch_timeout(self, service):
+        release = threading.Event()
+        self.mock_env['RECOMMENDATION_WORKERS'] = '2'
+        self.mock_env['RECOMMENDATION_BATCH_TIMEOUT'] = '1'
+
+        try:
+            with pytest.raises(TimeoutError):
+                service._run_shards(['1', '2'], False, lambda shard: lambda: release.wait(5))
+        finally:
+            release.set()
+
+    def test_timed_out_thread_pool_is_replaced(self, service):
+        release = threading.Event()
+        self.mock_env['RECOMMENDATION_WORKERS'] = '2'
+        self.mock_env['RECOMMENDATION_BATCH_TIMEOUT'] = '1'
+        service._threads = None
+
+        try:
+            with pytest.raises(TimeoutError):
+                service._run_shards(['1', '2'], False, lambda shard: lambda: release.wait(5))
+            assert service._threads is None
+
+            assert service._run_shards(['1', '2'], False, lambda shard: lambda: shard) == [['1'], ['2']]
+        finally:
+            release.set()
+
+    def test_process_group_splits_users_across_workers(self, service):
+        pipeline = FakePipeline()
+        shards = []
+
+        def friends_of_friends(users, limit, **kwargs):
+            shards.append(users)
+            return { user_id: [('9', 1)] for user_id in users }
+
+        self.mock_cache['zrange'] = lambda *args, **kwargs: ['1', '2', '3']
+        self.mock_cache['pipeline'] = lambda *args, **kwargs: pipeline
+        self.mock_repo['friends_of_friends'] = friends_of_friends
+        self.mock_env['RECOMMENDATION_WORKERS'] = '2'
+
+        result = service.process_group("users:recommendations:groups:abc_1000")
+
+        assert sorted(shards) == [['1', '2'], ['3']]
+        assert set(result) == {'1', '2', '3'}
+        assert [command[1] for command in pipeline.commands if command[0] == 'zadd'] == [
+            'users:recommendations:ranked:1', 'users:recommendations:ranked:2', 'users:recommendations:ranked:3'
+        ]
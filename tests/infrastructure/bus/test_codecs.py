@@ -0,0 +1,32 @@
+from infrastructure.bus.codecs import get_codec, negotiate
+from datetime import datetime
+import pika
+
+class TestCodecs:
+    def test_msgpack_round_trips_bigint_ids(self):
+        codec = get_codec('application/msgpack')
+        message = {'data': {'user_ids': [317608755095207938, 2 ** 63 - 1]}}
+
+        assert codec.decode(codec.encode(message)) == message
+
+    def test_datetimes_are_stringified(self):
+        created_at = datetime(2025, 1, 1, 12, 0)
+
+        for content_type in ('application/json', 'application/msgpack'):
+            codec = get_codec(content_type)
+            assert codec.decode(codec.encode({'created_at': created_at})) == {'created_at': str(created_at)}
+
+    def test_unknown_content_type_falls_back_to_json(self):
+        assert get_codec(None) is get_codec('application/json')
+        assert get_codec('text/plain') is get_codec('application/json')
+
+    def test_negotiate_prefers_accept_header(self):
+        properties = pika.BasicProperties(
+            content_type='application/json',
+            headers={'accept': 'application/msgpack, application/json'}
+        )
+        assert negotiate(properties) == 'application/msgpack'
+
+    def test_negotiate_mirrors_request_without_accept(self):
+        assert negotiate(pika.BasicProperties(content_type='application/msgpack')) == 'application/msgpack'
+        assert negotiate(pika.BasicProperties()) == 'application/json'
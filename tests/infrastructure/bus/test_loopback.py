@@ -0,0 +1,205 @@
+from infrastructure.bus.transport import LoopbackTransport
+from infrastructure.bus.loopback import LoopbackBroker
+from infrastructure.bus.dispatcher import Dispatcher
+from infrastructure.bus.rpc import RpcClient, RpcError
+import threading
+import pytest
+import pika
+import time
+
+class TestLoopbackBroker:
+    @pytest.fixture
+    def transport(self):
+        return LoopbackTransport(LoopbackBroker())
+
+    @pytest.fixture
+    def consumer(self, transport):
+        connection = transport.connect()
+        channel = connection.channel()
+        channel.queue_declare(queue='death_queue', durable=True)
+
+        handlers = {
+            'ECHO': lambda payload, ch: payload,
+            'FAIL': lambda payload, ch: 1 / 0,
+            'CHUNKS': lambda payload, ch: ([i] * 2 for i in range(payload)),
+            'BROKEN_STREAM': lambda payload, ch: (1 / i for i in (1, 0)),
+        }
+        dispatcher = Dispatcher(connection, handlers, {}, workers=2)
+
+        channel.basic_qos(prefetch_count=2)
+        channel.basic_consume(queue='death_queue', on_message_callback=dispatcher.on_message)
+
+        thread = threading.Thread(target=channel.start_consuming, daemon=True)
+        thread.start()
+
+        yield channel
+
+        connection.add_callback_threadsafe(channel.stop_consuming)
+        thread.join(timeout=2)
+        dispatcher.shutdown()
+
+    def test_rpc_round_trip(self, transport, consumer):
+        client = RpcClient(transport, 'application/json')
+
+        assert client.call('death_queue', 'ECHO', {'user_id': 317608755095207938}) == {'user_id': 317608755095207938}
+
+    def test_rpc_round_trip_msgpack(self, transport, consumer):
+        client = RpcClient(transport, 'application/msgpack')
+
+        assert client.call('death_queue', 'ECHO', [1, 2, 3]) == [1, 2, 3]
+
+    def test_call_many_returns_partial_results(self, transport, consumer):
+        client = RpcClient(transport, 'application/json')
+
+        results, errors = client.call_many([
+            ('death_queue', 'ECHO', 'a'),
+            ('missing_queue', 'ECHO', 'b'),
+        ], timeout=0.5)
+
+        assert results == ['a', None]
+        assert isinstance(errors[1], TimeoutError)
+
+    def test_streamed_reply_is_flattened_by_call(self, transport, consumer):
+        client = RpcClient(transport, 'application/json')
+
+        assert client.call('death_queue', 'CHUNKS', 3) == [0, 0, 1, 1, 2, 2]
+
+    def test_stream_yields_chunks_in_order(self, transport, consumer):
+        client = RpcClient(transport, 'application/msgpack')
+
+        assert list(client.stream('death_queue', 'CHUNKS', 3)) == [[0, 0], [1, 1], [2, 2]]
+
+    def test_stream_failure_is_raised_after_delivered_chunks(self, transport, consumer):
+        client = RpcClient(transport, 'application/json')
+        received = []
+
+        with pytest.raises(RpcError):
+            for chunk in client.stream('death_queue', 'BROKEN_STREAM', None):
+                received.append(chunk)
+
+        assert received == [1.0]
+        assert transport.broker.message_count('death_queue') == 0
+
+    def test_failed_handler_is_not_requeued(self, transport, consumer):
+        client = RpcClient(transport, 'application/json')
+
+        with pytest.raises(TimeoutError):
+            client.call('death_queue', 'FAIL', {}, timeout=0.3)
+
+        assert transport.broker.message_count('death_queue') == 0
+
+    def test_emit_to_unknown_queue_is_unroutable(self, transport):
+        client = RpcClient(transport, 'application/json')
+
+        with pytest.raises(pika.exceptions.UnroutableError):
+            client.emit_many([('missing_queue', 'ECHO', {})])
+
+    def test_expired_messages_are_not_delivered(self, transport):
+        connection = transport.connect()
+        channel = connection.channel()
+        channel.queue_declare(queue='death_queue')
+        channel.basic_publish(
+            exchange='',
+            routing_key='death_queue',
+            body=b'{}',
+            properties=pika.BasicProperties(expiration='10')
+        )
+        time.sleep(0.05)
+
+        received = []
+        channel.basic_consume(queue='death_queue', on_message_callback=lambda *args: received.append(args))
+        connection.process_data_events(time_limit=0.1)
+
+        assert received == []
+
+    def test_unacked_messages_are_redelivered_when_channel_closes(self, transport):
+        connection = transport.connect()
+        channel = connection.channel()
+        channel.queue_declare(queue='death_queue')
+        channel.basic_publish(exchange='', routing_key='death_queue', body=b'{}')
+
+        channel.basic_consume(queue='death_queue', on_message_callback=lambda *args: None)
+        connection.process_data_events(time_limit=0.1)
+        channel.close()
+
+        redelivered = []
+        other = transport.connect().channel()
+        other.basic_consume(queue='death_queue', on_message_callback=lambda ch, method, *args: redelivered.append(method))
+        other.connection.process_data_events(time_limit=0.1)
+
+        assert len(redelivered) == 1
+        assert redelivered[0].redelivered is True
+
+    def test_limited_events_do_not_hold_shared_prefetch(self, transport):
+        connection = transport.connect()
+        channel = connection.channel()
+        lane_channel = connection.channel()
+        channel.queue_declare(queue='death_queue', durable=True)
+        lane_channel.queue_declare(queue='death_queue.slow', durable=True)
+
+        release = threading.Event()
+        done = []
+
+        def slow(payload, ch):
+            release.wait(5)
+            done.append(payload)
+
+        dispatcher = Dispatcher(
+            connection,
+            { 'ECHO': lambda payload, ch: payload, 'SLOW': slow },
+            { 'SLOW': 1 },
+            workers=4,
+            lane_queues={ 'SLOW': 'death_queue.slow' },
+        )
+        channel.basic_qos(prefetch_count=2)
+        channel.basic_consume(queue='death_queue', on_message_callback=dispatcher.on_message)
+        lane_channel.basic_qos(prefetch_count=1)
+        lane_channel.basic_consume(queue='death_queue.slow', on_message_callback=dispatcher.on_message)
+
+        thread = threading.Thread(target=channel.start_consuming, daemon=True)
+        thread.start()
+
+        client = RpcClient(transport, 'application/json')
+        client.emit_many([('death_queue', 'SLOW', i) for i in range(3)])
+        try:
+            assert client.call('death_queue', 'ECHO', 'light', timeout=2) == 'light'
+        finally:
+            release.set()
+
+        deadline = time.monotonic() + 3
+        while len(done) < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert sorted(done) == [0, 1, 2]
+
+        connection.add_callback_threadsafe(channel.stop_consuming)
+        thread.join(timeout=2)
+        dispatcher.shutdown()
+
+    def test_overloaded_one_way_events_are_requeued_not_shed(self, transport):
+        connection = transport.connect()
+        channel = connection.channel()
+        channel.queue_declare(queue='death_queue', durable=True)
+
+        done = []
+
+        def slow(payload, ch):
+            time.sleep(0.3)
+            done.append(payload)
+
+        dispatcher = Dispatcher(connection, { 'SLOW': slow }, { 'SLOW': 1 }, workers=2, max_queue_latency=0.1)
+        channel.basic_qos(prefetch_count=2)
+        channel.basic_consume(queue='death_queue', on_message_callback=dispatcher.on_message)
+
+        thread = threading.Thread(target=channel.start_consuming, daemon=True)
+        thread.start()
+
+        RpcClient(transport, 'application/json').emit_many([('death_queue', 'SLOW', i) for i in range(2)])
+
+        deadline = time.monotonic() + 3
+        while len(done) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert sorted(done) == [0, 1]
+
+        connection.add_callback_threadsafe(channel.stop_consuming)
+        thread.join(timeout=2)
+        dispatcher.shutdown()
@@ -0,0 +1,41 @@
+from infrastructure.bus.singleflight import SingleFlight
+import threading
+import pytest
+import time
+
+class TestSingleFlight:
+    def test_concurrent_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = 0
+
+        def fetch():
+            nonlocal calls
+            calls += 1
+            time.sleep(0.1)
+            return [{'userId': 'user1'}]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', fetch))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == 1
+        assert results == [[{'userId': 'user1'}]] * 5
+        assert len({id(result) for result in results}) == 5
+
+    def test_error_is_shared_and_key_released(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise TimeoutError("No response received in time")
+
+        with pytest.raises(TimeoutError):
+            flight.do('key', fail)
+
+        assert flight.do('key', lambda: 'ok') == 'ok'
+
+    def test_key_is_canonical(self):
+        assert SingleFlight.key('war_queue', 'SEARCH_PROFILE', {'a': 1, 'b': 2}) == \
+            SingleFlight.key('war_queue', 'SEARCH_PROFILE', {'b': 2, 'a': 1})
@@ -0,0 +1,122 @@
+from infrastructure.database.repositories import follower_repository, follow_counts_repository
+from infrastructure.database.migrations.migrations import run_migrations
+from infrastructure.database import get_db_connection
+from datetime import datetime
+import random
+import pytest
+
+@pytest.fixture
+def users():
+    try:
+        conn = get_db_connection()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+
+    run_migrations(conn)
+    base = random.randint(10 ** 12, 10 ** 13)
+    ids = [base + offset for offset in range(6)]
+
+    yield ids
+
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM followers WHERE follower_id = ANY(%s) OR following_id = ANY(%s)", (ids, ids))
+        cur.execute("DELETE FROM follow_counts WHERE user_id = ANY(%s)", (ids,))
+    conn.commit()
+    conn.close()
+
+class TestFollowersRepository:
+    def test_follow_and_unfollow_keep_counts(self, users):
+        a, b = users[:2]
+
+        assert follower_repository.follow(a, b) is True
+        assert follower_repository.follow(a, b) is False
+        assert follow_counts_repository.counts([a, b]) == {
+            str(a): {'followers': 0, 'following': 1},
+            str(b): {'followers': 1, 'following': 0},
+        }
+
+        assert follower_repository.unfollow(a, b) is True
+        assert follower_repository.unfollow(a, b) is False
+        assert follow_counts_repository.counts([a, b])[str(b)] == {'followers': 0, 'following': 0}
+
+    def test_friends_of_friends_ranks_by_mutuals(self, users):
+        me, f1, f2, c1, c2, followed = users
+        for follower, following in [(me, f1), (me, f2), (me, followed), (f1, c1), (f2, c1), (f1, c2), (f1, me), (f2, followed)]:
+            follower_repository.follow(follower, following)
+
+        result = follower_repository.friends_of_friends([me, c1], limit=5)
+
+        assert result[str(me)] == [(str(c1), 2), (str(c2), 1)]
+        assert result[str(c1)] == []
+
+    def test_friends_of_friends_limit(self, users):
+        me, f1, c1, c2, c3, _ = users
+        for follower, following in [(me, f1), (f1, c1), (f1, c2), (f1, c3)]:
+            follower_repository.follow(follower, following)
+
+        assert len(follower_repository.friends_of_friends([me], limit=2)[str(me)]) == 2
+
+    def test_edge_neighbourhood_skips_existing_follows(self, users):
+        a, b, c1, c2, owner, _ = users
+        for follower, following in [(a, b), (b, c1), (b, c2), (b, a), (a, c2), (owner, a)]:
+            follower_repository.follow(follower, following)
+
+        candidates, owners = follower_repository.edge_neighbourhood(a, b)
+
+        assert candidates == [str(c1)]
+        assert owners == [str(owner)]
+        assert follower_repository.mutual_count(owner, b) == 1
+        assert follower_repository.mutual_count(a, c1) == 1
+
+    def test_friends_of_friends_fanout_cap(self, users):
+        me, f1, c1, c2, c3, _ = users
+        for follower, following in [(me, f1), (f1, c1), (f1, c2), (f1, c3)]:
+            follower_repository.follow(follower, following)
+
+        result = follower_repository.friends_of_friends([me], limit=5, max_fanout=1)
+
+        assert result[str(me)] == [(str(c3), 1)]
+
+    def test_friends_of_friends_reports_work(self, users):
+        me, f1, f2, c1, c2, idle = users
+        for follower, following in [(me, f1), (me, f2), (f1, c1), (f1, c2), (f1, me), (f2, c1)]:
+            follower_repository.follow(follower, following)
+        stats = {}
+
+        result = follower_repository.friends_of_friends([me, idle], limit=1, max_friends=1, stats=stats)
+
+        # Only the newest followee, f2, is walked
+        assert result[str(me)] == [(str(c1), 1)]
+        assert result[str(idle)] == []
+        assert stats == {
+            str(me): { 'friends': 2, 'friends_walked': 1, 'edges': 4, 'edges_walked': 1, 'candidates': 1 },
+            str(idle): { 'friends': 0, 'friends_walked': 0, 'edges': 0, 'edges_walked': 0, 'candidates': 0 },
+        }
+
+    def test_friends_of_friends_counts_users_without_candidates(self, users):
+        me, f1, _, _, _, _ = users
+        for follower, following in [(me, f1), (f1, me)]:
+            follower_repository.follow(follower, following)
+        stats = {}
+
+        assert follower_repository.friends_of_friends([me], limit=5, stats=stats) == { str(me): [] }
+        assert stats[str(me)] == { 'friends': 1, 'friends_walked': 1, 'edges': 1, 'edges_walked': 1, 'candidates': 0 }
+
+    def test_changed_following_includes_unfollows(self, users):
+        a, b, c, quiet, _, _ = users
+        follower_repository.follow(a, b)
+        follower_repository.follow(a, c)
+        follower_repository.follow(quiet, b)
+        follower_repository.unfollow(quiet, b)
+
+        rows = [
+            row for chunk in follower_repository.iter_changed_following(datetime(2000, 1, 1))
+            for row in chunk if row['user_id'] in users
+        ]
+        following = {}
+        for row in rows:
+            following.setdefault(row['user_id'], set()).add(row['following_id'])
+
+        assert following[a] == {b, c}
+        assert following[quiet] == {None}
+        assert following[b] == {None}
@@ -0,0 +1,84 @@
+from infrastructure.database.repositories import generic
+from contextlib import contextmanager
+import pytest
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, values=None):
+        self.conn.executed.append(query)
+
+    def fetchall(self):
+        return []
+
+class FakeConnection:
+    def __init__(self, crdb):
+        self.crdb = crdb
+        self.executed = []
+
+    def get_parameter_status(self, name):
+        return '24.1' if self.crdb and name == 'crdb_version' else None
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+class TestStaleReads:
+    @pytest.fixture
+    def pools(self, monkeypatch):
+        pools = {
+            'primary': FakePool(FakeConnection(crdb=True)),
+            'read': FakePool(FakeConnection(crdb=True)),
+        }
+        monkeypatch.setattr(generic, 'get_db_pool', lambda: pools['primary'])
+        monkeypatch.setattr(generic, 'get_db_read_pool', lambda: pools['read'])
+        monkeypatch.setenv('DB_PREPARED_STATEMENTS', 'false')
+        return pools
+
+    def test_fresh_reads_use_primary(self, pools):
+        repository = generic.GenericRepository('followers')
+
+        repository.find_by({'follower_id': 1})
+
+        assert pools['read'].conn.executed == []
+        assert not any('AS OF SYSTEM TIME' in query for query in pools['primary'].conn.executed)
+
+    def test_stale_call_uses_follower_reads(self, pools):
+        repository = generic.GenericRepository('followers')
+
+        repository.find_by({'follower_id': 1}, stale=True)
+
+        assert pools['primary'].conn.executed == []
+        assert pools['read'].conn.executed[0] == "SET TRANSACTION AS OF SYSTEM TIME follower_read_timestamp()"
+
+    def test_repository_default_can_be_overridden_per_call(self, pools):
+        repository = generic.GenericRepository('followers', stale_reads=True)
+
+        repository.find_page({'follower_id': 1}, stale=False)
+        assert pools['read'].conn.executed == []
+
+        repository.find_page({'follower_id': 1})
+        assert len(pools['read'].conn.executed) == 2
+
+    def test_postgres_skips_as_of_system_time(self, pools):
+        pools['read'].conn.crdb = False
+        repository = generic.GenericRepository('followers')
+
+        repository.find_by({'follower_id': 1}, stale=True)
+
+        assert len(pools['read'].conn.executed) == 1
+        assert 'AS OF SYSTEM TIME' not in pools['read'].conn.executed[0]
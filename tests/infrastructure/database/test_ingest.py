@@ -0,0 +1,50 @@
+from infrastructure.database.repositories import follower_repository
+from infrastructure.database.ingest import read_edges, batched, ingest
+import io
+
+class TestIngest:
+    def test_read_csv_with_header_in_any_order(self):
+        lines = io.StringIO("following_id,follower_id\n2,1\n3,1\n")
+
+        assert list(read_edges(lines)) == [('1', '2'), ('1', '3')]
+
+    def test_read_csv_without_header(self):
+        lines = io.StringIO("1,2\n\n1,3\n")
+
+        assert list(read_edges(lines)) == [('1', '2'), ('1', '3')]
+
+    def test_read_ndjson(self):
+        lines = io.StringIO('{"follower_id": 1, "following_id": 2}\n\n{"follower_id": 1, "following_id": 3}\n')
+
+        assert list(read_edges(lines, 'ndjson')) == [(1, 2), (1, 3)]
+
+    def test_batched(self):
+        assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+    def test_ingest_copies_in_batches(self, monkeypatch):
+        batches = []
+
+        def copy_edges(edges, skip_conflicts):
+            batches.append(list(edges))
+            return len(edges), len(edges) - 1
+
+        monkeypatch.setattr(follower_repository, 'copy_edges', copy_edges)
+
+        received, inserted, _ = ingest(iter([(1, 2), (1, 3), (1, 4)]), batch_size=2, report=lambda message: None)
+
+        assert batches == [[(1, 2), (1, 3)], [(1, 4)]]
+        assert (received, inserted) == (3, 1)
+
+    def test_ingest_values_skips_self_follows(self, monkeypatch):
+        inserted_rows = []
+
+        def insert_many(rows, conflict_columns=None):
+            inserted_rows.extend(rows)
+            return len(rows)
+
+        monkeypatch.setattr(follower_repository, 'insert_many', insert_many)
+
+        received, inserted, _ = ingest(iter([('1', '2'), ('3', '3')]), method='values', report=lambda message: None)
+
+        assert inserted_rows == [{'follower_id': 1, 'following_id': 2}]
+        assert (received, inserted) == (2, 1)
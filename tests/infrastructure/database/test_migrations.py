@@ -0,0 +1,86 @@
+from infrastructure.database.migrations.migrations import run_migrations
+from infrastructure.database import get_db_connection
+import uuid
+import pytest
+
+@pytest.fixture
+def conn():
+    try:
+        conn = get_db_connection()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+
+    yield conn
+    conn.rollback()
+    conn.close()
+
+def _plan(conn, query, values):
+    with conn.cursor() as cur:
+        if not conn.get_parameter_status('crdb_version'):
+            # A near-empty test table is cheaper to scan than to probe, make Postgres show the index choice
+            cur.execute("SET enable_seqscan = off")
+        cur.execute(f"EXPLAIN {query}", values)
+        plan = "\n".join(str(list(row.values())[0]) for row in cur.fetchall())
+    conn.rollback()
+    return plan
+
+class TestMigrations:
+    def test_runner_applies_each_script_once(self, conn, tmp_path):
+        suffix = uuid.uuid4().hex[:8]
+        table = f"migrations_test_{suffix}"
+        (tmp_path / "001_first.sql").write_text(f"CREATE TABLE runner_test_{suffix} (id INT);")
+        (tmp_path / "002_second.sql").write_text(f"INSERT INTO runner_test_{suffix} VALUES (1);")
+
+        try:
+            assert run_migrations(conn, str(tmp_path), table) == ['001_first', '002_second']
+            assert run_migrations(conn, str(tmp_path), table) == []
+
+            (tmp_path / "003_third.sql").write_text(f"INSERT INTO runner_test_{suffix} VALUES (2);")
+            assert run_migrations(conn, str(tmp_path), table) == ['003_third']
+
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT count(*) AS total FROM runner_test_{suffix}")
+                assert cur.fetchone()['total'] == 2
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS runner_test_{suffix}")
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+
+    def test_failed_script_is_not_recorded(self, conn, tmp_path):
+        table = f"migrations_test_{uuid.uuid4().hex[:8]}"
+        (tmp_path / "001_broken.sql").write_text("SELECT * FROM table_that_does_not_exist;")
+
+        try:
+            with pytest.raises(Exception):
+                run_migrations(conn, str(tmp_path), table)
+
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT count(*) AS total FROM {table}")
+                assert cur.fetchone()['total'] == 0
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+
+    def test_followers_lookup_uses_reverse_index(self, conn):
+        run_migrations(conn)
+
+        plan = _plan(conn, "SELECT follower_id FROM followers WHERE following_id = %s", (1,))
+        assert 'followers_following_id_idx' in plan
+
+    def test_following_among_uses_unique_index(self, conn):
+        run_migrations(conn)
+
+        plan = _plan(conn, "SELECT following_id FROM followers WHERE follower_id = %s AND following_id = ANY(%s::TEXT[]::BIGINT[])", (1, ['2', '3']))
+        assert 'follower_id_following_id' in plan
+
+    @pytest.mark.parametrize('column', ['follower_id', 'following_id'])
+    def test_keyset_page_uses_pagination_index(self, conn, column):
+        run_migrations(conn)
+
+        plan = _plan(conn, f"SELECT * FROM followers WHERE {column} = %s ORDER BY created_at DESC, id DESC LIMIT 11", (1,))
+        assert f'followers_{column}_created_at_idx' in plan
+        assert 'Sort' not in plan
@@ -0,0 +1,119 @@
+from infrastructure.database.utils.pool import ConnectionPool, PoolTimeoutError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+import threading
+import pytest
+import time
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, values=None):
+        if self.conn.broken:
+            raise Exception("server closed the connection unexpectedly")
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.status = TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+class TestConnectionPool:
+    def make_pool(self, **kwargs):
+        options = {'min_size': 0, 'max_size': 2, 'reap_interval': 0, **kwargs}
+        return ConnectionPool(FakeConnection, **options)
+
+    def test_reuses_released_connections(self):
+        pool = self.make_pool()
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert pool.stats()['created'] == 1
+
+    def test_blocks_then_times_out_at_max_size(self):
+        pool = self.make_pool(max_size=1)
+        pool.acquire()
+
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire(timeout=0.05)
+
+        assert pool.stats()['timeouts'] == 1
+
+    def test_waiter_gets_connection_when_released(self):
+        pool = self.make_pool(max_size=1)
+        conn = pool.acquire()
+        threading.Timer(0.05, pool.release, args=(conn,)).start()
+
+        assert pool.acquire(timeout=1) is conn
+
+    def test_open_transactions_are_rolled_back_on_release(self):
+        pool = self.make_pool()
+
+        with pool.connection() as conn:
+            conn.status = TRANSACTION_STATUS_INTRANS
+
+        assert conn.rollbacks == 1
+
+    def test_unhealthy_idle_connection_is_replaced(self):
+        pool = self.make_pool(health_check_after=0.01)
+
+        with pool.connection() as conn:
+            conn.broken = True
+        time.sleep(0.02)
+
+        with pool.connection() as replacement:
+            assert replacement is not conn
+
+        assert conn.closed
+        assert pool.stats()['failed_health_checks'] == 1
+
+    def test_connections_past_max_lifetime_are_discarded(self):
+        pool = self.make_pool(max_lifetime=0.01)
+
+        with pool.connection() as conn:
+            time.sleep(0.02)
+
+        assert conn.closed
+        assert pool.stats()['idle'] == 0
+
+    def test_reap_closes_idle_connections_above_min_size(self):
+        pool = self.make_pool(min_size=1, max_idle=0.01)
+        extra = pool.acquire()
+        pool.release(extra)
+        time.sleep(0.02)
+
+        assert pool.reap() == 0
+        assert pool.stats()['size'] == 1
+
+        second = pool.acquire()
+        third = pool.acquire()
+        pool.release(second)
+        pool.release(third)
+        time.sleep(0.02)
+
+        assert pool.reap() == 1
+        assert pool.stats()['size'] == 1
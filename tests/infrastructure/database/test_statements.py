@@ -0,0 +1,117 @@
+from infrastructure.database.utils.statements import Statement, validate_identifier, execute
+from infrastructure.database.repositories.generic import GenericRepository
+from psycopg2 import errors, extensions
+import pytest
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, values=None):
+        self.executed.append((query, values))
+
+class FakeConnection:
+    def __init__(self, status=extensions.TRANSACTION_STATUS_IDLE):
+        self.status = status
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+
+class ResetSessionCursor(FakeCursor):
+    # Fails the first EXECUTE as if the session had lost its prepared statements
+    def execute(self, query, values=None):
+        super().execute(query, values)
+        if query.startswith('EXECUTE') and sum(q.startswith('EXECUTE') for q, _ in self.executed) == 1:
+            raise errors.InvalidSqlStatementName()
+
+class TestStatements:
+    def test_statement_numbers_placeholders(self):
+        statement = Statement("SELECT * FROM followers WHERE follower_id = %s LIMIT %s")
+
+        assert statement.prepared_sql == "SELECT * FROM followers WHERE follower_id = $1 LIMIT $2"
+        assert statement.execute_sql == f"EXECUTE {statement.name} (%s, %s)"
+
+    def test_same_sql_same_name(self):
+        assert Statement("SELECT 1").name == Statement("SELECT 1").name
+        assert Statement("SELECT 1").name != Statement("SELECT 2").name
+
+    def test_prepares_once_per_connection(self, monkeypatch):
+        monkeypatch.setenv('DB_PREPARED_STATEMENTS', 'true')
+        statement = Statement("SELECT * FROM followers WHERE id = %s")
+        conn, other = FakeConnection(), FakeConnection()
+        cur = FakeCursor()
+
+        execute(conn, cur, statement, [1])
+        execute(conn, cur, statement, [2])
+        execute(other, cur, statement, [3])
+
+        prepares = [query for query, _ in cur.executed if query.startswith('PREPARE')]
+        assert len(prepares) == 2
+        assert cur.executed[-1] == (statement.execute_sql, (3,))
+
+    def test_disabled_runs_plain_sql(self, monkeypatch):
+        monkeypatch.setenv('DB_PREPARED_STATEMENTS', 'false')
+        statement = Statement("SELECT * FROM followers WHERE id = %s")
+        cur = FakeCursor()
+
+        execute(FakeConnection(), cur, statement, [1])
+
+        assert cur.executed == [(statement.sql, (1,))]
+
+    def test_reset_session_is_retried_at_start_of_transaction(self, monkeypatch):
+        monkeypatch.setenv('DB_PREPARED_STATEMENTS', 'true')
+        statement = Statement("SELECT * FROM followers WHERE id = %s")
+        conn, cur = FakeConnection(), ResetSessionCursor()
+
+        execute(conn, cur, statement, [1])
+
+        assert conn.rollbacks == 1
+        assert [query for query, _ in cur.executed].count(f"PREPARE {statement.name} AS {statement.prepared_sql}") == 2
+        assert cur.executed[-1] == (statement.execute_sql, (1,))
+
+    def test_reset_session_mid_transaction_is_raised(self, monkeypatch):
+        monkeypatch.setenv('DB_PREPARED_STATEMENTS', 'true')
+        statement = Statement("SELECT * FROM followers WHERE id = %s")
+        conn = FakeConnection(extensions.TRANSACTION_STATUS_INTRANS)
+        cur = ResetSessionCursor()
+
+        with pytest.raises(errors.InvalidSqlStatementName):
+            execute(conn, cur, statement, [1])
+        assert conn.rollbacks == 0
+
+        # The next attempt prepares again instead of trusting the lost session state
+        execute(conn, cur, statement, [1])
+        assert cur.executed[-2][0].startswith('PREPARE')
+
+    @pytest.mark.parametrize('name', ['id; DROP TABLE followers', 'Id', '1id', '', None])
+    def test_rejects_invalid_identifiers(self, name):
+        with pytest.raises(ValueError):
+            validate_identifier(name)
+
+    def test_rejects_unknown_columns(self):
+        with pytest.raises(ValueError, match="Unknown column"):
+            validate_identifier('password', {'id', 'follower_id'})
+
+    def test_statements_are_cached_by_shape(self):
+        repository = GenericRepository('followers', ('id', 'follower_id', 'following_id'))
+        built = []
+
+        def build():
+            built.append(True)
+            return "SELECT 1"
+
+        first = repository._statement(('find_by', ('follower_id',)), build)
+        second = repository._statement(('find_by', ('follower_id',)), build)
+
+        assert first is second
+        assert len(built) == 1
+
+    def test_unknown_condition_column_never_reaches_sql(self):
+        repository = GenericRepository('followers', ('id', 'follower_id', 'following_id'))
+
+        with pytest.raises(ValueError, match="Invalid identifier"):
+            repository.find_by({'follower_id = 1 OR 1': 1})
@@ -0,0 +1,185 @@
+from infrastructure.graph import FollowGraph
+from collections import defaultdict, Counter
+import numpy as np
+import random
+import pytest
+
+def brute_force(adjacency, user_id, k):
+    scores = Counter()
+    for friend in adjacency[user_id]:
+        for candidate in adjacency[friend]:
+            if candidate != user_id and candidate not in adjacency[user_id]:
+                scores[candidate] += 1
+    return [(str(candidate), score) for candidate, score in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]]
+
+class TestFollowGraph:
+    @pytest.fixture
+    def edges(self):
+        generator = random.Random(7)
+        return [(generator.randint(1, 300) * 10 ** 12, generator.randint(1, 300) * 10 ** 12) for _ in range(6000)]
+
+    @staticmethod
+    def adjacency(edges):
+        adjacency = defaultdict(set)
+        for follower_id, following_id in edges:
+            adjacency[follower_id].add(following_id)
+        return adjacency
+
+    def test_recommend_matches_brute_force(self, edges):
+        graph = FollowGraph.from_edges(*zip(*edges))
+        adjacency = self.adjacency(edges)
+        users = sorted(adjacency)[:50]
+
+        result = graph.recommend(users, 5)
+
+        for user_id in users:
+            assert result[str(user_id)] == brute_force(adjacency, user_id, 5)
+
+    def test_incremental_updates(self, edges):
+        graph = FollowGraph.from_edges(*zip(*edges))
+        adjacency = self.adjacency(edges)
+
+        for follower_id, following_id in edges[:100]:
+            graph.remove_edge(follower_id, following_id)
+            adjacency[follower_id].discard(following_id)
+        graph.add_edge(1, 2)
+        graph.add_edge(2, 3)
+        adjacency[1].add(2)
+        adjacency[2].add(3)
+        assert graph.pending == len(set(edges[:100])) + 2
+
+        users = [1] + sorted(adjacency)[:20]
+        result = graph.recommend(users, 5)
+
+        # Served from the overlay: nothing was folded in
+        assert graph.pending == len(set(edges[:100])) + 2
+        assert result['1'] == [('3', 1)]
+        for user_id in users:
+            assert result[str(user_id)] == brute_force(adjacency, user_id, 5)
+
+        graph.compact()
+        assert graph.pending == 0
+        assert graph.recommend(users, 5) == result
+        assert sorted(graph.following(2)) == sorted(adjacency[2])
+
+        expected = FollowGraph.from_edges(*zip(*[(a, b) for a in adjacency for b in adjacency[a]]))
+        assert graph.edge_count == expected.edge_count
+        assert graph.recommend(users, 5) == expected.recommend(users, 5)
+
+    def test_known_edges_are_not_pending(self, edges):
+        graph = FollowGraph.from_edges(*zip(*edges))
+
+        for follower_id, following_id in edges[:100]:
+            graph.add_edge(follower_id, following_id)
+        graph.remove_edge(1, 2)
+        assert graph.pending == 0
+
+        graph.remove_edge(*edges[0])
+        graph.add_edge(*edges[0])
+        assert graph.pending == 0
+
+    def test_deltas_are_compacted_past_the_threshold(self, edges, monkeypatch):
+        monkeypatch.setenv('GRAPH_COMPACT_THRESHOLD', '3')
+        graph = FollowGraph.from_edges(*zip(*edges))
+
+        graph.add_edge(1, 2)
+        graph.add_edge(2, 3)
+        graph.recommend([1], 5)
+        assert graph.pending == 2
+
+        graph.add_edge(3, 4)
+        assert graph.recommend([1], 5) == { '1': [('3', 1)] }
+        assert graph.pending == 0
+
+    def test_sync_following_applies_unfollows(self):
+        graph = FollowGraph.from_edges([1, 1, 2], [2, 3, 4])
+
+        graph.sync_following({ 1: [3, 5], 2: [] })
+
+        assert graph.pending == 3
+        assert sorted(graph.following(1)) == [3, 5]
+        assert list(graph.following(2)) == []
+
+    def test_unknown_and_duplicate_users(self):
+        graph = FollowGraph.from_edges([1, 2], [2, 3])
+
+        assert graph.recommend([1, 1, 42], 5) == {'1': [('3', 1)], '42': []}
+
+    def test_empty_graph(self):
+        graph = FollowGraph.from_edges([], [])
+
+        assert graph.recommend([1], 5) == {'1': []}
+        assert list(graph.following(1)) == []
+
+    def test_snapshot_round_trip_is_memory_mapped(self, edges, tmp_path):
+        graph = FollowGraph.from_edges(*zip(*edges), synced_at='2025-01-01T00:00:00')
+        graph.save(str(tmp_path))
+        graph.save(str(tmp_path))
+        graph.save(str(tmp_path))
+
+        loaded = FollowGraph.load(str(tmp_path))
+
+        assert isinstance(loaded.indices, np.memmap)
+        assert loaded.synced_at == '2025-01-01T00:00:00'
+        assert loaded.edge_count == graph.edge_count
+        assert len([path for path in tmp_path.iterdir() if path.is_dir()]) == 2
+
+        users = [follower_id for follower_id, _ in edges[:20]]
+        assert loaded.recommend(users, 5) == graph.recommend(users, 5)
+
+    def test_work_counters(self):
+        graph = FollowGraph.from_edges([1, 1, 2, 2, 3], [2, 3, 4, 5, 4])
+        stats = {}
+
+        result = graph.recommend([1, 9], 5, stats=stats)
+
+        assert result['1'] == [('4', 2), ('5', 1)]
+        assert stats['1'] == { 'friends': 2, 'friends_walked': 2, 'edges': 3, 'edges_walked': 3, 'candidates': 2 }
+        assert stats['9']['edges_walked'] == 0
+
+    def test_fanout_cap_bounds_work(self):
+        # 1 follows a celebrity-like account that follows 1000 others
+        followers = [1] + [2] * 1000
+        following = [2] + list(range(100, 1100))
+        graph = FollowGraph.from_edges(followers, following)
+        stats = {}
+
+        result = graph.recommend([1], 5, max_fanout=50, stats=stats)
+
+        assert stats['1']['edges'] == 1000
+        assert stats['1']['edges_walked'] == 50
+        # Walked paths count once, as in the SQL engine: not scaled up by degree / cap
+        assert len(result['1']) == 5
+        assert all(score == 1 for _, score in result['1'])
+
+    def test_capped_recall_against_exact_counts(self):
+        # Heavy-tailed graph: recall@k of the capped walk, counting a candidate as a hit when its exact
+        # score reaches the exact k-th score (ties at the cut are interchangeable)
+        rng = np.random.default_rng(3)
+        followers = (rng.pareto(1.1, 100000) * 5).astype(np.int64) % 3000
+        following = (rng.pareto(1.2, 100000) * 10).astype(np.int64) % 3000
+        graph = FollowGraph.from_edges(followers, following)
+        users = [str(user_id) for user_id in rng.choice(np.unique(followers), 100, replace=False)]
+        k = 10
+
+        exact = graph.recommend(users, 10 ** 6)
+        capped = graph.recommend(users, k, max_friends=50, max_fanout=50)
+
+        hits = total = 0
+        for user_id in users:
+            scores = dict(exact[user_id])
+            if not exact[user_id]:
+                continue
+            cut = exact[user_id][min(k, len(exact[user_id])) - 1][1]
+            hits += sum(scores[candidate] >= cut for candidate, _ in capped[user_id])
+            total += min(k, len(exact[user_id]))
+            # Same scale as the exact counts: a capped walk can only find fewer paths
+            assert all(score <= scores[candidate] for candidate, score in capped[user_id])
+
+        assert hits / total >= 0.8
+
+    def test_wide_sketch_matches_exact_counts(self, edges):
+        graph = FollowGraph.from_edges(*zip(*edges))
+        users = sorted({follower_id for follower_id, _ in edges})[:30]
+
+        assert graph.recommend(users, 5, sketch_width=2 ** 16) == graph.recommend(users, 5)
@@ -0,0 +1,28 @@
+from infrastructure.graph import FollowGraph, loader
+from datetime import datetime
+
+class TestCatchUp:
+    def test_applies_follows_and_unfollows_since_last_sync(self, monkeypatch):
+        graph = FollowGraph.from_edges([1, 1, 2], [2, 3, 3], synced_at='2025-01-01T00:00:00')
+        changed_at = datetime(2025, 1, 1, 0, 0, 5)
+        reads = []
+
+        def iter_changed_following(since):
+            reads.append(since)
+            yield [
+                { 'user_id': 1, 'following_id': 2, 'updated_at': changed_at },
+                { 'user_id': 1, 'following_id': 4, 'updated_at': changed_at },
+                { 'user_id': 2, 'following_id': None, 'updated_at': changed_at },
+            ]
+
+        monkeypatch.setattr(loader.follower_repository, 'iter_changed_following', iter_changed_following)
+        loader.catch_up(graph)
+
+        assert reads == [datetime(2024, 12, 31, 23, 59, 30)]
+        assert sorted(graph.following(1)) == [2, 4]
+        assert list(graph.following(2)) == []
+        assert graph.synced_at == changed_at.isoformat()
+
+        # Re-reading the same window changes nothing
+        loader.catch_up(graph)
+        assert graph.pending == 3
@@ -0,0 +1,47 @@
+from infrastructure.graph import FollowGraph, parallel
+import pytest
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    graph = FollowGraph.from_edges([1, 1, 2, 2, 3, 4, 4], [2, 3, 4, 5, 4, 1, 5])
+    graph.save(str(tmp_path))
+
+    # Spawned workers inherit the environment and start from the snapshot without a database
+    monkeypatch.setenv('GRAPH_SNAPSHOT_PATH', str(tmp_path))
+    monkeypatch.setenv('GRAPH_REFRESH_SECONDS', '3600')
+    monkeypatch.setattr(parallel, '_executor', None)
+    monkeypatch.setattr(parallel, '_executor_key', None)
+    return graph
+
+class TestGraphExecutor:
+    def test_shards_run_in_worker_processes(self, snapshot):
+        executor = parallel.get_graph_executor(2)
+        try:
+            futures = [executor.submit(parallel.recommend_shard, shard, 5, {}) for shard in (['1', '2'], ['3', '4'])]
+            results = [future.result(timeout=60) for future in futures]
+        finally:
+            executor.shutdown()
+
+        merged = {}
+        for result, stats in results:
+            merged.update(result)
+            assert set(stats) == set(result)
+
+        assert merged == snapshot.recommend(['1', '2', '3', '4'], 5)
+
+    def test_executor_is_reused(self, snapshot):
+        executor = parallel.get_graph_executor(2)
+        try:
+            assert parallel.get_graph_executor(2) is executor
+        finally:
+            executor.shutdown()
+
+    def test_discarded_executor_is_replaced(self, snapshot):
+        executor = parallel.get_graph_executor(2)
+        parallel.discard_graph_executor(executor)
+
+        replacement = parallel.get_graph_executor(2)
+        try:
+            assert replacement is not executor
+        finally:
+            replacement.shutdown()